@@ -1,5 +1,6 @@
-from .a import AF, AFOptional, Market
+from .a import AF, AFOptional, Market, Transport, Overflow
 from .log import logger
 from .a import Mode as AFMode
 from .base import FuturesStrategy, StockStrategy, Strategy
-from .types import StrategyType
+from .types import StrategyType, BarType
+from .runner import BacktestRunner, BacktestReport
@@ -1,16 +1,25 @@
+import copy
+import time
+import signal
 import os.path
-
-import pandas as pd
+import threading
 
 from A.log import logger
+from A.data import ActivityBars, BarStore, BarRollup, calendar_of
+from A.indicator.graph import IndicatorGraph
+from A.router import Router, shard_of
+from A.latency import LatencyRecorder
 from A.base.strategy.base import Strategy
 from A.adapter import ctp_start, xtp_start
 from A.adapter.backtest import stock_start
-from A.types import EventType, Event, StrategyType
+from A.transport import BatchQueue, ShmRing, DirectSink, MarketSubscriber, Overflow, OverflowWriter, DONE, \
+    market_topic, symbol_topic
+from A.types import EventType, Event, KLine, StrategyType
 
 from enum import Enum
 from datetime import datetime
-from typing import Optional
+from queue import Empty
+from typing import Optional, Union
 from multiprocessing import Queue, Process
 
 
@@ -24,6 +33,22 @@ class Market(Enum):
     FUTURE = 2
 
 
+# the strategy type of the market data of each market
+MARKET_STRATEGY_TYPE: dict[Market, StrategyType] = {
+    Market.STOCK: StrategyType.STOCK,
+    Market.FUTURE: StrategyType.FUTURES,
+}
+
+
+class Transport(Enum):
+    # pickled events through `multiprocessing.Queue`
+    QUEUE = 1
+    # fixed-layout binary records through a shared memory ring buffer
+    SHM_RING = 2
+    # subscribe an adapter running as a ZeroMQ publisher, see `A.adapter.publish`
+    ZMQ = 3
+
+
 class AFOptional:
     # the AF running mode.
     run_mode: Mode = None
@@ -33,6 +58,30 @@ class AFOptional:
     config_path: str = None
     # the AF work done time
     end_time: int = 0
+    # the max number of events the backtest adapter puts onto the queue at once
+    batch_size: int = 512
+    # the max seconds a backtest event waits in the adapter for its batch to fill
+    batch_linger: float = 0.005
+    # the adapter -> engine event transport
+    transport: Transport = Transport.QUEUE
+    # the number of slots of the shared memory ring, a power of two
+    ring_capacity: int = 65536
+    # what the adapter gives up when the engine falls behind, bars and order books are never dropped
+    overflow: Overflow = Overflow.BLOCK
+    # the max number of events pending in the adapter before the overflow policy applies
+    overflow_capacity: int = 4096
+    # the publisher endpoints to connect with `Transport.ZMQ`, e.g. `tcp://10.0.0.2:5555`
+    zmq_endpoints: list[str] = None
+    # the number of strategy worker processes, 0 runs the strategies in the engine process
+    workers: int = 0
+    # run the backtest adapter on the engine thread, without adapter process and event queue
+    backtest_in_process: bool = False
+    # the max number of bars kept per (symbol, interval) by `AF.bar_data`
+    bar_capacity: int = 4096
+    # record the latency histograms of the events and the strategy callbacks
+    latency: bool = False
+    # write the latency summaries as json to the path at shutdown
+    latency_path: str = None
 
 
 class AF:
@@ -64,16 +113,63 @@ class AF:
         if not os.path.exists(self._optional.config_path):
             raise FileNotFoundError(f"config path {self._optional.config_path} not exists.")
 
-        self._event_queue = Queue(65535)
+        # the event queue of the adapter process, created with the transport
+        self._event_queue: Optional[Queue] = None
+        self._ring: Optional[ShmRing] = None
+        self._subscriber: Optional[MarketSubscriber] = None
+        self._overflow: Optional[OverflowWriter] = None
         self._strategies: list[Strategy] = list()
-        # self._cache_history:
-
-        self._bar_data: Optional[pd.DataFrame] = None
+        self._latency: Optional[LatencyRecorder] = LatencyRecorder() if self._optional.latency else None
+        self._router: Router = self._make_router()
+        # the strategies, event queues and processes of the workers
+        self._worker_strategies: list[list[Strategy]] = list()
+        self._worker_queues: list[Queue] = list()
+        self._worker_processes: list[Process] = list()
+        # (market, symbol code) -> the workers receiving the symbol
+        self._worker_targets: dict[tuple[StrategyType, str], tuple[int, ...]] = dict()
+        self._bar_data: BarStore = BarStore(self._optional.bar_capacity)
+        # rolls the adapter bars up into the higher `Strategy.bar_intervals`, None if no strategy needs it
+        self._rollup: Optional[BarRollup] = None
+        # builds the `Strategy.activity_bars` from the snapshots, None if no strategy needs it
+        self._activity: Optional[ActivityBars] = None
+        # the `Strategy.indicators`, updated by the bars before the strategies receive them
+        self._indicators: IndicatorGraph = IndicatorGraph()
 
     @property
-    def bar_data(self) -> pd.DataFrame:
+    def bar_data(self) -> BarStore:
+        """ the recent bars received, per symbol and interval """
         return self._bar_data
 
+    @property
+    def indicators(self) -> IndicatorGraph:
+        """ the indicators of the strategies, per symbol and interval """
+        return self._indicators
+
+    def _make_router(
+            self,
+            shard: Optional[tuple[int, int]] = None
+    ) -> Router:
+        return Router(shard=shard, wrap=None if self._latency is None else self._latency.wrap)
+
+    def dump_latency(
+            self,
+            path: Optional[str] = None
+    ) -> str:
+        """
+        dump the latency histograms, also triggered by SIGUSR1 while running
+
+        Args:
+            path: write the summaries as json to path if given
+
+        Returns:
+            str: the report table, empty if `AFOptional.latency` is off
+        """
+        if self._latency is None:
+            return ""
+        report = self._latency.dump(path)
+        logger.info(f"latency:\n{report}")
+        return report
+
     def add_strategy(
             self,
             strategy: Strategy
@@ -89,10 +185,24 @@ class AF:
 
         Raises:
             TypeError: unknown strategy type
+            ValueError: a bar interval of the strategy is not a multiple of 60 seconds, an activity
+                bar of the strategy is not valid, or an indicator of the strategy is of bars it does
+                not receive
         """
         if isinstance(strategy, Strategy):
+            intervals = {i for s in self._strategies + [strategy] for i in s.bar_intervals}
+            if intervals - {60}:
+                self._rollup = BarRollup(intervals)
+            specs = {spec for s in self._strategies + [strategy] for spec in s.activity_bars}
+            if specs:
+                self._activity = ActivityBars(specs)
+            for node in strategy.indicators:
+                if node.interval not in (*strategy.bar_intervals, *strategy.activity_bars):
+                    raise ValueError(f"indicator {node} of bars the strategy does not receive.")
+                self._indicators.add(node, strategy.sub_symbol_code)
             strategy.af = self
             self._strategies.append(strategy)
+            self._router.add(strategy)
         else:
             raise TypeError(f"not support strategy type of [{type(strategy)}].")
 
@@ -109,10 +219,8 @@ class AF:
         Returns:
             None
         """
-        for s in self._strategies:
-            if s.type() == event.ex_type:
-                ob = event.data
-                s.on_order_book(ob)
+        for callback in self._router.route(event):
+            callback(event.data)
 
     def _on_bar(
             self,
@@ -127,14 +235,45 @@ class AF:
         Returns:
             None
         """
-        for s in self._strategies:
-            if s.type() == event.ex_type:
-                bar = event.data
-                # if self._bar_data is None:
-                #     self._bar_data = pd.DataFrame([bar])
-                # else:
-                #     self._bar_data = self._bar_data.append(bar.__dict__, ignore_index=True, sort=False)
-                s.on_bar(bar)
+        self._dispatch_bar(event)
+        if self._rollup is not None:
+            base = event.data
+            for bar in self._rollup.update(base, calendar_of(event.ex_type, base.symbol_code)):
+                self._dispatch_bar(self._bar_event(event, bar))
+
+    @staticmethod
+    def _bar_event(
+            event: Event,
+            bar: KLine
+    ) -> Event:
+        """ the event of a bar the engine built from the data of event, rolled up or an activity bar """
+        built = Event()
+        built.data = bar
+        built.event_type = EventType.KLINE_DATA
+        built.ex_type = event.ex_type
+        built.ingress_ns = event.ingress_ns
+        return built
+
+    def _dispatch_bar(
+            self,
+            event: Event
+    ) -> None:
+        self._bar_data.append(event.data)
+        if self._indicators:
+            self._indicators.update(event.data)
+        for callback in self._router.route(event):
+            callback(event.data)
+
+    def _flush_bars(self) -> None:
+        """ close the bars pending in the rollup and the activity bars at the end of the data """
+        event = Event()
+        event.ex_type = MARKET_STRATEGY_TYPE[self._optional.market]
+        if self._rollup is not None:
+            for bar in self._rollup.flush():
+                self._dispatch_bar(self._bar_event(event, bar))
+        if self._activity is not None:
+            for bar in self._activity.flush():
+                self._dispatch_bar(self._bar_event(event, bar))
 
     def _on_snapshot(
             self,
@@ -149,9 +288,11 @@ class AF:
         Returns:
             None
         """
-        for s in self._strategies:
-            if s.type() == event.ex_type:
-                s.on_snapshot(event.data)
+        for callback in self._router.route(event):
+            callback(event.data)
+        if self._activity is not None:
+            for bar in self._activity.update_snapshot(event.ex_type, event.data):
+                self._dispatch_bar(self._bar_event(event, bar))
 
     def _get_symbol_codes(
             self,
@@ -194,6 +335,182 @@ class AF:
         elif event.event_type == EventType.ORDERBOOK_DATA:
             self._on_order_book(event)
 
+    def _on_batch(
+            self,
+            batch: list[Event]
+    ) -> None:
+        """
+        dispatch a batch of events drained from the event queue
+
+        Args:
+            batch: the events in adapter order
+
+        Returns:
+            None
+        """
+        if self._worker_queues:
+            self._dispatch_to_workers(batch)
+            return
+
+        if self._latency is not None:
+            dequeue_ns = time.monotonic_ns()
+            for event in batch:
+                if event:
+                    self._latency.on_dequeue(event, dequeue_ns)
+                    self._on_event(event)
+            return
+
+        for event in batch:
+            if event:
+                self._on_event(event)
+
+    def _start_workers(self) -> None:
+        """
+        assign the strategies to `AFOptional.workers` worker processes and start them.
+
+        A strategy with `shard_by_symbol` is copied into every worker, each copy receives
+        the symbols of its worker, the others run in one worker each, in turn.
+        """
+        workers = self._optional.workers
+        self._worker_strategies = [list() for _ in range(workers)]
+        pinned = 0
+        for s in self._strategies:
+            if s.shard_by_symbol:
+                for strategies in self._worker_strategies:
+                    strategies.append(s)
+            else:
+                self._worker_strategies[pinned % workers].append(s)
+                pinned += 1
+
+        optional = copy.copy(self._optional)
+        optional.workers = 0
+        # the worker builds its own AF, do not send this one along
+        for s in self._strategies:
+            s.af = None
+        for i, strategies in enumerate(self._worker_strategies):
+            queue = Queue(65535)
+            process = Process(target=_run_worker, args=(optional, strategies, queue, (i, workers)))
+            process.start()
+            self._worker_queues.append(queue)
+            self._worker_processes.append(process)
+        for s in self._strategies:
+            s.af = self
+
+        logger.info(f"{workers} strategy workers started.")
+
+    def _stop_workers(self) -> None:
+        for queue in self._worker_queues:
+            queue.put([DONE])
+        for process in self._worker_processes:
+            process.join()
+        self._worker_queues.clear()
+        self._worker_processes.clear()
+
+    def _get_worker_targets(
+            self,
+            event: Event
+    ) -> tuple[int, ...]:
+        """ the workers having a strategy interested in the event """
+        symbol_code = event.data.symbol_code
+        workers = len(self._worker_strategies)
+        targets = []
+        for i, strategies in enumerate(self._worker_strategies):
+            for s in strategies:
+                if s.type() != event.ex_type:
+                    continue
+                if s.sub_symbol_code and symbol_code not in s.sub_symbol_code:
+                    continue
+                if not s.shard_by_symbol or shard_of(symbol_code, workers) == i:
+                    targets.append(i)
+                    break
+
+        self._worker_targets[(event.ex_type, symbol_code)] = targets = tuple(targets)
+        return targets
+
+    def _dispatch_to_workers(
+            self,
+            batch: list[Event]
+    ) -> None:
+        """
+        forward a batch of events to the workers, the events of a symbol always go
+        to the same workers in adapter order, so per symbol ordering is preserved.
+
+        Args:
+            batch: the events in adapter order
+
+        Returns:
+            None
+        """
+        pending = [list() for _ in self._worker_queues]
+        for event in batch:
+            if not event:
+                continue
+            targets = self._worker_targets.get((event.ex_type, event.data.symbol_code))
+            if targets is None:
+                targets = self._get_worker_targets(event)
+            for i in targets:
+                pending[i].append(event)
+
+        for queue, events in zip(self._worker_queues, pending):
+            if events:
+                queue.put(events)
+
+    def _open_transport(
+            self,
+            batch_size: int,
+            linger: float
+    ) -> tuple[Union[BatchQueue, ShmRing, OverflowWriter, None], Union[Queue, ShmRing, MarketSubscriber]]:
+        """
+        create the adapter -> engine transport selected by `AFOptional.transport`, the writer
+        is wrapped by an `OverflowWriter` unless `AFOptional.overflow` is `Overflow.BLOCK`
+
+        Args:
+            batch_size: the max number of events the adapter puts at once
+            linger: the max seconds an event waits in the adapter for its batch to fill
+
+        Returns:
+            tuple: the writer passed to the adapter process and the reader of the engine,
+                `reader.get` returns a list of events. The writer is None if the events come
+                from a publisher and no adapter process is needed.
+        """
+        if self._optional.transport == Transport.ZMQ:
+            ex_type = MARKET_STRATEGY_TYPE[self._optional.market]
+            strategies = [s for s in self._strategies if s.type() == ex_type]
+            if any(not s.sub_symbol_code for s in strategies):
+                topics = [market_topic(ex_type)]
+            else:
+                topics = [symbol_topic(ex_type, code) for s in strategies for code in s.sub_symbol_code]
+            self._subscriber = MarketSubscriber(self._optional.zmq_endpoints, topics)
+            return None, self._subscriber
+
+        if self._optional.transport == Transport.SHM_RING:
+            self._ring = ShmRing(self._optional.ring_capacity)
+            writer, reader = self._ring, self._ring
+        else:
+            self._event_queue = Queue(65535)
+            writer, reader = BatchQueue(self._event_queue, batch_size=batch_size, linger=linger), self._event_queue
+
+        if self._optional.overflow != Overflow.BLOCK:
+            self._overflow = writer = OverflowWriter(writer, self._optional.overflow, self._optional.overflow_capacity)
+        return writer, reader
+
+    @property
+    def overflow_counters(self) -> dict[str, int]:
+        """ the number of snapshots conflated and dropped by the adapter, updated while running """
+        if self._overflow is None:
+            return dict(conflated=0, dropped=0)
+        return dict(conflated=self._overflow.conflated, dropped=self._overflow.dropped)
+
+    def _close_transport(self) -> None:
+        if self._overflow is not None:
+            logger.info(f"adapter overflow {self._optional.overflow.name}: {self.overflow_counters}")
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+        if self._subscriber is not None:
+            self._subscriber.close()
+            self._subscriber = None
+
     def _start_with_online(self) -> None:
         start_func = None
         if self._optional.market == Market.STOCK:
@@ -201,60 +518,141 @@ class AF:
         elif self._optional.market == Market.FUTURE:
             start_func = ctp_start
 
-        process = Process(target=start_func,
-                          args=(self._optional.config_path,
-                                self._event_queue,
-                                self._get_symbol_codes(StrategyType.FUTURES))
-                          )
-        process.start()
+        writer, reader = self._open_transport(batch_size=1, linger=.0)
+        process = None
+        if writer is not None:
+            process = Process(target=start_func,
+                              args=(self._optional.config_path,
+                                    writer,
+                                    self._get_symbol_codes(MARKET_STRATEGY_TYPE[self._optional.market]))
+                              )
+            process.start()
 
         while int(datetime.now().strftime('%H%M%S')) < self._optional.end_time:
-            event: Event = self._event_queue.get()
-            if not event:
+            try:
+                batch: list[Event] = reader.get(timeout=1)
+            except Empty:
                 continue
-            self._on_event(event)
+            self._on_batch(batch)
 
-        if self._optional.market == Market.STOCK:
-            process.terminate()
-        else:
-            process.join()
+        if process is not None:
+            if self._optional.market == Market.STOCK:
+                process.terminate()
+            else:
+                process.join()
+        self._close_transport()
 
     def _start_with_backtesting(self) -> None:
         start_func = None
         if self._optional.market == Market.STOCK:
             start_func = stock_start
 
-        # start_func(self._optional.config_path,
-        #            self._event_queue,
-        #            self._get_symbol_codes(StrategyType.STOCK))
-        process = Process(target=start_func,
-                          args=(
-                              self._optional.config_path,
-                              self._event_queue,
-                              self._get_symbol_codes(StrategyType.STOCK))
-                          )
-        process.start()
-
-        # while int(datetime.now().strftime('%H%M%S')) < self._optional.end_time:
+        if self._optional.backtest_in_process:
+            if self._worker_queues or self._latency is not None:
+                sink = DirectSink(lambda event: self._on_batch([event]))
+            else:
+                sink = DirectSink(self._on_event)
+            start_func(self._optional.config_path,
+                       sink,
+                       self._get_symbol_codes(StrategyType.STOCK))
+            self._flush_bars()
+            return
+
+        writer, reader = self._open_transport(batch_size=self._optional.batch_size,
+                                              linger=self._optional.batch_linger)
+        process = None
+        if writer is not None:
+            process = Process(target=start_func,
+                              args=(
+                                  self._optional.config_path,
+                                  writer,
+                                  self._get_symbol_codes(StrategyType.STOCK))
+                              )
+            process.start()
+
         while True:
-            if self._event_queue.empty():
-                continue
-            event = self._event_queue.get()
-            if event == "Done":
-                print("DDDD")
+            # blocks until the adapter flushes the next batch
+            batch: list = reader.get()
+            # the DONE marker always closes the last batch
+            if batch[-1] == DONE:
+                self._on_batch(batch[:-1])
                 break
-            if not event:
-                continue
-            self._on_event(event)
+            self._on_batch(batch)
+        self._flush_bars()
 
-        process.join()
+        if process is not None:
+            process.join()
+        self._close_transport()
 
     def start(self) -> None:
         logger.info("AFramework start work")
 
+        if self._optional.workers > 0:
+            self._start_workers()
+
+        if self._latency is not None and hasattr(signal, "SIGUSR1") \
+                and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda *_: self.dump_latency())
+
         if self._optional.run_mode == Mode.ONLINE:
             self._start_with_online()
         elif self._optional.run_mode == Mode.BACKTESTING:
             self._start_with_backtesting()
 
+        if self._worker_queues:
+            self._stop_workers()
+
+        self.dump_latency(self._optional.latency_path)
+
         logger.info("Framework work done.")
+
+
+class _WorkerAF(AF):
+    """ the engine of a strategy worker, routes the symbols of its shard to the strategies with `shard_by_symbol` """
+
+    def __init__(
+            self,
+            optional: AFOptional,
+            shard: tuple[int, int]
+    ) -> None:
+        self._shard: tuple[int, int] = shard
+        super().__init__(optional)
+
+    def _make_router(
+            self,
+            shard: Optional[tuple[int, int]] = None
+    ) -> Router:
+        return super()._make_router(self._shard)
+
+
+def _run_worker(
+        optional: AFOptional,
+        strategies: list[Strategy],
+        queue: Queue,
+        shard: tuple[int, int]
+) -> None:
+    """
+    the strategy worker process, dispatches the events forwarded by the engine
+
+    Args:
+        optional: the engine optional, with no workers
+        strategies: the strategies of the worker
+        queue: the event queue of the worker
+        shard: (worker index, the number of workers)
+
+    Returns:
+        None
+    """
+    af = _WorkerAF(optional, shard)
+    for s in strategies:
+        af.add_strategy(s)
+
+    while True:
+        batch: list = queue.get()
+        if batch[-1] == DONE:
+            af._on_batch(batch[:-1])
+            break
+        af._on_batch(batch)
+    af._flush_bars()
+
+    af.dump_latency(None if optional.latency_path is None else f"{optional.latency_path}.worker{shard[0]}")
@@ -1,3 +1,4 @@
 from .csv_md import StockMD
 from .csv_md import start as stock_start
-
+from .tickstore import TickStore
+from .index import SymbolIndex
@@ -1,19 +1,26 @@
 import os
 import re
+import sys
 import time
 
 import yaml
+import numpy as np
 import pandas as pd
 
-from A.types import KLine, Event, EventType, StrategyType, Price
-from A.data import KLineHandle
+from A.types import NS_PER_DAY, KLine, Event, EventType, StrategyType, Price, compact_to_ns
+from A.data import KLineHandle, BarCache, BarSpill, Retention, bar_records, build_klines, memory_report, \
+    retention_options
 from A.log import logger
+from A.transport import BatchQueue, DONE
 from A.types.stock import Snapshot, OrderBook
 
+from .loader import DEFAULT_CHUNK_SIZE, TickChunk, OrderBookChunk, parse_time, read_chunks
+from .tickstore import MANIFEST, TickStore
+from .index import MAX_SHARE, SymbolIndex, symbol_index
+
 from glob import glob
-from datetime import datetime
-from multiprocessing import Queue
-from typing import Optional
+from collections import deque
+from typing import Iterator, Optional
 from numpy import char as nchar
 
 
@@ -21,18 +28,61 @@ class StockMD:
     def __init__(
             self,
             symbols: list[str],
-            source_path: str,
-            queue: Queue
+            source_path: Optional[str],
+            queue: BatchQueue,
+            prebuild_bars: bool = False,
+            retention: Retention = Retention.NONE,
+            keep: int = 0,
+            spill: Optional[BarSpill] = None,
+            bar_cache: Optional[BarCache] = None,
+            replay_bars: bool = False,
+            vectorized: bool = True,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            tick_store: Optional[TickStore] = None,
+            use_index: bool = False
     ) -> None:
-        if os.path.isdir(source_path):
+        """
+        Args:
+            symbols: the symbol codes to replay
+            source_path: a csv file, or a directory of daily csv files, the days of the tick store if None
+            queue: the event writer
+            prebuild_bars: build the bars of a file with `build_klines` before it is replayed and
+                put each bar where `KLineHandle` would close it, instead of feeding every tick
+                to `KLineHandle`
+            retention: the bars kept by the `KLineHandle` of each symbol, the bars are put
+                onto the queue either way
+            keep: the number of bars kept with `Retention.LAST` and `Retention.SPILL`
+            spill: the file of the bars with `Retention.SPILL`, closed by `start`
+            bar_cache: read the bars of a file from the cache, or cache them once built, the bars
+                are pre-built with a cache, see `prebuild_bars`
+            replay_bars: put the bars of the files only, no tick is put and the tick files are
+                not read when their bars are cached, for the strategies of `on_bar` only
+            vectorized: parse the files a chunk at a time into arrays, see `A.adapter.backtest.loader`,
+                instead of line by line, the events are the same
+            chunk_size: the bytes read at a time when vectorized
+            tick_store: replay the days converted into the store from the current content of their csv
+                file from the store instead, see `A.adapter.backtest.tickstore`, the events are the same
+            use_index: read the lines of the symbols only at their offsets in the csv files, with the
+                index of each file, built and saved next to it the first time, see `A.adapter.backtest.index`,
+                the events are the same
+        """
+        self._tick_store: Optional[TickStore] = tick_store
+        # source file -> the day of the tick store replayed instead, None if the file is read
+        self._store_days: dict[str, Optional[str]] = dict()
+        self._use_index: bool = use_index
+        # source file -> its index, None if the file is read whole
+        self._indexes: dict[str, Optional[SymbolIndex]] = dict()
+        if source_path is None and tick_store is not None:
+            self._source_files: list[str] = [tick_store.manifest_path(day) for day in tick_store.days()]
+        elif os.path.isdir(source_path):
             self._source_files = glob(os.path.join(source_path, "*.csv"))
             # sort by filename
             self._source_files = sorted(self._source_files,
                                         key=lambda x: os.path.splitext(os.path.split(x)[-1])[0])
         else:
-            self._source_files: list[str] = [source_path]
+            self._source_files = [source_path]
 
-        self._queue: Queue = queue
+        self._queue: BatchQueue = queue
         self._symbols: list[str] = symbols
         self._kline_handle_map: dict[str, KLineHandle] = dict()
         self._last_bar: Optional[KLine] = None
@@ -46,12 +96,30 @@ class StockMD:
             orderbook=self._ob_parser,
         )
         self._last_snapshot_map: dict[str, Snapshot] = dict()
+        self._vectorized: bool = vectorized
+        self._chunk_size: int = chunk_size
+
+        self._bar_cache: Optional[BarCache] = bar_cache
+        self._replay_bars: bool = replay_bars
+        self._prebuild_bars: bool = prebuild_bars or bar_cache is not None or replay_bars
+        # symbol code -> (the index of the tick closing the bar, bar) of the pre-built bars of the file
+        self._prebuilt_bars: dict[str, deque] = dict()
+        # symbol code -> the index of the next tick of the symbol in the file
+        self._tick_index: dict[str, int] = dict()
+        # symbol code -> the bar pending at the end of a file, closed by the next tick of the symbol
+        self._pending_bars: dict[str, KLine] = dict()
+        # symbol code -> the close of the last pre-built bar
+        self._last_closes: dict[str, float] = dict()
+
+        self._retention: Retention = retention
+        self._keep: int = keep
+        self._spill: Optional[BarSpill] = spill
 
         self._init()
 
     def _init(self):
         for symbol in self._symbols:
-            k = KLineHandle(symbol)
+            k = KLineHandle(symbol, retention=self._retention, keep=self._keep, spill=self._spill)
             k.subscribe(self._on_bar)
             self._kline_handle_map[symbol] = k
 
@@ -63,8 +131,18 @@ class StockMD:
         event.data = bar
         event.ex_type = StrategyType.STOCK
         event.event_type = EventType.KLINE_DATA
+        event.ingress_ns = time.monotonic_ns()
         self._queue.put(event)
 
+    def _put_prebuilt_bar(
+            self,
+            bar: KLine
+    ) -> None:
+        """ put a pre-built bar, spilled like the bars of `KLineHandle` """
+        if self._spill is not None:
+            self._spill.append(bar)
+        self._on_bar(bar)
+
     def _kline_msg_process(
             self,
             msg: pd.Series
@@ -72,14 +150,15 @@ class StockMD:
         pass
 
     def _tick_parser(self, content: str):
+        ingress_ns = time.monotonic_ns()
         items = content.split(',')
 
-        now_time = int(f"{items[1]}{items[2]}")
         symbol_code = items[3]
         if symbol_code not in self._symbols:
             return
 
-        data_time = datetime.strptime(items[4], "%Y%m%d%H%M%S%f")
+        now_time = compact_to_ns(int(items[1]) * 1_000_000_000 + int(items[2]))
+        data_time = parse_time(items[4])
         pre_close_price = float(items[5])
         open_price = float(items[6])
         high_price = float(items[7])
@@ -100,13 +179,6 @@ class StockMD:
             bid.append(float(items[i + 2]))
             bid_qty.append(int(float(items[i + 3])))
 
-        if symbol_code in self._last_snapshot_map:
-            last_snapshot = self._last_snapshot_map[symbol_code]
-        else:
-            last_snapshot = Snapshot()
-            last_snapshot.total_trade_volume = .0
-            last_snapshot.total_trade_turnover = .0
-
         snapshot = Snapshot()
         snapshot.symbol_code = symbol_code
         snapshot.data_time = data_time
@@ -116,8 +188,6 @@ class StockMD:
         snapshot.high_price = high_price
         snapshot.low_price = low_price
         snapshot.last_price = last_price
-        snapshot.trade_volume = total_trade_vol - last_snapshot.total_trade_volume
-        snapshot.trade_turnover = total_trade_turnover - last_snapshot.total_trade_turnover
         snapshot.total_trade_volume = total_trade_vol
         snapshot.total_trade_turnover = total_trade_turnover
         snapshot.upper_limit_price = upper_limit_price
@@ -126,20 +196,237 @@ class StockMD:
         snapshot.ask = ask
         snapshot.bid_qty = bid_qty
         snapshot.ask_qty = ask_qty
+        self._put_snapshot(snapshot, ingress_ns)
+
+    def _put_snapshot(
+            self,
+            snapshot: Snapshot,
+            ingress_ns: int
+    ) -> None:
+        """ put a parsed snapshot, its traded volume and turnover are the ones since the last snapshot """
+        symbol_code = snapshot.symbol_code
+        if symbol_code in self._last_snapshot_map:
+            last_snapshot = self._last_snapshot_map[symbol_code]
+        else:
+            last_snapshot = Snapshot()
+            last_snapshot.total_trade_volume = 0
+            last_snapshot.total_trade_turnover = .0
 
+        snapshot.trade_volume = snapshot.total_trade_volume - last_snapshot.total_trade_volume
+        snapshot.trade_turnover = snapshot.total_trade_turnover - last_snapshot.total_trade_turnover
         self._last_snapshot_map[symbol_code] = snapshot
 
         event = Event()
         event.data = snapshot
         event.event_type = EventType.SNAPSHOT_DATA
         event.ex_type = StrategyType.STOCK
+        event.ingress_ns = ingress_ns
         self._queue.put(event)
 
-        df = pd.DataFrame([snapshot])
-        df = df.rename(columns={
-            "trade_volume": "volume",
-        })
-        self._kline_handle_map[snapshot.symbol_code].do(df.iloc[0])
+        if self._prebuild_bars:
+            self._put_prebuilt_bars(symbol_code)
+        else:
+            self._kline_handle_map[symbol_code].do(snapshot.last_price, snapshot.trade_volume, snapshot.data_time)
+
+    @staticmethod
+    def _day_of(file_path: str) -> str:
+        """ the trading day of a source file, a csv file or the manifest of a day of the tick store """
+        if os.path.basename(file_path) == MANIFEST:
+            return os.path.basename(os.path.dirname(file_path))
+        return os.path.splitext(os.path.basename(file_path))[0]
+
+    def _store_day(
+            self,
+            file_path: str
+    ) -> Optional[str]:
+        """ the day of the tick store replayed instead of a source file, None to read the csv file """
+        if self._tick_store is None:
+            return None
+        if file_path not in self._store_days:
+            day = self._day_of(file_path)
+            if os.path.basename(file_path) != MANIFEST and not self._tick_store.is_valid(day, file_path):
+                logger.info(f"<CSV> {file_path} not converted into the tick store, read as csv")
+                day = None
+            self._store_days[file_path] = day
+        return self._store_days[file_path]
+
+    def _index_of(
+            self,
+            file_path: str
+    ) -> Optional[SymbolIndex]:
+        """ the index of a csv file, None to read the file whole, when the symbols have most of it """
+        if not self._use_index:
+            return None
+        if file_path not in self._indexes:
+            index = symbol_index(file_path)
+            self._indexes[file_path] = index if index.share(self._symbols) <= MAX_SHARE else None
+        return self._indexes[file_path]
+
+    def _read_chunks(
+            self,
+            file_path: str,
+            order_books: bool = True
+    ) -> Iterator[tuple[Optional[TickChunk], Optional[OrderBookChunk]]]:
+        """ the chunks of a source file, from the tick store if the file was converted """
+        day = self._store_day(file_path)
+        if day is not None:
+            return self._tick_store.read_chunks(day, self._symbols, order_books=order_books)
+        return read_chunks(file_path, self._symbols, self._chunk_size, order_books=order_books,
+                           index=self._index_of(file_path))
+
+    def _lines(
+            self,
+            file_path: str
+    ) -> Iterator[tuple[int, str]]:
+        """ (the line in the file, the text) of the lines of a csv file to parse one by one """
+        index = self._index_of(file_path)
+        if index is not None:
+            yield from index.lines(file_path, self._symbols)
+            return
+        with open(file_path, encoding="utf-8") as f:
+            yield from enumerate(f)
+
+    def _build_records(
+            self,
+            file_path: str
+    ) -> dict[str, np.ndarray]:
+        """ build the bars of the ticks of a file, one `build_klines` pass per symbol """
+        if self._vectorized or self._store_day(file_path) is not None:
+            ticks = self._tick_columns(file_path)
+        else:
+            ticks = self._tick_lists(file_path)
+
+        records = dict()
+        for symbol_code, (times, prices, volumes, lines) in ticks.items():
+            bars, closed_at = build_klines(symbol_code, times, prices, volumes)
+            closed_at = closed_at.tolist()
+            records[symbol_code] = bar_records(bars, closed_at, [lines[i] if i >= 0 else -1 for i in closed_at])
+        return records
+
+    def _tick_columns(
+            self,
+            file_path: str
+    ) -> dict[str, tuple]:
+        """ symbol code -> the times, prices, volumes and lines of its ticks, read a chunk at a time """
+        # symbol code -> the times, prices, total traded volumes and lines of its ticks per chunk
+        parts: dict[str, tuple[list, list, list, list]] = {
+            symbol_code: ([], [], [], []) for symbol_code in self._symbols
+        }
+        for ticks, _ in self._read_chunks(file_path, order_books=False):
+            if ticks is None:
+                continue
+            times = ticks.data_time % NS_PER_DAY
+            # the ticks of each symbol, in file order
+            order = np.argsort(ticks.symbol_code, kind="stable")
+            codes, starts = np.unique(ticks.symbol_code[order], return_index=True)
+            for symbol_code, index in zip(codes.tolist(), np.split(order, starts[1:])):
+                for values, column in zip(parts[symbol_code], (times, ticks.last_price,
+                                                               ticks.total_trade_volume, ticks.line)):
+                    values.append(column[index])
+
+        ticks = dict()
+        for symbol_code, (times, prices, totals, lines) in parts.items():
+            totals = np.concatenate(totals) if totals else np.empty(0, dtype=np.int64)
+            ticks[symbol_code] = (
+                np.concatenate(times) if times else np.empty(0, dtype=np.int64),
+                np.concatenate(prices) if prices else np.empty(0),
+                np.diff(totals, prepend=0).astype(np.float64),
+                np.concatenate(lines).tolist() if lines else []
+            )
+        return ticks
+
+    def _tick_lists(
+            self,
+            file_path: str
+    ) -> dict[str, tuple]:
+        """ symbol code -> the times, prices, volumes and lines of its ticks, read line by line """
+        # symbol code -> the times, prices, volumes and lines of its ticks
+        ticks: dict[str, tuple[list, list, list, list]] = {
+            symbol_code: ([], [], [], []) for symbol_code in self._symbols
+        }
+        # symbol code -> the total traded volume of the last tick
+        totals: dict[str, float] = dict()
+        for n, line in self._lines(file_path):
+            m = self._data_check_pattern.findall(line)
+            if not m or m[0] != "tick":
+                continue
+            items = line.split(',', 13)
+            symbol_code = items[3]
+            if symbol_code not in self._symbols:
+                continue
+
+            total_trade_vol = int(items[11])
+            times, prices, volumes, lines = ticks[symbol_code]
+            times.append(parse_time(items[4]) % NS_PER_DAY)
+            prices.append(float(items[9]))
+            volumes.append(total_trade_vol - totals.get(symbol_code, .0))
+            totals[symbol_code] = total_trade_vol
+            lines.append(n)
+        return ticks
+
+    def _prebuild(
+            self,
+            file_path: str
+    ) -> dict[str, np.ndarray]:
+        """
+        the bars of a file, read from the bar cache or built, queued per symbol for `_put_prebuilt_bars`
+
+        Returns:
+            dict: symbol code -> the records of the bars, see `A.data.BarCache`
+        """
+        day = self._day_of(file_path)
+        records = None
+        if self._bar_cache is not None:
+            records = self._bar_cache.load(day, file_path, self._symbols)
+        if records is None:
+            records = self._build_records(file_path)
+            if self._bar_cache is not None:
+                self._bar_cache.store(day, file_path, records)
+
+        self._prebuilt_bars.clear()
+        self._tick_index.clear()
+        for symbol_code, values in records.items():
+            bars = BarCache.to_klines(values)
+            if not bars:
+                continue
+            # the bars are built per day, the first one changes from the last close of the day before
+            last_close = self._last_closes.get(symbol_code)
+            bars[0].change_percent = ((bars[0].close / last_close) - 1) * 100 if last_close else .0
+            self._last_closes[symbol_code] = bars[-1].close
+            # the bar still pending at the end of the file is last, `start` takes it out
+            self._prebuilt_bars[symbol_code] = deque(zip(values["tick"].tolist(), bars))
+        return records
+
+    def _put_day_bars(
+            self,
+            records: dict[str, np.ndarray]
+    ) -> None:
+        """
+        put the pre-built bars of a file without its ticks, in the order the ticks close them,
+        the bars pending at the end of the file are put last
+        """
+        bars = []
+        for symbol_code, queued in self._prebuilt_bars.items():
+            lines = records[symbol_code]["line"].tolist()
+            bars += [(line if line >= 0 else sys.maxsize, bar) for line, (_, bar) in zip(lines, queued)]
+        bars.sort(key=lambda x: x[0])
+        for _, bar in bars:
+            self._put_prebuilt_bar(bar)
+        self._prebuilt_bars.clear()
+
+    def _put_prebuilt_bars(
+            self,
+            symbol_code: str
+    ) -> None:
+        """ put the pre-built bars the tick of the symbol just put closes """
+        index = self._tick_index.get(symbol_code, 0)
+        self._tick_index[symbol_code] = index + 1
+        if index == 0 and (bar := self._pending_bars.pop(symbol_code, None)) is not None:
+            self._put_prebuilt_bar(bar)
+
+        bars = self._prebuilt_bars.get(symbol_code)
+        while bars and bars[0][0] == index:
+            self._put_prebuilt_bar(bars.popleft()[1])
 
     def _trade_parser(self, content: str):
         pass
@@ -148,18 +435,18 @@ class StockMD:
         pass
 
     def _ob_parser(self, content: str):
+        ingress_ns = time.monotonic_ns()
         items = content.split(',')
 
-        now_time = int(f"{items[1]}{items[2]}")
         symbol_code = items[3]
         if symbol_code not in self._symbols:
             return
 
         order_book = OrderBook()
         order_book.symbol_code = symbol_code
-        order_book.recv_time = now_time
+        order_book.recv_time = compact_to_ns(int(items[1]) * 1_000_000_000 + int(items[2]))
 
-        order_book.data_time = datetime.strptime(items[4], "%Y%m%d%H%M%S%f")
+        order_book.data_time = parse_time(items[4])
         order_book.last_price = float(items[5])
         order_book.qty = int(items[6])
         order_book.turnover = float(items[7])
@@ -179,13 +466,94 @@ class StockMD:
 
         order_book.bids = bids
         order_book.asks = asks
+        self._put_order_book(order_book, ingress_ns)
 
+    def _put_order_book(
+            self,
+            order_book: OrderBook,
+            ingress_ns: int
+    ) -> None:
         event = Event()
         event.event_type = EventType.ORDERBOOK_DATA
         event.data = order_book
         event.ex_type = StrategyType.STOCK
+        event.ingress_ns = ingress_ns
         self._queue.put(event)
 
+    @staticmethod
+    def _snapshots(ticks: TickChunk) -> list[Snapshot]:
+        """ the snapshots of the ticks of a chunk, without the traded volume and turnover, see `_put_snapshot` """
+        snapshots = []
+        for (symbol_code, data_time, now_time, pre_close_price, open_price, high_price, low_price, last_price,
+             total_trade_vol, total_trade_turnover, upper_limit_price, lower_limit_price,
+             bid, ask, bid_qty, ask_qty) in zip(
+                ticks.symbol_code.tolist(), ticks.data_time.tolist(), ticks.recv_time.tolist(),
+                ticks.pre_close_price.tolist(), ticks.open_price.tolist(), ticks.high_price.tolist(),
+                ticks.low_price.tolist(), ticks.last_price.tolist(), ticks.total_trade_volume.tolist(),
+                ticks.total_trade_turnover.tolist(), ticks.upper_limit_price.tolist(),
+                ticks.lower_limit_price.tolist(), ticks.bid.tolist(), ticks.ask.tolist(),
+                ticks.bid_qty.tolist(), ticks.ask_qty.tolist()):
+            snapshot = Snapshot()
+            snapshot.symbol_code = symbol_code
+            snapshot.data_time = data_time
+            snapshot.recv_time = now_time
+            snapshot.pre_close_price = pre_close_price
+            snapshot.open_price = open_price
+            snapshot.high_price = high_price
+            snapshot.low_price = low_price
+            snapshot.last_price = last_price
+            snapshot.total_trade_volume = total_trade_vol
+            snapshot.total_trade_turnover = total_trade_turnover
+            snapshot.upper_limit_price = upper_limit_price
+            snapshot.lower_limit_price = lower_limit_price
+            snapshot.bid = bid
+            snapshot.ask = ask
+            snapshot.bid_qty = bid_qty
+            snapshot.ask_qty = ask_qty
+            snapshots.append(snapshot)
+        return snapshots
+
+    @staticmethod
+    def _order_books(books: OrderBookChunk) -> list[OrderBook]:
+        """ the order books of a chunk """
+        order_books = []
+        for symbol_code, now_time, data_time, last_price, qty, turnover, trades_count, (bids, asks) in zip(
+                books.symbol_code.tolist(), books.recv_time.tolist(), books.data_time.tolist(),
+                books.last_price.tolist(), books.qty.tolist(), books.turnover.tolist(),
+                books.trades_count.tolist(), books.sides()):
+            order_book = OrderBook()
+            order_book.symbol_code = symbol_code
+            order_book.recv_time = now_time
+            order_book.data_time = data_time
+            order_book.last_price = last_price
+            order_book.qty = qty
+            order_book.turnover = turnover
+            order_book.trades_count = trades_count
+            order_book.bids = bids
+            order_book.asks = asks
+            order_books.append(order_book)
+        return order_books
+
+    def _replay(
+            self,
+            file_path: str
+    ) -> None:
+        """ put the ticks and order books of a file parsed a chunk at a time, in file order """
+        for ticks, books in self._read_chunks(file_path):
+            records: list[tuple] = []
+            lines: list[np.ndarray] = []
+            if ticks is not None:
+                records += [(self._put_snapshot, snapshot) for snapshot in self._snapshots(ticks)]
+                lines.append(ticks.line)
+            if books is not None:
+                records += [(self._put_order_book, order_book) for order_book in self._order_books(books)]
+                lines.append(books.line)
+            if not records:
+                continue
+            for i in np.argsort(np.concatenate(lines), kind="stable").tolist():
+                put, record = records[i]
+                put(record, time.monotonic_ns())
+
     def _parser(
             self,
             item: str
@@ -198,13 +566,42 @@ class StockMD:
 
     def start(self):
         for file_path in self._source_files:
-            with open(file_path, encoding="utf-8") as f:
-                for line in f:
+            # a file is a trading day, the traded volumes restart from 0
+            self._last_snapshot_map.clear()
+            if self._prebuild_bars:
+                records = self._prebuild(file_path)
+                if self._replay_bars:
+                    self._put_day_bars(records)
+                    continue
+            if self._vectorized or self._store_day(file_path) is not None:
+                self._replay(file_path)
+            else:
+                for _, line in self._lines(file_path):
                     self._parser(line)
-        self._queue.put("Done")
-
-
-def start(csv_config_path: str, queue: Queue, symbols: list[str]):
+            for symbol_code, bars in self._prebuilt_bars.items():
+                if bars and bars[-1][0] < 0:
+                    # the bar still pending at the end of the file
+                    self._pending_bars[symbol_code] = bars.pop()[1]
+
+        for symbol_code, k in self._kline_handle_map.items():
+            if self._prebuild_bars:
+                if (bar := self._pending_bars.pop(symbol_code, None)) is not None:
+                    self._put_prebuilt_bar(bar)
+            else:
+                k.flush()
+        logger.info(f"<CSV> bar memory {memory_report(self._kline_handle_map.values())}")
+        if self._spill is not None:
+            self._spill.close()
+            logger.info(f"<CSV> {self._spill.count} bars spilled to {self._spill.path}")
+        self._queue.put(DONE)
+
+
+def start(csv_config_path: str, queue: BatchQueue, symbols: list[str]):
     config = yaml.safe_load(open(csv_config_path, encoding="utf-8"))
-    md = StockMD(symbols, config['source_path'], queue)
+    bar_cache = BarCache(config['bar_cache']) if config.get('bar_cache') else None
+    tick_store = TickStore(config['tick_store']) if config.get('tick_store') else None
+    md = StockMD(symbols, config.get('source_path'), queue, prebuild_bars=config.get('prebuild_bars', False),
+                 bar_cache=bar_cache, replay_bars=config.get('replay_bars', False),
+                 vectorized=config.get('vectorized', True), tick_store=tick_store,
+                 use_index=config.get('symbol_index', False), **retention_options(config))
     md.start()
@@ -0,0 +1,330 @@
+"""
+Byte offset index of the symbols of the backtest csv files.
+
+A full market file is read whole even when one symbol is subscribed. The
+index of a file keeps, per symbol, the runs of consecutive `[tick]` and
+`[orderbook]` lines of the symbol, as (first byte, end byte, first line,
+number of lines), and the earliest and latest data time of the symbol.
+It is built once with a numpy scan of the file and saved next to it as
+`<file>.index.npz`, then the lines of the subscribed symbols are read at
+their offsets from a memory map of the file, with their line numbers in
+the file, so the events replayed are the same.
+
+    python -m A.adapter.backtest.index /data/ticks
+"""
+import os
+import mmap
+import argparse
+
+import numpy as np
+
+from A.log import logger
+from A.data.cache import file_digest
+
+from .loader import DEFAULT_CHUNK_SIZE, _Lines, _chunks, timestamps, parse_time
+
+from glob import glob
+from typing import Collection, Iterator, Optional
+
+# the suffix of the index file of a csv file
+SUFFIX = ".index.npz"
+# the version of the index layout, an index of another version is built again
+VERSION = 1
+# the max share of the bytes of a file the lines of the subscribed symbols may have to be read
+# with the index, the whole file is read above it
+MAX_SHARE = 0.5
+
+# the record types indexed
+_RECORD_TYPES = (b"[tick],", b"[orderbook],")
+# the digits of a `%Y%m%d%H%M%S` data time followed by 3 digits of milliseconds
+_COMPACT_DIGITS = 17
+
+
+class SymbolIndex:
+    """ the runs of the lines of each symbol of a csv file, see the module """
+
+    def __init__(
+            self,
+            arrays: dict[str, np.ndarray]
+    ) -> None:
+        """
+        Args:
+            arrays: the arrays of an index, as `build` makes them and `save` writes them
+        """
+        self._arrays: dict[str, np.ndarray] = arrays
+        # symbol code -> its index in the arrays of the symbols
+        self._symbols: dict[str, int] = {code.decode("utf-8"): i for i, code in enumerate(arrays["codes"].tolist())}
+
+    @property
+    def size(self) -> int:
+        """ the bytes of the indexed file """
+        return int(self._arrays["size"])
+
+    @property
+    def symbols(self) -> list[str]:
+        return list(self._symbols)
+
+    def time_range(
+            self,
+            symbol_code: str
+    ) -> Optional[tuple[int, int]]:
+        """ the earliest and the latest data time of a symbol, see `A.types.timestamp`, None if not in the file """
+        i = self._symbols.get(symbol_code)
+        if i is None:
+            return None
+        return int(self._arrays["first_time"][i]), int(self._arrays["last_time"][i])
+
+    def runs(
+            self,
+            symbols: Collection[str]
+    ) -> np.ndarray:
+        """ the rows of the runs of the lines of the symbols in the run arrays, in file order """
+        bounds = self._arrays["bounds"]
+        rows = [np.arange(bounds[i], bounds[i + 1]) for i in (self._symbols.get(code) for code in symbols)
+                if i is not None]
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate(rows)
+        return rows[np.argsort(self._arrays["run_start"][rows], kind="stable")]
+
+    def share(
+            self,
+            symbols: Collection[str]
+    ) -> float:
+        """ the share of the bytes of the file in the lines of the symbols """
+        rows = self.runs(symbols)
+        read = int((self._arrays["run_end"][rows] - self._arrays["run_start"][rows]).sum())
+        return read / self.size if self.size else .0
+
+    def is_valid(
+            self,
+            path: str
+    ) -> bool:
+        """ whether the index was built from the current content of the file """
+        stat = os.stat(path)
+        if stat.st_size != self.size:
+            return False
+        if stat.st_mtime_ns == int(self._arrays["mtime_ns"]):
+            return True
+        return file_digest(path) == str(self._arrays["digest"])
+
+    def _blocks(
+            self,
+            path: str,
+            symbols: Collection[str],
+            chunk_size: int
+    ) -> Iterator[tuple[np.ndarray, bytes]]:
+        """ (the line of each line in the file, the lines) of the symbols, about chunk_size bytes at a time """
+        rows = self.runs(symbols)
+        if not len(rows):
+            return
+        starts = self._arrays["run_start"][rows]
+        ends = self._arrays["run_end"][rows]
+        first_lines = self._arrays["run_line"][rows]
+        n_lines = self._arrays["run_lines"][rows]
+        # the block of each run, a run is never split
+        blocks = np.cumsum(ends - starts) // chunk_size
+        splits = np.flatnonzero(np.diff(blocks)) + 1
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for block in np.split(np.arange(len(rows)), splits):
+                data = b"".join([mm[s:e] for s, e in zip(starts[block].tolist(), ends[block].tolist())])
+                if not data.endswith(b"\n"):
+                    # the last line of the file
+                    data += b"\n"
+                sizes = n_lines[block]
+                numbers = np.repeat(first_lines[block] - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+                yield numbers, data
+
+    def chunks(
+            self,
+            path: str,
+            symbols: Collection[str],
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[tuple[np.ndarray, _Lines]]:
+        """ the chunks of the lines of the symbols for `A.adapter.backtest.loader.read_chunks` """
+        for numbers, data in self._blocks(path, symbols, chunk_size):
+            yield numbers, _Lines(data)
+
+    def lines(
+            self,
+            path: str,
+            symbols: Collection[str],
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[tuple[int, str]]:
+        """ (the line in the file, the text) of the lines of the symbols, without the newline """
+        for numbers, data in self._blocks(path, symbols, chunk_size):
+            yield from zip(numbers.tolist(), data.decode("utf-8").split("\n"))
+
+    def save(
+            self,
+            path: str
+    ) -> None:
+        """ write the index of the csv file path next to it """
+        tmp = f"{path}{SUFFIX}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **self._arrays)
+        os.replace(tmp, path + SUFFIX)
+
+    @staticmethod
+    def load(path: str) -> Optional["SymbolIndex"]:
+        """ the index of the csv file path, None if missing, of another version or stale """
+        try:
+            with np.load(path + SUFFIX) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+        except (OSError, ValueError):
+            return None
+        if int(arrays.get("version", -1)) != VERSION:
+            return None
+        index = SymbolIndex(arrays)
+        return index if index.is_valid(path) else None
+
+    @staticmethod
+    def build(
+            path: str,
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> "SymbolIndex":
+        """
+        scan a csv file of ticks and order books
+
+        Args:
+            path: the csv file
+            chunk_size: the bytes read at a time
+
+        Returns:
+            SymbolIndex: the index of the file
+        """
+        stat = os.stat(path)
+        digest = file_digest(path)
+        # symbol code -> the id of the symbol
+        ids: dict[bytes, int] = dict()
+        first_time, last_time = [], []
+        runs = []
+        offset = 0
+        for numbers, lines in _chunks(path, chunk_size):
+            rows = np.sort(np.concatenate([lines.of_type(record_type) for record_type in _RECORD_TYPES]))
+            codes, valid = lines.symbols(rows)
+            rows, codes = rows[valid], codes[valid]
+            if len(rows):
+                unique, inverse = np.unique(codes, return_inverse=True)
+                for code in unique.tolist():
+                    if code not in ids:
+                        ids[code] = len(ids)
+                        first_time.append(np.iinfo(np.int64).max)
+                        last_time.append(np.iinfo(np.int64).min)
+                symbol = np.array([ids[code] for code in unique.tolist()], dtype=np.int64)[inverse.ravel()]
+
+                data_time = _data_times(lines, rows)
+                first, last = np.array(first_time), np.array(last_time)
+                np.minimum.at(first, symbol, data_time)
+                np.maximum.at(last, symbol, data_time)
+                first_time, last_time = first.tolist(), last.tolist()
+
+                # the symbol of each line, -1 for the lines not indexed, a run starts where it changes
+                key = np.full(len(lines), -1, dtype=np.int64)
+                key[rows] = symbol
+                starts = np.flatnonzero(np.diff(key, prepend=-2))
+                ends = np.append(starts[1:], len(lines)) - 1
+                kept = key[starts] >= 0
+                starts, ends = starts[kept], ends[kept]
+                runs.append(np.stack([key[starts], lines.starts[starts] + offset,
+                                      np.minimum(lines.ends[ends] + 1 + offset, stat.st_size),
+                                      numbers[starts], ends - starts + 1], axis=1))
+            offset += len(lines.data)
+
+        merged = np.empty((0, 5), dtype=np.int64)
+        if runs:
+            runs = np.concatenate(runs)
+            # the runs of a symbol split by the chunks are merged
+            heads = np.flatnonzero(np.append(True, (runs[1:, 0] != runs[:-1, 0])
+                                             | (runs[1:, 3] != runs[:-1, 3] + runs[:-1, 4])))
+            merged = runs[heads]
+            merged[:, 2] = runs[np.append(heads[1:], len(runs)) - 1, 2]
+            merged[:, 4] = np.add.reduceat(runs[:, 4], heads)
+
+        codes = sorted(ids)
+        order = np.array([ids[code] for code in codes], dtype=np.int64)
+        rank = np.empty(len(codes), dtype=np.int64)
+        rank[order] = np.arange(len(codes))
+        symbol = rank[merged[:, 0]]
+        by_symbol = np.argsort(symbol, kind="stable")
+        merged = merged[by_symbol]
+        return SymbolIndex(dict(
+            version=np.array(VERSION),
+            size=np.array(stat.st_size),
+            mtime_ns=np.array(stat.st_mtime_ns),
+            digest=np.array(digest),
+            codes=np.array(codes, dtype=bytes),
+            first_time=np.array(first_time, dtype=np.int64)[order],
+            last_time=np.array(last_time, dtype=np.int64)[order],
+            bounds=np.searchsorted(symbol[by_symbol], np.arange(len(codes) + 1)),
+            run_start=merged[:, 1],
+            run_end=merged[:, 2],
+            run_line=merged[:, 3],
+            run_lines=merged[:, 4],
+        ))
+
+
+def _data_times(
+        lines: _Lines,
+        rows: np.ndarray
+) -> np.ndarray:
+    """ the data time stamps of the lines of rows, the field after the symbol code """
+    last = len(lines.commas) - 1
+    first = lines.first_comma[rows]
+    start = lines.commas[np.minimum(first + 3, last)] + 1
+    # the last field of a line ends at the newline
+    end = np.minimum(lines.commas[np.minimum(first + 4, last)], lines.ends[rows])
+    compact = end - start == _COMPACT_DIGITS
+    digits = lines.buf[np.minimum(start[:, None] + np.arange(_COMPACT_DIGITS), len(lines.buf) - 1)]
+    digits = digits.astype(np.int64) - ord("0")
+    compact &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+
+    ret = np.empty(len(rows), dtype=np.int64)
+    values = digits[compact] @ (10 ** np.arange(_COMPACT_DIGITS - 1, -1, -1, dtype=np.int64))
+    ret[compact] = timestamps(values) if len(values) else values
+    for i in np.flatnonzero(~compact).tolist():
+        ret[i] = parse_time(lines.data[start[i]:end[i]].decode("utf-8"))
+    return ret
+
+
+def symbol_index(
+        path: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> SymbolIndex:
+    """
+    the index of a csv file, loaded, or built and saved next to it if missing or stale,
+    kept in memory only if it can not be saved
+
+    Args:
+        path: the csv file
+        chunk_size: the bytes read at a time to build the index
+
+    Returns:
+        SymbolIndex: the index of the file
+    """
+    index = SymbolIndex.load(path)
+    if index is not None:
+        return index
+    index = SymbolIndex.build(path, chunk_size)
+    try:
+        index.save(path)
+    except OSError as e:
+        logger.info(f"<CSV> index of {path} not saved: {e}")
+    return index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="build the symbol index of the backtest csv files.")
+    parser.add_argument("source_path", help="a csv file, or a directory of daily csv files.")
+    args = parser.parse_args()
+    if os.path.isdir(args.source_path):
+        files = sorted(glob(os.path.join(args.source_path, "*.csv")))
+    else:
+        files = [args.source_path]
+    for file_path in files:
+        index = symbol_index(file_path)
+        logger.info(f"<CSV> {file_path}{SUFFIX}: {len(index.symbols)} symbols")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Chunked loader of the `[tick]`/`[orderbook]` csv files of the backtests.
+
+The file is read `chunk_size` bytes at a time, the lines of a chunk are
+split by record type once, and the records of each type are parsed
+together by the pandas C parser into column arrays. The records of the
+symbols not subscribed are dropped with a vectorized mask of the symbol
+codes before the parse, and `StockMD` replays the records left from the
+arrays in file order.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+from A.types import compact_to_ns, datetime_to_ns
+from A.types.timestamp import midnight_ns
+
+from datetime import datetime
+from typing import TYPE_CHECKING, Collection, Iterator, Optional
+
+if TYPE_CHECKING:
+    from .index import SymbolIndex
+
+# the bytes read at a time
+DEFAULT_CHUNK_SIZE = 16 << 20
+# the number of price levels of a tick
+TICK_LEVELS = 10
+# the number of fields of a tick line, the record type included
+TICK_FIELDS = 15 + 4 * TICK_LEVELS
+# the time format of the data time of the records
+TIME_FORMAT = "%Y%m%d%H%M%S%f"
+
+# the bytes of the fields the `high` float converter of pandas reads as `float` does, a number of
+# at most 15 digits, the converter is only exact up to those
+_SHORT_FIELD = 15
+# the int fields of the tick lines, the others after the symbol code are floats
+_TICK_INTS = (1, 2, 4, 11)
+# the int fields of the order book lines before the price levels
+_ORDER_BOOK_INTS = (1, 2, 4, 6, 8)
+
+
+# the array fields of `TickChunk` but the symbol code, in row order of the file
+TICK_COLUMNS = ("line", "recv_time", "data_time", "pre_close_price", "open_price", "high_price", "low_price",
+                "last_price", "total_trade_volume", "total_trade_turnover", "upper_limit_price",
+                "lower_limit_price", "ask", "ask_qty", "bid", "bid_qty")
+# the array fields of `OrderBookChunk` but the symbol code
+ORDER_BOOK_COLUMNS = ("line", "recv_time", "data_time", "last_price", "qty", "turnover", "trades_count", "levels")
+
+
+class TickChunk:
+    """ the subscribed ticks of a chunk, one array per field, in file order """
+
+    def __init__(
+            self,
+            columns: dict[str, np.ndarray]
+    ) -> None:
+        """
+        Args:
+            columns: the `symbol_code` and the `TICK_COLUMNS` arrays
+        """
+        # the line of each tick in the file
+        self.line: np.ndarray = columns["line"]
+        self.symbol_code: np.ndarray = columns["symbol_code"]
+        # the time stamps of the receiving time and of the data time, see `A.types.timestamp`
+        self.recv_time: np.ndarray = columns["recv_time"]
+        self.data_time: np.ndarray = columns["data_time"]
+        self.pre_close_price: np.ndarray = columns["pre_close_price"]
+        self.open_price: np.ndarray = columns["open_price"]
+        self.high_price: np.ndarray = columns["high_price"]
+        self.low_price: np.ndarray = columns["low_price"]
+        self.last_price: np.ndarray = columns["last_price"]
+        self.total_trade_volume: np.ndarray = columns["total_trade_volume"]
+        self.total_trade_turnover: np.ndarray = columns["total_trade_turnover"]
+        self.upper_limit_price: np.ndarray = columns["upper_limit_price"]
+        self.lower_limit_price: np.ndarray = columns["lower_limit_price"]
+        # one column per price level
+        self.ask: np.ndarray = columns["ask"]
+        self.ask_qty: np.ndarray = columns["ask_qty"]
+        self.bid: np.ndarray = columns["bid"]
+        self.bid_qty: np.ndarray = columns["bid_qty"]
+
+    def __len__(self) -> int:
+        return len(self.line)
+
+
+class OrderBookChunk:
+    """ the subscribed order books of a chunk, one array per field, in file order """
+
+    def __init__(
+            self,
+            columns: dict[str, np.ndarray]
+    ) -> None:
+        """
+        Args:
+            columns: the `symbol_code` and the `ORDER_BOOK_COLUMNS` arrays
+        """
+        # the line of each order book in the file
+        self.line: np.ndarray = columns["line"]
+        self.symbol_code: np.ndarray = columns["symbol_code"]
+        self.recv_time: np.ndarray = columns["recv_time"]
+        self.data_time: np.ndarray = columns["data_time"]
+        self.last_price: np.ndarray = columns["last_price"]
+        self.qty: np.ndarray = columns["qty"]
+        self.turnover: np.ndarray = columns["turnover"]
+        self.trades_count: np.ndarray = columns["trades_count"]
+        # (bid price, bid qty, ask price, ask qty) per level, NaN after the levels of a line
+        self.levels: np.ndarray = columns["levels"]
+
+    def __len__(self) -> int:
+        return len(self.line)
+
+    def sides(self) -> list[tuple[list[tuple], list[tuple]]]:
+        """ the (price, qty) of the bids and of the asks of each order book, the empty fields skipped """
+        ret = []
+        for row in self.levels.tolist():
+            row = [v for v in row if v == v]
+            ret.append(([(row[j], int(row[j + 1])) for j in range(0, len(row) - 3, 4)],
+                        [(row[j + 2], int(row[j + 3])) for j in range(0, len(row) - 3, 4)]))
+        return ret
+
+
+def _tick_chunk(
+        frame: pd.DataFrame,
+        lines: np.ndarray
+) -> TickChunk:
+    """ the ticks of the fields by index parsed from the tick lines, and the line of each """
+    levels = frame[list(range(15, TICK_FIELDS))].to_numpy(dtype=np.float64)
+    return TickChunk(dict(
+        line=lines,
+        symbol_code=frame[3].to_numpy(),
+        # `%Y%m%d` and the 9 digits `%H%M%S%f` of the receiving time
+        recv_time=timestamps(frame[1].to_numpy() * 1_000_000_000 + frame[2].to_numpy()),
+        data_time=timestamps(frame[4].to_numpy()),
+        pre_close_price=frame[5].to_numpy(),
+        open_price=frame[6].to_numpy(),
+        high_price=frame[7].to_numpy(),
+        low_price=frame[8].to_numpy(),
+        last_price=frame[9].to_numpy(),
+        total_trade_volume=frame[11].to_numpy(),
+        total_trade_turnover=frame[12].to_numpy(),
+        upper_limit_price=frame[13].to_numpy(),
+        lower_limit_price=frame[14].to_numpy(),
+        ask=levels[:, 0::4],
+        ask_qty=levels[:, 1::4].astype(np.int64),
+        bid=levels[:, 2::4],
+        bid_qty=levels[:, 3::4].astype(np.int64),
+    ))
+
+
+def _order_book_chunk(
+        frame: pd.DataFrame,
+        lines: np.ndarray
+) -> OrderBookChunk:
+    """ the order books of the fields by index parsed from the order book lines, and the line of each """
+    return OrderBookChunk(dict(
+        line=lines,
+        symbol_code=frame[3].to_numpy(),
+        recv_time=timestamps(frame[1].to_numpy() * 1_000_000_000 + frame[2].to_numpy()),
+        data_time=timestamps(frame[4].to_numpy()),
+        last_price=frame[5].to_numpy(),
+        qty=frame[6].to_numpy(),
+        turnover=frame[7].to_numpy(),
+        trades_count=frame[8].to_numpy(),
+        levels=frame[list(range(9, frame.columns[-1] + 1))].to_numpy(dtype=np.float64),
+    ))
+
+
+def parse_time(value: str) -> int:
+    """ the time stamp of a `%Y%m%d%H%M%S%f` field, as `datetime.strptime` reads it, see `A.types.timestamp` """
+    if len(value) == 17:
+        return compact_to_ns(int(value))
+    return datetime_to_ns(datetime.strptime(value, TIME_FORMAT))
+
+
+def timestamps(values: np.ndarray) -> np.ndarray:
+    """
+    the time stamps of `%Y%m%d%H%M%S%f` ints, as `datetime.strptime` reads them, see `A.types.timestamp`
+
+    Args:
+        values: the ints
+
+    Returns:
+        np.ndarray: the time stamps, int64
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if len(values) and values.min() >= 10 ** 16 and values.max() < 10 ** 17:
+        # `%Y%m%d%H%M%S` and 3 digits of milliseconds
+        day, clock = np.divmod(values, 1_000_000_000)
+        days, inverse = np.unique(day, return_inverse=True)
+        midnight = np.array([midnight_ns(d) for d in days.tolist()], dtype=np.int64)[inverse.ravel()]
+        clock, millisecond = np.divmod(clock, 1000)
+        hour, clock = np.divmod(clock, 10000)
+        minute, second = np.divmod(clock, 100)
+        return midnight + (((hour * 60 + minute) * 60 + second) * 1000 + millisecond) * 1_000_000
+    unique, inverse = np.unique(values, return_inverse=True)
+    converted = [datetime_to_ns(datetime.strptime(str(v), TIME_FORMAT)) for v in unique.tolist()]
+    return np.array(converted, dtype=np.int64)[inverse.ravel()]
+
+
+class _Lines:
+    """ the whole lines of a chunk, located in the bytes with numpy, the lines are not split in python """
+
+    def __init__(
+            self,
+            data: bytes
+    ) -> None:
+        """
+        Args:
+            data: the lines, each ending with a newline
+        """
+        self.data: bytes = data
+        # padded for the record types of the short lines to be compared in bounds
+        self.buf: np.ndarray = np.frombuffer(data + b"\0" * 16, dtype=np.uint8)
+        separators = np.flatnonzero((self.buf == ord(",")) | (self.buf == ord("\n")))
+        newline = self.buf[separators] == ord("\n")
+        self.ends: np.ndarray = separators[newline]
+        self.starts: np.ndarray = np.concatenate(([0], self.ends[:-1] + 1))
+        # the commas, and the end of the chunk after them
+        self.commas: np.ndarray = np.append(separators[~newline], len(data))
+        # the number of fields of more than `_SHORT_FIELD` bytes of each line
+        line = np.cumsum(newline) - newline
+        self.long_fields: np.ndarray = np.bincount(
+            line[np.diff(separators, prepend=-1) > _SHORT_FIELD + 1], minlength=len(self.ends))
+        # the index of the first comma of each line
+        self.first_comma: np.ndarray = np.searchsorted(self.commas, self.starts)
+        self.n_fields: np.ndarray = np.diff(self.first_comma, append=len(self.commas) - 1) + 1
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    def symbols(
+            self,
+            rows: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        the symbol codes of the lines of rows, the field after the day and the time
+
+        Returns:
+            tuple: the codes as a bytes array, and whether the line has the field
+        """
+        last = len(self.commas) - 1
+        first = self.first_comma[rows]
+        start = self.commas[np.minimum(first + 2, last)] + 1
+        end = self.commas[np.minimum(first + 3, last)]
+        valid = (first + 3 <= last) & (end < self.ends[rows])
+        lengths = np.where(valid, end - start, 0)
+        width = max(int(lengths.max(initial=0)), 1)
+        offsets = np.arange(width)
+        codes = self.buf[np.minimum(start[:, None] + offsets, len(self.buf) - 1)]
+        codes = np.where(offsets < lengths[:, None], codes, 0).astype(np.uint8)
+        return np.ascontiguousarray(codes).view(f"S{width}").ravel(), valid
+
+    def of_type(
+            self,
+            record_type: bytes
+    ) -> np.ndarray:
+        """ the rows of the lines of a record type """
+        mask = np.ones(len(self), dtype=bool)
+        for k, c in enumerate(record_type):
+            mask &= self.buf[self.starts + k] == c
+        return np.flatnonzero(mask)
+
+    def rows(
+            self,
+            record_type: bytes,
+            symbols: Optional[np.ndarray]
+    ) -> np.ndarray:
+        """ the rows of the lines of a record type of the symbols, every symbol if None, masked before the parse """
+        rows = self.of_type(record_type)
+        codes, valid = self.symbols(rows)
+        if symbols is None:
+            return rows[valid]
+        return rows[valid & np.isin(codes, symbols)]
+
+    def text(
+            self,
+            rows: np.ndarray
+    ) -> bytes:
+        """ the lines of rows """
+        data = self.data
+        return b"\n".join([data[s:e] for s, e in zip(self.starts[rows].tolist(), self.ends[rows].tolist())])
+
+
+def _parse(
+        lines: _Lines,
+        rows: np.ndarray,
+        n_fields: int,
+        ints: tuple[int, ...]
+) -> pd.DataFrame:
+    """ the fields after the record type of the lines of rows, by index """
+    dtype = {i: np.float64 for i in range(4, n_fields)}
+    dtype.update({i: np.int64 for i in ints})
+    dtype[3] = str
+    # the data time is the one long field of a line, the floats are read by the faster converter
+    # unless a float may be of more than 15 significant digits
+    precision = "high" if lines.long_fields[rows].sum() <= len(rows) else "round_trip"
+    return pd.read_csv(io.BytesIO(lines.text(rows)), header=None, names=range(n_fields), usecols=range(1, n_fields),
+                       dtype=dtype, float_precision=precision)
+
+
+def _chunks(
+        path: str,
+        chunk_size: int
+) -> Iterator[tuple[np.ndarray, _Lines]]:
+    """ (the line of each line in the file, the lines) of the whole lines of each chunk_size bytes read """
+    first = 0
+    rest = b""
+    with open(path, "rb") as f:
+        while data := f.read(chunk_size):
+            data = rest + data
+            end = data.rfind(b"\n") + 1
+            rest = data[end:]
+            if end == 0:
+                continue
+            lines = _Lines(data[:end])
+            yield np.arange(first, first + len(lines)), lines
+            first += len(lines)
+    if rest:
+        yield np.arange(first, first + 1), _Lines(rest + b"\n")
+
+
+def read_chunks(
+        path: str,
+        symbols: Optional[Collection[str]],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        order_books: bool = True,
+        index: Optional["SymbolIndex"] = None
+) -> Iterator[tuple[Optional[TickChunk], Optional[OrderBookChunk]]]:
+    """
+    read a csv file of ticks and order books a chunk at a time
+
+    Args:
+        path: the csv file
+        symbols: the symbol codes kept, every symbol if None
+        chunk_size: the bytes read at a time
+        order_books: parse the order books, None for every chunk if false
+        index: read the lines of the symbols only, at the offsets of the index of the file,
+            see `A.adapter.backtest.index`
+
+    Returns:
+        Iterator: (ticks, order books) of each chunk, None if the chunk has no such record of the symbols
+    """
+    chunks = _chunks(path, chunk_size) if index is None else index.chunks(path, symbols, chunk_size)
+    if symbols is not None:
+        symbols = np.array([symbol_code.encode("utf-8") for symbol_code in symbols], dtype=bytes)
+    for numbers, lines in chunks:
+        ticks = None
+        rows = lines.rows(b"[tick],", symbols)
+        if len(rows):
+            # a trailing comma is an empty field after the price levels
+            n_fields = max(TICK_FIELDS, int(lines.n_fields[rows].max()))
+            ticks = _tick_chunk(_parse(lines, rows, n_fields, _TICK_INTS), numbers[rows])
+
+        books = None
+        rows = lines.rows(b"[orderbook],", symbols) if order_books else []
+        if len(rows):
+            n_fields = int(lines.n_fields[rows].max())
+            books = _order_book_chunk(_parse(lines, rows, n_fields, _ORDER_BOOK_INTS), numbers[rows])
+
+        yield ticks, books
@@ -0,0 +1,323 @@
+"""
+Columnar store of the ticks and order books of the backtest csv files.
+
+A trading day is converted once from its csv file, then read without any
+parsing: every field is a `.npy` array opened with `np.load(mmap_mode="r")`,
+so loading a day costs the page faults of the rows read::
+
+    root/<day>/manifest.json
+    root/<day>/tick/<field>.npy         one per `TICK_COLUMNS`
+    root/<day>/orderbook/<field>.npy    one per `ORDER_BOOK_COLUMNS`
+
+The rows are grouped by symbol, in file order within a symbol, and the
+manifest keeps the rows of each symbol, so the days are read for the
+subscribed symbols only. `TickStore.read_chunks` puts the rows of a window
+of lines back in file order and yields the same chunks as the csv loader,
+which `StockMD` replays the same way.
+
+    python -m A.adapter.backtest.tickstore /data/ticks /data/tick_store
+"""
+import os
+import json
+import shutil
+import argparse
+
+import numpy as np
+
+from A.log import logger
+from A.data.cache import file_digest
+
+from .loader import DEFAULT_CHUNK_SIZE, TICK_COLUMNS, ORDER_BOOK_COLUMNS, TickChunk, OrderBookChunk
+from .loader import read_chunks as read_csv_chunks
+
+from glob import glob
+from typing import Collection, Iterator, Optional
+
+# the file of the manifest of a day
+MANIFEST = "manifest.json"
+# the version of the layout of a day, a day of another version is converted again
+VERSION = 1
+# the lines of the source file read at a time
+DEFAULT_CHUNK_LINES = 1 << 16
+
+# (record type, its columns, its chunk), the columns of a record type are in the directory of its name
+_RECORDS = (
+    ("tick", TICK_COLUMNS, TickChunk),
+    ("orderbook", ORDER_BOOK_COLUMNS, OrderBookChunk),
+)
+
+
+def _concat_columns(
+        chunks: list,
+        columns: tuple[str, ...]
+) -> dict[str, np.ndarray]:
+    """ the columns of the chunks concatenated, the order book levels padded with NaN to the widest """
+    ret = dict()
+    for name in ("symbol_code", *columns):
+        parts = [getattr(chunk, name) for chunk in chunks]
+        if name == "levels":
+            width = max(part.shape[1] for part in parts)
+            parts = [np.pad(part, ((0, 0), (0, width - part.shape[1])), constant_values=np.nan) for part in parts]
+        ret[name] = np.concatenate(parts)
+    return ret
+
+
+class TickStore:
+    """
+    The columnar days of the backtest csv files, see the module.
+
+    A day is valid while its source file has the same digest, like the days
+    of `A.data.BarCache`, the file is only hashed again when its size or its
+    modification time changed.
+    """
+
+    def __init__(
+            self,
+            root: str
+    ) -> None:
+        """
+        Args:
+            root: the store directory, created if missing
+        """
+        os.makedirs(root, exist_ok=True)
+        self._root: str = root
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    def _day_path(self, day: str) -> str:
+        return os.path.join(self._root, day)
+
+    def manifest_path(self, day: str) -> str:
+        return os.path.join(self._root, day, MANIFEST)
+
+    def days(self) -> list[str]:
+        """ the trading days converted, in order """
+        return sorted(os.path.basename(os.path.dirname(path)) for path in glob(self.manifest_path("*")))
+
+    def manifest(
+            self,
+            day: str
+    ) -> Optional[dict]:
+        """ the manifest of a day, None if the day is not converted """
+        try:
+            with open(self.manifest_path(day), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifest if manifest.get("version") == VERSION else None
+
+    def is_valid(
+            self,
+            day: str,
+            source_path: str
+    ) -> bool:
+        """ whether the day was converted from the current content of the source file """
+        manifest = self.manifest(day)
+        if manifest is None:
+            return False
+        stat = os.stat(source_path)
+        if manifest["size"] == stat.st_size and manifest["mtime_ns"] == stat.st_mtime_ns:
+            return True
+        return manifest["size"] == stat.st_size and file_digest(source_path) == manifest["digest"]
+
+    def convert(
+            self,
+            source_path: str,
+            day: Optional[str] = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> dict:
+        """
+        convert a csv file of ticks and order books, a day converted before is replaced,
+        the day is converted in memory
+
+        Args:
+            source_path: the csv file
+            day: the trading day, the file name without extension if None
+            chunk_size: the bytes of the csv file read at a time
+
+        Returns:
+            dict: the manifest of the day
+        """
+        if day is None:
+            day = os.path.splitext(os.path.basename(source_path))[0]
+        stat = os.stat(source_path)
+        digest = file_digest(source_path)
+
+        chunks = ([], [])
+        for ticks, books in read_csv_chunks(source_path, None, chunk_size):
+            for chunk, parts in zip((ticks, books), chunks):
+                if chunk is not None:
+                    parts.append(chunk)
+
+        tmp = f"{self._day_path(day)}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        lines = 0
+        # symbol code -> record type -> [first row, end row]
+        symbols: dict[str, dict[str, list[int]]] = dict()
+        counts = dict()
+        for (record_type, columns, _), parts in zip(_RECORDS, chunks):
+            os.makedirs(os.path.join(tmp, record_type))
+            counts[record_type] = sum(len(part) for part in parts)
+            if not parts:
+                continue
+            values = _concat_columns(parts, columns)
+            lines = max(lines, int(values["line"][-1]) + 1)
+            # the rows of a symbol together, in file order
+            order = np.argsort(values["symbol_code"], kind="stable")
+            codes, starts, sizes = np.unique(values["symbol_code"][order], return_index=True, return_counts=True)
+            for symbol_code, start, size in zip(codes.tolist(), starts.tolist(), sizes.tolist()):
+                symbols.setdefault(symbol_code, dict())[record_type] = [start, start + size]
+            for name in columns:
+                np.save(os.path.join(tmp, record_type, f"{name}.npy"), values[name][order])
+
+        manifest = dict(version=VERSION, day=day, source=os.path.abspath(source_path), digest=digest,
+                        size=stat.st_size, mtime_ns=stat.st_mtime_ns, lines=lines, ticks=counts["tick"],
+                        order_books=counts["orderbook"], symbols=symbols)
+        with open(os.path.join(tmp, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        shutil.rmtree(self._day_path(day), ignore_errors=True)
+        os.replace(tmp, self._day_path(day))
+        return manifest
+
+    def columns(
+            self,
+            day: str,
+            record_type: str = "tick"
+    ) -> dict[str, np.ndarray]:
+        """
+        the memory mapped columns of a day, grouped by symbol, see `manifest`
+
+        Args:
+            day: the trading day
+            record_type: `tick` or `orderbook`
+
+        Returns:
+            dict: field name -> the read only array, empty if the day has no record of the type
+        """
+        columns = {name: fields for name, fields, _ in _RECORDS}[record_type]
+        ret = dict()
+        for name in columns:
+            path = os.path.join(self._day_path(day), record_type, f"{name}.npy")
+            if not os.path.exists(path):
+                return dict()
+            ret[name] = np.load(path, mmap_mode="r")
+        return ret
+
+    def read_chunks(
+            self,
+            day: str,
+            symbols: Collection[str],
+            chunk_lines: int = DEFAULT_CHUNK_LINES,
+            order_books: bool = True
+    ) -> Iterator[tuple[Optional[TickChunk], Optional[OrderBookChunk]]]:
+        """
+        read a day a window of lines of its source file at a time
+
+        Args:
+            day: the trading day
+            symbols: the symbol codes kept
+            chunk_lines: the lines of the source file of a window
+            order_books: read the order books, None for every chunk if false
+
+        Returns:
+            Iterator: (ticks, order books) of each window, in file order, None if the window has no
+                such record of the symbols, the chunks of `A.adapter.backtest.loader.read_chunks`
+
+        Raises:
+            FileNotFoundError: the day is not converted
+        """
+        manifest = self.manifest(day)
+        if manifest is None:
+            raise FileNotFoundError(f"day {day} not in the tick store {self._root}.")
+        edges = np.arange(0, manifest["lines"] + chunk_lines, chunk_lines)
+
+        # per record type: the symbol codes, the first row of each in each window and the columns
+        readers = []
+        for record_type, columns, chunk in _RECORDS:
+            if record_type == "orderbook" and not order_books:
+                readers.append(None)
+                continue
+            values = self.columns(day, record_type)
+            ranges = [(symbol_code, manifest["symbols"][symbol_code][record_type]) for symbol_code in symbols
+                      if record_type in manifest["symbols"].get(symbol_code, {})]
+            if not values or not ranges:
+                readers.append(None)
+                continue
+            codes = np.array([symbol_code for symbol_code, _ in ranges], dtype=object)
+            # symbol -> the row of the first line of each window, from the lines of its rows
+            bounds = np.array([start + np.searchsorted(values["line"][start:end], edges)
+                               for _, (start, end) in ranges])
+            readers.append((codes, bounds, values, columns, chunk))
+
+        for k in range(len(edges) - 1):
+            ret = []
+            for reader in readers:
+                if reader is None:
+                    ret.append(None)
+                    continue
+                codes, bounds, values, columns, chunk = reader
+                starts, sizes = bounds[:, k], bounds[:, k + 1] - bounds[:, k]
+                total = int(sizes.sum())
+                if total == 0:
+                    ret.append(None)
+                    continue
+                # the rows of the window, then in file order
+                offsets = np.repeat(starts - np.cumsum(sizes) + sizes, sizes)
+                rows = offsets + np.arange(total)
+                symbol_code = np.repeat(codes, sizes)
+                order = np.argsort(values["line"][rows], kind="stable")
+                rows = rows[order]
+                arrays = {name: values[name][rows] for name in columns}
+                arrays["symbol_code"] = symbol_code[order]
+                ret.append(chunk(arrays))
+            yield ret[0], ret[1]
+
+
+def convert(
+        source_path: str,
+        root: str,
+        force: bool = False
+) -> list[str]:
+    """
+    convert a csv file, or the daily csv files of a directory, into a tick store
+
+    Args:
+        source_path: a csv file, or a directory of daily csv files
+        root: the store directory
+        force: convert the days already converted from the same content again
+
+    Returns:
+        list[str]: the trading days converted
+    """
+    if os.path.isdir(source_path):
+        files = sorted(glob(os.path.join(source_path, "*.csv")))
+    else:
+        files = [source_path]
+
+    store = TickStore(root)
+    days = []
+    for file_path in files:
+        day = os.path.splitext(os.path.basename(file_path))[0]
+        if not force and store.is_valid(day, file_path):
+            continue
+        manifest = store.convert(file_path, day)
+        logger.info(f"<TickStore> {file_path} -> {store.root}/{day}: {manifest['ticks']} ticks, "
+                    f"{manifest['order_books']} order books")
+        days.append(day)
+    return days
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="convert the backtest csv files into a columnar tick store.")
+    parser.add_argument("source_path", help="a csv file, or a directory of daily csv files.")
+    parser.add_argument("root", help="the tick store directory.")
+    parser.add_argument("--force", action="store_true", help="convert the days already converted again.")
+    args = parser.parse_args()
+    convert(args.source_path, args.root, args.force)
+
+
+if __name__ == "__main__":
+    main()
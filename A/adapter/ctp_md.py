@@ -4,54 +4,45 @@ import time
 import yaml
 import pandas as pd
 
-from A.types import Price, EventType, Event, StrategyType
+from A.types import Price, EventType, Event, StrategyType, clock_to_ns
 from A.types.futures import Snapshot
-from numpy import char as nchar
 from datetime import datetime
+from typing import Optional
 from ctpwrapper import MdApiPy, ApiStructure
 from ctpwrapper.ApiStructure import DepthMarketDataField
-from multiprocessing import Queue
 
 from A.log import logger
-from A.data import KLineHandle
+from A.transport import BatchQueue
+from A.data import KLineHandle, BarSpill, Retention, futures_calendar, memory_report, retention_options
 
 TODAY_DT = datetime.today()
 TODAY_DT_STR = TODAY_DT.strftime('%Y%m%d')
 
 
-def message_process(
-        df: pd.DataFrame
-) -> pd.DataFrame:
-    data_df = df.rename(columns={
-        'InstrumentID': 'symbol_code',
-        'TradingDay': 'date',
-        'LastPrice': 'last_price',
-        'UpdateMillisec': 'last_modified_mil',
-        'UpdateTime': 'last_modified',
-        'Volume': 'volume',
-    })
-    last_modified_arr = data_df.last_modified.to_numpy(dtype=str)
-    last_modified_mil_arr = data_df.last_modified_mil.to_numpy(dtype=str)
-    last_modified_full_arr = nchar.add(nchar.add(last_modified_arr, '.'), last_modified_mil_arr)
-
-    data_df.loc[:, 'last_modified_full'] = pd.to_datetime(last_modified_full_arr, format='%H:%M:%S.%f').time
-    data_df.loc[:, 'last_modified'] = pd.to_datetime(last_modified_arr, format='%H:%M:%S').time
-
-    return data_df
-
-
 class MarketSpi(MdApiPy):
 
     def __init__(
             self,
             config: dict,
-            queue: Queue,
+            queue: BatchQueue,
             *args,
+            retention: Retention = Retention.NONE,
+            keep: int = 0,
+            spill: Optional[BarSpill] = None,
             **kwargs
     ) -> None:
+        """
+        Args:
+            config: the futures config
+            queue: the event writer
+            retention: the bars kept by the `KLineHandle` of each instrument, the bars are put
+                onto the queue either way
+            keep: the number of bars kept with `Retention.LAST` and `Retention.SPILL`
+            spill: the file of the bars with `Retention.SPILL`
+        """
         super().__init__(*args, **kwargs)
         self._login = False
-        self._queue: Queue = queue
+        self._queue: BatchQueue = queue
 
         self._broker_id = config["broker_id"]
         self._investor_id = config["investor_id"]
@@ -64,6 +55,22 @@ class MarketSpi(MdApiPy):
         self._request_id = 0
         self._source_cache = {}
         self._kline_handle_map: dict[str, KLineHandle] = dict()
+        # the last total traded volume of each instrument
+        self._total_volume_map: dict[str, int] = dict()
+        self._retention: Retention = retention
+        self._keep: int = keep
+        self._spill: Optional[BarSpill] = spill
+
+    def memory_report(self) -> dict:
+        """ the memory held by the bars of the instruments, see `A.data.memory_report` """
+        return memory_report(self._kline_handle_map.values())
+
+    def close_bars(self) -> None:
+        """ close the pending bars and the spill file """
+        for k in self._kline_handle_map.values():
+            k.flush()
+        if self._spill is not None:
+            self._spill.close()
 
     def is_login(self) -> bool:
         return self._login
@@ -73,6 +80,7 @@ class MarketSpi(MdApiPy):
         event.data = bar
         event.ex_type = StrategyType.FUTURES
         event.event_type = EventType.KLINE_DATA
+        event.ingress_ns = time.monotonic_ns()
         self._queue.put(event)
 
     @property
@@ -138,10 +146,12 @@ class MarketSpi(MdApiPy):
         :param depth_market_data:
         :return:
         """
+        ingress_ns = time.monotonic_ns()
         symbol_code = depth_market_data.InstrumentID
 
         tick_data = Snapshot()
         tick_data.instrument_id = depth_market_data.InstrumentID
+        tick_data.symbol_code = symbol_code
         tick_data.last_price = Price(depth_market_data.LastPrice)
         tick_data.open_price = Price(depth_market_data.OpenPrice)
         tick_data.high_price = Price(depth_market_data.HighestPrice)
@@ -179,15 +189,20 @@ class MarketSpi(MdApiPy):
         event.data = tick_data
         event.ex_type = StrategyType.FUTURES
         event.event_type = EventType.SNAPSHOT_DATA
+        event.ingress_ns = ingress_ns
         self._queue.put(event)
 
-        df = pd.DataFrame([depth_market_data.to_dict()])
         if symbol_code in self._source_cache:
-            self._source_cache[symbol_code].append(df)
+            self._source_cache[symbol_code].append(depth_market_data.to_dict())
         else:
-            self._source_cache[symbol_code] = [df]
+            self._source_cache[symbol_code] = [depth_market_data.to_dict()]
 
-        self._kline_handle_map[symbol_code].do(message_process(df))
+        total_volume = depth_market_data.Volume
+        volume = total_volume - self._total_volume_map.get(symbol_code, 0)
+        self._total_volume_map[symbol_code] = total_volume
+        self._kline_handle_map[symbol_code].do(depth_market_data.LastPrice, volume,
+                                               clock_to_ns(depth_market_data.UpdateTime,
+                                                           depth_market_data.UpdateMillisec))
 
     def OnRspSubMarketData(
             self,
@@ -210,7 +225,8 @@ class MarketSpi(MdApiPy):
         # print("pRspInfo:", rsp_info)
         # print("pSpecificInstrument:", specific_instrument)
         instrument_id = specific_instrument.InstrumentID
-        k = KLineHandle(instrument_id)
+        k = KLineHandle(instrument_id, calendar=futures_calendar(instrument_id), retention=self._retention,
+                        keep=self._keep, spill=self._spill)
         k.subscribe(self.on_bar)
         self._kline_handle_map[instrument_id] = k
 
@@ -247,7 +263,7 @@ class MarketSpi(MdApiPy):
             suffix = ''
 
         for symbol_code, value in self._source_cache.items():
-            df = pd.concat(value)
+            df = pd.DataFrame(value)
             df.to_csv(f'{TODAY_DT_STR}/{symbol_code}{suffix}.csv', encoding='utf-8')
 
     def __del__(self):
@@ -256,7 +272,7 @@ class MarketSpi(MdApiPy):
 
 def start(
         config_path: str,
-        queue: Queue,
+        queue: BatchQueue,
         sub_instrument_id: list[str]
 ) -> None:
     """ 创建并启动 CTP 实例
@@ -270,7 +286,7 @@ def start(
     market_servers = config["md_server"]
 
     logger.info("start create the futures instance.")
-    market = MarketSpi(config, queue)
+    market = MarketSpi(config, queue, **retention_options(config))
     market.Create("./cache")
 
     for server in market_servers:
@@ -297,6 +313,8 @@ def start(
         pass
     finally:
         market.save()
+        market.close_bars()
+        logger.info(f"<CTP> bar memory {market.memory_report()}")
         logger.info("futures work done.")
 
 
@@ -0,0 +1,78 @@
+"""
+Run a market data adapter as a ZeroMQ publisher.
+
+One adapter process logs into the broker (or replays the CSV files) and
+publishes to any number of `AF` engines started with
+`AFOptional.transport = Transport.ZMQ`, on this host or others.
+
+    python -m A.adapter.publish future config/ctp_config.yaml tcp://*:5555 IF2202 IH2202
+    python -m A.adapter.publish backtest config/csv_config.yaml ipc:///tmp/af.md 601919.SH --wait 1
+"""
+import time
+import argparse
+
+from A.log import logger
+from A.transport import MarketPublisher
+
+from .ctp_md import start as ctp_start
+from .xtp_md import start as xtp_start
+from .backtest import stock_start
+
+START_FUNCS = dict(
+    future=ctp_start,
+    stock=xtp_start,
+    backtest=stock_start,
+)
+
+
+def publish(
+        market: str,
+        config_path: str,
+        endpoint: str,
+        symbols: list[str],
+        wait: float = .0
+) -> None:
+    """
+    start the adapter of market with a publisher as its event queue
+
+    Args:
+        market: `future`, `stock` or `backtest`
+        config_path: the config path of the adapter
+        endpoint: the endpoint to bind
+        symbols: the symbol codes to subscribe
+        wait: the seconds to wait for the subscribers to connect before the adapter starts,
+            ZeroMQ drops what is published before a subscriber is connected.
+
+    Returns:
+        None
+
+    Raises:
+        KeyError: unknown market
+    """
+    start_func = START_FUNCS[market]
+    publisher = MarketPublisher(endpoint)
+    logger.info(f"publish {market} market data on {endpoint}.")
+    try:
+        if wait > 0:
+            # bind now so that the subscribers can connect while waiting
+            publisher.bind()
+            time.sleep(wait)
+        start_func(config_path, publisher, symbols)
+    finally:
+        publisher.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="publish the market data of an adapter with ZeroMQ.")
+    parser.add_argument("market", choices=sorted(START_FUNCS))
+    parser.add_argument("config_path")
+    parser.add_argument("endpoint")
+    parser.add_argument("symbols", nargs="*")
+    parser.add_argument("--wait", type=float, default=.0,
+                        help="seconds to wait for the subscribers before the adapter starts.")
+    args = parser.parse_args()
+    publish(args.market, args.config_path, args.endpoint, args.symbols, args.wait)
+
+
+if __name__ == "__main__":
+    main()
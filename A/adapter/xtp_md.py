@@ -1,31 +1,64 @@
 import os
 import sys
+import time
 import yaml
-import pandas as pd
 
 from A.log import logger
+from A.transport import BatchQueue
 from A.sdk.xtp import QuoteApi
-from A.data import KLineHandle
+from A.data import KLineHandle, BarSpill, Retention, memory_report, retention_options
 from A.types.stock import Snapshot
-from A.types import StrategyType
+from A.types import StrategyType, compact_to_ns
 from A.types import KLine, EventType, Event
 from A.sdk.xtp import XTP_EXCHANGE_TYPE, XTP_LOG_LEVEL
 
 from datetime import datetime
-from multiprocessing import Queue
+from typing import Optional
+
+EXCHANGE_SUFFIX: dict[int, str] = {
+    XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH: "SH",
+    XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SZ: "SZ",
+}
 
 
 class Md(QuoteApi):
 
     def __init__(
             self,
-            queue: Queue
+            queue: BatchQueue,
+            retention: Retention = Retention.NONE,
+            keep: int = 0,
+            spill: Optional[BarSpill] = None
     ) -> None:
+        """
+        Args:
+            queue: the event writer
+            retention: the bars kept by the `KLineHandle` of each symbol, the bars are put
+                onto the queue either way
+            keep: the number of bars kept with `Retention.LAST` and `Retention.SPILL`
+            spill: the file of the bars with `Retention.SPILL`
+        """
         super().__init__()
         self.trading_day = '-'
         self.data = {}
         self._queue = queue
         self._kline_handle_map: dict[str, KLineHandle] = {}
+        # the last total traded volume of each symbol
+        self._total_volume_map: dict[str, int] = {}
+        self._retention: Retention = retention
+        self._keep: int = keep
+        self._spill: Optional[BarSpill] = spill
+
+    def memory_report(self) -> dict:
+        """ the memory held by the bars of the symbols, see `A.data.memory_report` """
+        return memory_report(self._kline_handle_map.values())
+
+    def close_bars(self) -> None:
+        """ close the pending bars and the spill file """
+        for k in self._kline_handle_map.values():
+            k.flush()
+        if self._spill is not None:
+            self._spill.close()
 
     def on_bar(
             self,
@@ -35,6 +68,7 @@ class Md(QuoteApi):
         event.data = bar
         event.ex_type = StrategyType.STOCK
         event.event_type = EventType.KLINE_DATA
+        event.ingress_ns = time.monotonic_ns()
         self._queue.put(event)
 
     def on_disconnected(
@@ -106,7 +140,16 @@ class Md(QuoteApi):
         """
         深度行情通知,包含买一卖一队列
         """
+        ingress_ns = time.monotonic_ns()
+        # the same `601919.SH` style symbol code as the strategies subscribe
+        symbol_code = f"{str(market_data['ticker']).strip()}.{EXCHANGE_SUFFIX.get(market_data['exchange_id'], '')}"
+
         tick = Snapshot(**market_data)
+        tick.symbol_code = symbol_code
+        # the `%Y%m%d%H%M%S%f` integer of XTP as a time stamp
+        tick.data_time = compact_to_ns(market_data['data_time'])
+        tick.total_trade_volume = market_data['qty']
+        tick.total_trade_turnover = market_data['turnover']
         tick.bid1_qty = bid1_qty
         tick.bid1_count = bid1_count
         tick.max_bid1_count = max_bid1_count
@@ -117,23 +160,19 @@ class Md(QuoteApi):
         event.data = tick
         event.ex_type = StrategyType.STOCK
         event.event_type = EventType.SNAPSHOT_DATA
+        event.ingress_ns = ingress_ns
         self._queue.put(event)
 
-        df = pd.DataFrame([market_data])
-        df['date'] = self.trading_day
-        df = df.rename(columns={
-            "ticker": "symbol_code",
-        })
-        df.loc[:, 'last_modified_full'] = pd.to_datetime(df['data_time'], format="%Y%m%d%H%M%S%f").dt.time
-
-        symbol_code = str(market_data['ticker']).strip()
         if symbol_code not in self._kline_handle_map:
-            k = KLineHandle(symbol_code)
+            k = KLineHandle(symbol_code, retention=self._retention, keep=self._keep, spill=self._spill)
             k.subscribe(self.on_bar)
             self._kline_handle_map[symbol_code] = k
         else:
             k = self._kline_handle_map[symbol_code]
-        k.do(df)
+        total_volume = market_data['qty']
+        volume = total_volume - self._total_volume_map.get(symbol_code, 0)
+        self._total_volume_map[symbol_code] = total_volume
+        k.do(market_data['last_price'], volume, tick.data_time)
 
     def on_subscribe_all_market_data(
             self,
@@ -168,7 +207,7 @@ class Md(QuoteApi):
 
 def start(
         config_path: str,
-        queue: Queue,
+        queue: BatchQueue,
         sub_symbol_codes: list[str]
 ) -> None:
     xtp_config = yaml.safe_load(open(config_path, encoding="utf-8"))
@@ -179,7 +218,7 @@ def start(
     PROTOCOL_TYPE = xtp_config["socket_type"]
     CLIENT_ID = xtp_config["client_id"]
 
-    md = Md(queue)
+    md = Md(queue, **retention_options(xtp_config))
     md.create_quote_api(CLIENT_ID, os.getcwd(), XTP_LOG_LEVEL.XTP_LOG_LEVEL_DEBUG)
     if md.login(HOST, PORT, USER, PASS, PROTOCOL_TYPE, "0") != 0:
         logger.error(f"XTP Login failed! {md.get_api_last_error()}")
@@ -232,6 +271,8 @@ def start(
     while int(datetime.now().strftime("%H%M%S")) <= 999999: #<= 150200:
         pass
 
+    md.close_bars()
+    logger.info(f"XTP bar memory {md.memory_report()}")
     logger.info("XTP Work Done.")
 
 
@@ -10,6 +10,21 @@ class Strategy(ABC):
         self._type = ...
         self._sub_codes: list[str] = list()
         self.af: Optional[A.AF] = None
+        # with `AFOptional.workers`, a copy of the strategy runs in every worker and
+        # receives the symbols of that worker only, otherwise it runs in one worker
+        self.shard_by_symbol: bool = False
+        # the intervals in seconds of the bars received by `on_bar`, the intervals above the
+        # 60 seconds bars of the adapters are rolled up from them, see `A.data.BarRollup`
+        self.bar_intervals: list[int] = [60]
+        # the volume, turnover and tick count bars received by `on_bar`, as (bar type, bar size),
+        # built by the engine from the snapshots, see `A.data.ActivityBars`
+        self.activity_bars: list[tuple[A.types.BarType, float]] = []
+        # the indicators updated by the engine before `on_bar`, shared by the strategies declaring
+        # the same node, read with `self.af.indicators.value(node, symbol_code)`, see `A.indicator.Node`
+        self.indicators: list[A.indicator.Node] = []
+        # with `A.runner.BacktestRunner`, the strategy keeps state from a trading day to the next and
+        # is run over all the days in one process, otherwise every day runs with a fresh copy of it
+        self.carry_state: bool = False
 
     def type(self):
         return self._type
@@ -22,6 +37,10 @@ class Strategy(ABC):
     def sub_symbol_code(self, symbol_code: list[str]):
         self._sub_codes += symbol_code
 
+    def result(self):
+        """ the outcome of the strategy at the end of a backtest, picklable, see `A.runner.BacktestReport` """
+        return None
+
     def on_bar(self, bar):
         raise NotImplementedError
 
@@ -1 +1,10 @@
-from .kline import KLineHandle
+from .calendar import SessionCalendar, calendar_of, futures_calendar
+from A.types import time_to_ns, ns_to_time
+
+from .kline import KLineHandle, Retention, build_klines
+from .spill import BarSpill, retention_options, memory_report
+from .store import BarStore, BarBuffer
+from .rollup import BarRollup
+from .activity import ActivityBars
+from .cache import BarCache, bar_records
+from .ops import Expression, Feature, Factors
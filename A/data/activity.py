@@ -0,0 +1,200 @@
+from A.types import NS_PER_DAY, BarType, KLine, Price, StrategyType, clock_to_ns
+
+from typing import Iterable, Optional
+
+from .kline import create_kline
+
+
+def _price(value) -> float:
+    return value._price / 1000 if isinstance(value, Price) else float(value)
+
+
+class _Pending:
+    """ the state of the pending bar of a (symbol, bar type, bar size) """
+
+    __slots__ = ("open", "high", "low", "close", "volume", "turnover", "count", "start_time", "end_time")
+
+    def __init__(
+            self,
+            price: float,
+            tick_time: int
+    ) -> None:
+        self.open = self.high = self.low = self.close = price
+        self.volume = 0
+        self.turnover = .0
+        self.count = 0
+        self.start_time = tick_time
+        self.end_time = tick_time
+
+
+class ActivityBars:
+    """
+    Builds the volume, turnover and tick count bars of the symbols.
+
+    The bars are built by the engine from the snapshots in O(1) per
+    snapshot and bar kind, and handed to `on_bar` as `KLine` like the time
+    bars, with the `bar_type` and `bar_size` they are routed by, see
+    `Strategy.activity_bars`. A bar is closed by the snapshot that brings
+    its volume, turnover or number of snapshots to the bar size, the
+    snapshot is not split, so a large trade ends in one bar larger than
+    the size. The bars are labeled with the time of their last snapshot.
+
+    The volume and turnover are the differences of the day totals of the
+    snapshots, from 0 at the first snapshot of a symbol, so a snapshot lost
+    to `Overflow.CONFLATE` does not lose its volume, only its count in the
+    tick bars. A day total going down starts a new day and closes the
+    pending bars of the symbol.
+    """
+
+    # the measure of the bar size
+    _MEASURES = {
+        BarType.VOLUME: "volume",
+        BarType.TURNOVER: "turnover",
+        BarType.TICK: "count",
+    }
+
+    def __init__(
+            self,
+            specs: Iterable[tuple[BarType, float]]
+    ) -> None:
+        """
+        Args:
+            specs: the (bar type, bar size) of the bars to build
+
+        Raises:
+            ValueError: a bar type is `BarType.TIME`, or a bar size is not positive
+        """
+        specs = sorted(set(specs), key=lambda x: (x[0].value, x[1]))
+        for bar_type, bar_size in specs:
+            if bar_type not in self._MEASURES:
+                raise ValueError(f"{bar_type} bars are not activity bars.")
+            if bar_size <= 0:
+                raise ValueError(f"{bar_type} bar size must be positive, got {bar_size}.")
+        self._specs: list[tuple[BarType, float]] = specs
+        # (symbol code, bar type, bar size) -> the pending bar
+        self._pending: dict[tuple[str, BarType, float], _Pending] = dict()
+        # (symbol code, bar type, bar size) -> the close of the last bar closed
+        self._last_close: dict[tuple[str, BarType, float], float] = dict()
+        # symbol code -> the day totals of volume and turnover of the last snapshot
+        self._totals: dict[str, tuple[float, float]] = dict()
+
+    @property
+    def specs(self) -> list[tuple[BarType, float]]:
+        return list(self._specs)
+
+    def _close(
+            self,
+            key: tuple[str, BarType, float]
+    ) -> KLine:
+        pending = self._pending.pop(key)
+        if pending.open > pending.close:
+            style = -1
+        elif pending.open < pending.close:
+            style = 1
+        else:
+            style = 0
+
+        change_percent = .0
+        if (last_close := self._last_close.get(key)) is not None and last_close != 0:
+            change_percent = ((pending.close / last_close) - 1) * 100
+        self._last_close[key] = pending.close
+
+        bar = create_kline(
+            symbol_code=key[0],
+            open_price=pending.open,
+            close_price=pending.close,
+            high_price=pending.high,
+            low_price=pending.low,
+            volume=pending.volume,
+            change_percent=change_percent,
+            start_time=pending.start_time,
+            end_time=pending.end_time,
+            time=pending.end_time,
+            style=style,
+            interval=0,
+        )
+        bar.turnover = pending.turnover
+        bar.bar_type = key[1]
+        bar.bar_size = key[2]
+        return bar
+
+    def update(
+            self,
+            symbol_code: str,
+            price: float,
+            total_volume: float,
+            total_turnover: float,
+            tick_time: int
+    ) -> list[KLine]:
+        """
+        add a snapshot
+
+        Args:
+            symbol_code: the symbol code
+            price: the last price
+            total_volume: the volume traded in the day
+            total_turnover: the turnover traded in the day
+            tick_time: the exchange time of the snapshot, nanoseconds of the day
+
+        Returns:
+            list[KLine]: the bars closed by the snapshot
+        """
+        ret = []
+        last = self._totals.get(symbol_code, (0, .0))
+        if total_volume < last[0]:
+            # a new day
+            ret += self.flush(symbol_code)
+            last = (0, .0)
+        volume = total_volume - last[0]
+        turnover = total_turnover - last[1]
+        self._totals[symbol_code] = (total_volume, total_turnover)
+
+        for bar_type, bar_size in self._specs:
+            key = (symbol_code, bar_type, bar_size)
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = _Pending(price, tick_time)
+            elif price > pending.high:
+                pending.high = price
+            elif price < pending.low:
+                pending.low = price
+            pending.close = price
+            pending.volume += volume
+            pending.turnover += turnover
+            pending.count += 1
+            pending.end_time = tick_time
+
+            if getattr(pending, self._MEASURES[bar_type]) >= bar_size:
+                ret.append(self._close(key))
+
+        return ret
+
+    def update_snapshot(
+            self,
+            ex_type: StrategyType,
+            snapshot
+    ) -> list[KLine]:
+        """
+        add a stock or futures snapshot, see `update`
+
+        Args:
+            ex_type: the market of the snapshot
+            snapshot: the `A.types.StockSnapshot` or `A.types.FuturesSnapshot`
+
+        Returns:
+            list[KLine]: the bars closed by the snapshot
+        """
+        if ex_type == StrategyType.FUTURES:
+            tick_time = clock_to_ns(snapshot.update_time, snapshot.update_ms)
+            return self.update(snapshot.symbol_code, _price(snapshot.last_price),
+                               snapshot.volume, _price(snapshot.turnover), tick_time)
+
+        return self.update(snapshot.symbol_code, snapshot.last_price, snapshot.total_trade_volume,
+                           snapshot.total_trade_turnover, snapshot.data_time % NS_PER_DAY)
+
+    def flush(
+            self,
+            symbol_code: Optional[str] = None
+    ) -> list[KLine]:
+        """ close the pending bars of a symbol, of every symbol if None """
+        return [self._close(key) for key in list(self._pending) if symbol_code is None or key[0] == symbol_code]
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from A.types import KLine
+
+from typing import Iterable, Optional
+
+from .spill import SPILL_DTYPE, BarSpill
+
+# the record of a cached bar, a spilled bar with the index of the tick of the symbol closing
+# it and the line of that tick in the source file, -1 for a bar still pending at the end of it
+CACHE_DTYPE = np.dtype(SPILL_DTYPE.descr + [("tick", np.int64), ("line", np.int64)])
+
+# the bytes read at a time to hash a source file
+_HASH_CHUNK = 4 << 20
+
+
+def file_digest(path: str) -> str:
+    """ the blake2b digest of the content of a file """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def bar_records(
+        bars: list[KLine],
+        ticks: Iterable[int],
+        lines: Iterable[int]
+) -> np.ndarray:
+    """
+    the cache records of the bars of a symbol
+
+    Args:
+        bars: the bars, as `build_klines` returns them
+        ticks: the index of the tick closing each bar, -1 if pending
+        lines: the line of the tick closing each bar in the source file, -1 if pending
+
+    Returns:
+        np.ndarray: the records of `CACHE_DTYPE`
+    """
+    records = np.zeros(len(bars), dtype=CACHE_DTYPE)
+    for record, bar, tick, line in zip(records, bars, ticks, lines):
+        record["symbol_code"] = bar.symbol_code.encode()
+        record["interval"] = bar.interval
+        record["time"] = bar.time
+        record["start_time"] = bar.start_time
+        record["end_time"] = bar.end_time
+        record["open"] = bar.open
+        record["high"] = bar.high
+        record["low"] = bar.low
+        record["close"] = bar.close
+        record["volume"] = bar.volume
+        record["change_percent"] = bar.change_percent
+        record["tick"] = tick
+        record["line"] = line
+    return records
+
+
+class BarCache:
+    """
+    On-disk cache of the bars built from the tick files of the backtests.
+
+    The bars are kept per (trading day, interval, symbol), one `.npy` of
+    `CACHE_DTYPE` records each, with the content digest of the source file
+    of the day::
+
+        root/<day>/source.json
+        root/<day>/<interval>/<symbol code>.npy
+
+    A day is valid while its source file has the same digest. The file is
+    only hashed again when its size or modification time changed, so a
+    valid day costs a `stat`. A day built from another source content is
+    dropped as a whole when it is stored again.
+    """
+
+    def __init__(
+            self,
+            root: str
+    ) -> None:
+        """
+        Args:
+            root: the cache directory, created if missing
+        """
+        os.makedirs(root, exist_ok=True)
+        self._root: str = root
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    def _day_path(self, day: str) -> str:
+        return os.path.join(self._root, day)
+
+    def _symbol_path(self, day: str, interval: int, symbol_code: str) -> str:
+        return os.path.join(self._root, day, str(interval), f"{symbol_code}.npy")
+
+    @staticmethod
+    def _stat(path: str) -> dict:
+        stat = os.stat(path)
+        return dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+    def _read_meta(self, day: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self._day_path(day), "source.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, day: str, meta: dict) -> None:
+        path = os.path.join(self._day_path(day), "source.json")
+        # the backtests of `A.runner` may store the same day at once, one temporary file per process
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def is_valid(
+            self,
+            day: str,
+            source_path: str
+    ) -> bool:
+        """ whether the bars of the day were built from the current content of the source file """
+        meta = self._read_meta(day)
+        if meta is None:
+            return False
+        stat = self._stat(source_path)
+        if stat == {k: meta.get(k) for k in stat}:
+            return True
+        if file_digest(source_path) != meta.get("digest"):
+            return False
+        # touched but not changed
+        self._write_meta(day, {**meta, **stat})
+        return True
+
+    def load(
+            self,
+            day: str,
+            source_path: str,
+            symbols: Iterable[str],
+            interval: int = 60
+    ) -> Optional[dict[str, np.ndarray]]:
+        """
+        the cached bars of the symbols of a day
+
+        Args:
+            day: the trading day
+            source_path: the tick file the bars are built from
+            symbols: the symbol codes
+            interval: the bar interval in seconds
+
+        Returns:
+            Optional[dict]: symbol code -> the records of `CACHE_DTYPE`, None if the day is not
+                valid or a symbol is not cached
+        """
+        if not self.is_valid(day, source_path):
+            return None
+        ret = dict()
+        for symbol_code in symbols:
+            path = self._symbol_path(day, interval, symbol_code)
+            if not os.path.exists(path):
+                return None
+            ret[symbol_code] = np.load(path)
+        return ret
+
+    def store(
+            self,
+            day: str,
+            source_path: str,
+            records: dict[str, np.ndarray],
+            interval: int = 60
+    ) -> None:
+        """
+        cache the bars of the symbols of a day, a symbol without tick is cached without bar
+
+        Args:
+            day: the trading day
+            source_path: the tick file the bars are built from
+            records: symbol code -> the records of `CACHE_DTYPE`, see `bar_records`
+            interval: the bar interval in seconds
+
+        Returns:
+            None
+        """
+        stat = self._stat(source_path)
+        digest = file_digest(source_path)
+        meta = self._read_meta(day)
+        if meta is not None and meta.get("digest") != digest:
+            shutil.rmtree(self._day_path(day))
+
+        os.makedirs(os.path.join(self._day_path(day), str(interval)), exist_ok=True)
+        for symbol_code, values in records.items():
+            path = self._symbol_path(day, interval, symbol_code)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, np.asarray(values, dtype=CACHE_DTYPE))
+            os.replace(tmp, path)
+        self._write_meta(day, dict(source=os.path.abspath(source_path), digest=digest, **stat))
+
+    @staticmethod
+    def to_klines(records: np.ndarray) -> list[KLine]:
+        """ the bars of cached records """
+        return BarSpill.to_klines(records)
@@ -0,0 +1,213 @@
+"""
+Trading session calendars.
+
+A trading day starts at 18:00 of the previous calendar day, so the night
+session of a futures product and the day sessions that follow it are one
+trading day. Times are handled as integer seconds from the midnight of
+the trading day, negative during the night before, see `offset_of`.
+
+For every bar interval a calendar builds the bar grid of a day once: the
+session is cut into bars labeled with their end time, the last bar of a
+session ends at the session end. The grid maps the seconds of a tick to
+a position with one bisect:
+
+- `2 * k`: the tick belongs to the bar `k`, the ticks before the first
+  session (the opening call auction) belong to the first bar of the day,
+  the ticks of the last minutes of a break to the first bar after it.
+- `2 * k + 1`: the tick is in the break after the bar `k`, which ends a
+  session. The first such tick is the closing print of the session, it
+  belongs to the bar `k` and closes it, the later ones are ignored.
+"""
+import numpy as np
+
+from A.types import NS_PER_SECOND, StrategyType
+
+from bisect import bisect_right
+from datetime import time
+from functools import lru_cache
+from typing import Sequence, Union
+
+# the seconds of the calendar day at which a trading day starts, the night before
+DAY_START = 18 * 3600
+# the max seconds before a session start taken as the opening call auction of the session
+PRE_OPEN = 15 * 60
+
+_DAY = 24 * 3600
+_NEG_INF = -2 * _DAY
+
+
+def offset_of(seconds: int) -> int:
+    """ the seconds from the midnight of the trading day of the seconds of a calendar day """
+    return seconds - _DAY if seconds >= DAY_START else seconds
+
+
+def _parse(value: Union[str, time]) -> int:
+    if isinstance(value, str):
+        value = time.fromisoformat(value)
+    return offset_of(value.hour * 3600 + value.minute * 60 + value.second)
+
+
+def _to_time(offset: int) -> time:
+    minutes, second = divmod(offset % _DAY, 60)
+    hour, minute = divmod(minutes, 60)
+    return time(hour, minute, second)
+
+
+class BarGrid:
+    """ the bars of a trading day of one interval, see the module doc """
+
+    def __init__(
+            self,
+            sessions: Sequence[tuple[int, int]],
+            interval: int
+    ) -> None:
+        """
+        Args:
+            sessions: the (start, end) offsets of the sessions, in order
+            interval: the bar interval in seconds
+        """
+        self.interval: int = interval
+        # the end offsets of the bars
+        self.end_offsets: list[int] = []
+        # the start offsets of the segments of the day, and the position of each segment
+        self.edges: list[int] = []
+        self.positions: list[int] = []
+
+        for i, (start, end) in enumerate(sessions):
+            if i == 0:
+                pre_open = _NEG_INF
+            else:
+                gap = start - sessions[i - 1][1]
+                pre_open = start - min(PRE_OPEN, gap // 2)
+            t = start
+            while t < end:
+                self.edges.append(pre_open if t == start else t)
+                self.positions.append(2 * len(self.end_offsets))
+                t = min(t + interval, end)
+                self.end_offsets.append(t)
+            # the break after the session
+            self.edges.append(end)
+            self.positions.append(2 * len(self.end_offsets) - 1)
+
+        # the labels of the bars, and as nanoseconds of the day, the `KLine.time` of the bars
+        self.ends: list[time] = [_to_time(offset) for offset in self.end_offsets]
+        self.end_ns: list[int] = [offset % _DAY * NS_PER_SECOND for offset in self.end_offsets]
+        # the segments as arrays, for the vectorized lookups
+        self.edge_array: np.ndarray = np.array(self.edges, dtype=np.int64)
+        self.position_array: np.ndarray = np.array(self.positions, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.end_offsets)
+
+    def position(
+            self,
+            offset: int
+    ) -> int:
+        """
+        the position of a tick
+
+        Args:
+            offset: the seconds of the tick from the midnight of its trading day, see `offset_of`
+
+        Returns:
+            int: `2 * k` in the bar `k`, `2 * k + 1` in the break after the bar `k`
+        """
+        return self.positions[bisect_right(self.edges, offset) - 1]
+
+
+class SessionCalendar:
+    """
+    The trading sessions of a market or product, and their bar grids.
+
+    The calendars are meant to be shared, a grid is built once per
+    interval and cached.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            sessions: Sequence[tuple[Union[str, time], Union[str, time]]]
+    ) -> None:
+        """
+        Args:
+            name: the calendar name
+            sessions: the (start, end) times of the sessions in trading order, e.g.
+                `[("21:00", "23:00"), ("09:00", "10:15"), ...]`
+
+        Raises:
+            ValueError: the sessions are empty, overlap or are out of order
+        """
+        offsets = [(_parse(start), _parse(end)) for start, end in sessions]
+        if not offsets:
+            raise ValueError(f"calendar {name} has no session.")
+        for i, (start, end) in enumerate(offsets):
+            if end <= start or (i > 0 and start < offsets[i - 1][1]):
+                raise ValueError(f"calendar {name} sessions overlap or are out of order: {sessions}.")
+
+        self.name: str = name
+        self.sessions: list[tuple[int, int]] = offsets
+        self._grids: dict[int, BarGrid] = dict()
+
+    def __repr__(self) -> str:
+        sessions = ", ".join(f"{_to_time(s):%H:%M}-{_to_time(e):%H:%M}" for s, e in self.sessions)
+        return f"SessionCalendar({self.name}: {sessions})"
+
+    def grid(
+            self,
+            interval: int = 60
+    ) -> BarGrid:
+        """ the bar grid of the interval in seconds """
+        grid = self._grids.get(interval)
+        if grid is None:
+            if interval <= 0:
+                raise ValueError(f"bar interval must be positive, got {interval}.")
+            grid = self._grids[interval] = BarGrid(self.sessions, interval)
+        return grid
+
+    def ends(
+            self,
+            interval: int = 60
+    ) -> list[time]:
+        """ the labels of the bars of a day, in trading order """
+        return self.grid(interval).ends
+
+
+STOCK = SessionCalendar("stock", [("09:30", "11:30"), ("13:00", "15:00")])
+CFFEX_INDEX = SessionCalendar("cffex_index", [("09:30", "11:30"), ("13:00", "15:00")])
+CFFEX_BOND = SessionCalendar("cffex_bond", [("09:30", "11:30"), ("13:00", "15:15")])
+
+_COMMODITY_DAY = [("09:00", "10:15"), ("10:30", "11:30"), ("13:30", "15:00")]
+COMMODITY = SessionCalendar("commodity", _COMMODITY_DAY)
+COMMODITY_NIGHT_2300 = SessionCalendar("commodity_night_2300", [("21:00", "23:00")] + _COMMODITY_DAY)
+COMMODITY_NIGHT_0100 = SessionCalendar("commodity_night_0100", [("21:00", "01:00")] + _COMMODITY_DAY)
+COMMODITY_NIGHT_0230 = SessionCalendar("commodity_night_0230", [("21:00", "02:30")] + _COMMODITY_DAY)
+
+# the calendar of a futures product, the letters of the instrument id
+PRODUCT_CALENDARS: dict[str, SessionCalendar] = {
+    **{p: CFFEX_INDEX for p in ("IF", "IH", "IC", "IM")},
+    **{p: CFFEX_BOND for p in ("T", "TF", "TS", "TL")},
+    **{p: COMMODITY_NIGHT_0230 for p in ("au", "ag", "sc")},
+    **{p: COMMODITY_NIGHT_0100 for p in ("cu", "al", "zn", "pb", "ni", "sn", "ss", "bc", "ao")},
+    **{p: COMMODITY_NIGHT_2300 for p in (
+        "rb", "hc", "bu", "ru", "fu", "sp", "br", "lu", "nr",
+        "a", "b", "m", "y", "p", "c", "cs", "i", "j", "jm", "l", "pp", "v", "eg", "eb", "pg", "rr",
+        "SR", "CF", "RM", "MA", "TA", "ZC", "FG", "OI", "SA", "CY", "PF", "PX", "SH",
+    )},
+}
+
+
+@lru_cache(maxsize=None)
+def futures_calendar(instrument_id: str) -> SessionCalendar:
+    """ the calendar of a futures instrument, e.g. `rb2205`, day sessions only if the product is unknown """
+    product = instrument_id.rstrip("0123456789")
+    return PRODUCT_CALENDARS.get(product, COMMODITY)
+
+
+def calendar_of(
+        ex_type: StrategyType,
+        symbol_code: str
+) -> SessionCalendar:
+    """ the calendar of a symbol of a market """
+    if ex_type == StrategyType.FUTURES:
+        return futures_calendar(symbol_code)
+    return STOCK
@@ -1,38 +1,17 @@
-import pandas as pd
+import sys
 
-from pandas import Series
-from typing import List, Optional
-from datetime import timedelta, datetime
-from A.types.kline import KLine
-
-
-def generator_period_dt(interval: int,
-                        start_dt: datetime = None,
-                        replace_date: Optional[datetime] = None) -> List[datetime]:
-    if start_dt is None:
-        start = datetime.strptime("93000", "%H%M%S")
-    else:
-        start = start_dt
-
-    if replace_date is not None:
-        start = start.replace(year=replace_date.year, month=replace_date.month, day=replace_date.day)
-
-    i = int(start.strftime('%H%M%S'))
-    if i < 9_30_00 or i > 15_00_00:
-        start = datetime.strptime('93000', '%H%M%S')
+import numpy as np
 
-    end = datetime.strptime('150000', '%H%M%S')
-    ret = []
+from collections import deque
+from enum import Enum
+from typing import TYPE_CHECKING, Optional, Union
+from A.types import NS_PER_DAY, NS_PER_SECOND
+from A.types.kline import KLine
 
-    while True:
-        # 跳过休盘时间段
-        start += timedelta(seconds=interval)
-        if start.time() > end.time():
-            break
-        if not (113000 < int(start.strftime('%H%M%S')) < 130100):
-            ret.append(start.replace(second=0, microsecond=0))
+from .calendar import DAY_START, STOCK, SessionCalendar, offset_of
 
-    return ret
+if TYPE_CHECKING:
+    from .spill import BarSpill
 
 
 def create_kline(
@@ -45,8 +24,9 @@ def create_kline(
         change_percent: float,
         start_time: int,
         end_time: int,
-        time: datetime.time,
-        style: Optional[int] = 0
+        time: int,
+        style: Optional[int] = 0,
+        interval: int = 60
 ) -> KLine:
     """创建Kline对象
 
@@ -58,10 +38,11 @@ def create_kline(
         high_price: 最高价
         low_price:  最低价
         volume: 成交量
-        start_time: 开始时间
-        end_time: 结束时间
-        time: 当前Kline所指的时间
+        start_time: 开始时间, 当日纳秒数
+        end_time: 结束时间, 当日纳秒数
+        time: 当前Kline所指的时间, 当日纳秒数
         style: Kline样式; 0: 收盘价等于开盘价, 1: 阳线, -1: 阴线
+        interval: K线周期, 秒
     Returns: K线对象
     """
     obj = KLine()
@@ -77,78 +58,124 @@ def create_kline(
     obj.start_time = start_time
     obj.end_time = end_time
     obj.style = style
+    obj.interval = interval
 
     return obj
 
 
+class Retention(Enum):
+    # keep every bar of the handle in `bars`
+    ALL = 1
+    # keep no bar, the bars are only handed to the subscribers
+    NONE = 2
+    # keep the last `keep` bars
+    LAST = 3
+    # append every bar to a `BarSpill` file and keep the last `keep` bars
+    SPILL = 4
+
+
 class KLineHandle:
+    """
+    Builds the bars of a symbol from its ticks.
+
+    The handle keeps the open/high/low/close/volume of the pending bar and
+    updates them per tick in O(1), no tick is kept. The bar of a tick is
+    looked up in the bar grid of the session calendar of the symbol, see
+    `A.data.calendar`. A tick of a later bar closes the pending bar, the
+    bar is labeled with its end time and handed to the subscribers. The
+    first tick after the end of a session is the closing print, it is
+    added to the last bar of the session which it closes, the ticks after
+    it are ignored until the next session. A tick is never put into an
+    earlier bar than the previous tick.
+
+    A tick of a later trading day flushes the pending bar and starts a new
+    day. The trading day is read from the date of the tick, or, for the
+    ticks without a date, a tick more than `NEW_DAY_GAP` seconds earlier
+    than the latest tick is of the next day. `flush` closes the pending
+    bar at the end of the data.
+
+    The closed bars are kept in `bars` by the retention policy, see
+    `Retention`, a handle of a full market day keeps a flat footprint with
+    `Retention.NONE`, `Retention.LAST` or `Retention.SPILL`.
+    """
+
+    # the seconds a tick without a date goes back for a new trading day
+    NEW_DAY_GAP: int = 3600
 
     def __init__(
             self,
             symbol_code: str,
             interval: int = 60,
-            t0_date: Optional[datetime] = None
+            calendar: SessionCalendar = STOCK,
+            retention: Retention = Retention.ALL,
+            keep: int = 0,
+            spill: Optional["BarSpill"] = None
     ):
+        """
+        Args:
+            symbol_code: the symbol code
+            interval: the bar interval in seconds
+            calendar: the trading sessions of the symbol, see `A.data.calendar.calendar_of`
+            retention: the bars kept in `bars`
+            keep: the number of bars kept with `Retention.LAST` and `Retention.SPILL`
+            spill: the file the bars are appended to with `Retention.SPILL`
+
+        Raises:
+            ValueError: `keep` is not positive with `Retention.LAST`, or `spill` is missing
+                with `Retention.SPILL`
+        """
+        if retention == Retention.LAST and keep <= 0:
+            raise ValueError(f"Retention.LAST keeps {keep} bars, must be positive.")
+        if retention == Retention.SPILL and spill is None:
+            raise ValueError("Retention.SPILL needs a BarSpill.")
+
         self._symbol_code = symbol_code
-        if t0_date is None:
-            t0_date = datetime.today()
-        self._t0_date: datetime = t0_date
         self._interval = interval
+        self._calendar: SessionCalendar = calendar
 
-        self._quote_cache = []
         self._callbacks = []
 
-        self.quotes = []
-        self.kline_lst: list[KLine] = []
+        self._retention: Retention = retention
+        self._spill: Optional["BarSpill"] = spill if retention == Retention.SPILL else None
+        self._spilled: int = 0
+        if retention == Retention.ALL:
+            self.kline_lst: Union[list[KLine], deque] = []
+        else:
+            self.kline_lst = deque(maxlen=keep if retention != Retention.NONE else 0)
+        # the close of the last bar, for the change percent of the next one
+        self._last_close: Optional[float] = None
+
+        # the bars of a day
+        self._grid = calendar.grid(interval)
+        # the position in the grid of the latest tick, -1 before the first tick of a day
+        self._pos: int = -1
+        # the index of the pending bar in the grid
+        self._index: int = 0
+        # the trading day of the latest tick, as days from the epoch, and its seconds in the day
+        self._day: Optional[int] = None
+        self._offset: int = 0
+        # the state of the pending bar, no bar is pending while `_count` is 0
+        self._count: int = 0
+        self._open: float = float("nan")
+        self._high: float = float("nan")
+        self._low: float = float("nan")
+        self._close: float = float("nan")
+        self._volume: float = 0
+        # the nanoseconds of the day of the first and the latest tick of the pending bar
+        self._start_time: int = 0
+        self._end_time: int = 0
 
-        self._period = generator_period_dt(self._interval, replace_date=self._t0_date)
+    @property
+    def calendar(self) -> SessionCalendar:
+        return self._calendar
 
     def subscribe(self, callback):
         self._callbacks.append(callback)
 
-    def _is_end(self):
-        if len(self._quote_cache) >= 3:
-            try:
-                current_last_modified_full = self._quote_cache[-1]['data_time'].iloc[0]
-            except AttributeError:
-                current_last_modified_full = self._quote_cache[-1]['data_time']
-
-            if current_last_modified_full.time() >= self._period[0].time():
-                self._kline_date = self._period[0]
-                del self._period[0]
-                return True
-
-        return False
-
-    def _save_quote(self, quote: Series):
-        """
-        每来一条行情就保存
-        Args:
-            quote (:py:class:`~pandas.Series`): 最新行情消息
-        Returns:
-        """
-        self.quotes.append(quote)
-        self._quote_cache.append(quote)
-
     def _make_kline(self) -> KLine:
-        """ 创建一根k线 """
-        quote_cache_df = pd.concat(self._quote_cache)
-
-        last_price_series: Series = quote_cache_df['last_price']
-        data_time_series: Series = quote_cache_df['data_time']
-
-        open_price = last_price_series.iloc[0]
-        close_price = last_price_series.iloc[-2]
-
-        high_price = last_price_series.max()
-        low_price = last_price_series.min()
-
-        start_date = data_time_series.iloc[0]
-        end_date = data_time_series.iloc[-2]
-
-        volume_s = quote_cache_df['volume']
-        volume = volume_s.sum()
-
+        """ create the bar of the pending state """
+        open_price = self._open
+        close_price = self._close
         if open_price > close_price:
             style = -1
         elif open_price < close_price:
@@ -157,24 +184,29 @@ class KLineHandle:
             style = 0
 
         change_percent = .0
-        if len(self.kline_lst) > 0 and (last_close_price := self.kline_lst[-1].close) != 0:
+        if (last_close_price := self._last_close) is not None and last_close_price != 0:
             change_percent = ((close_price / last_close_price) - 1) * 100
+        self._last_close = close_price
 
         kline = create_kline(
             symbol_code=self._symbol_code,
             open_price=open_price,
             close_price=close_price,
-            high_price=high_price,
-            low_price=low_price,
-            volume=volume,
+            high_price=self._high,
+            low_price=self._low,
+            volume=self._volume,
             change_percent=change_percent,
-            start_time=start_date.time(),
-            end_time=end_date.time(),
+            start_time=self._start_time,
+            end_time=self._end_time,
             style=style,
-            time=self._kline_date.time(),
+            time=self._grid.end_ns[self._index],
+            interval=self._interval,
         )
 
         self.kline_lst.append(kline)
+        if self._spill is not None:
+            self._spill.append(kline)
+            self._spilled += 1
 
         return kline
 
@@ -182,19 +214,227 @@ class KLineHandle:
     def bars(self):
         return self.kline_lst
 
-    def do(self, message: pd.Series):
-        if len(self._period) <= 0:
-            self._period = generator_period_dt(self._interval, self._t0_date)
+    @property
+    def retention(self) -> Retention:
+        return self._retention
 
-        self._save_quote(message)
+    def memory_usage(self) -> dict:
+        """
+        the memory held by the handle
 
-        if self._is_end():
-            bar = self._make_kline()
-            for cb in self._callbacks:
-                cb(bar)
-            self._cache_clean()
+        Returns:
+            dict: `bars` the number of bars kept, `spilled` the number of bars appended to the
+                spill file, `bytes` the estimated bytes of the bars kept and their container
+        """
+        size = sys.getsizeof(self.kline_lst)
+        if self.kline_lst:
+            # the bars have the same fields, measure one, the symbol code, the labels of the
+            # calendar grid and the small ints are shared by the bars
+            bar = self.kline_lst[-1]
+            fields = vars(bar)
+            values = {
+                id(v): v for k, v in fields.items()
+                if k not in ("symbol_code", "time") and not (isinstance(v, int) and -5 <= v <= 256)
+            }
+            size += len(self.kline_lst) * (
+                    sys.getsizeof(bar) + sys.getsizeof(fields) + sum(sys.getsizeof(v) for v in values.values())
+            )
+        return dict(bars=len(self.kline_lst), spilled=self._spilled, bytes=size)
+
+    def _close_bar(self) -> None:
+        bar = self._make_kline()
+        self._count = 0
+        for cb in self._callbacks:
+            cb(bar)
+
+    def _update(
+            self,
+            price: float,
+            volume: float,
+            tick_time: int
+    ) -> None:
+        if self._count == 0:
+            self._open = self._high = self._low = price
+            self._volume = 0
+            self._start_time = tick_time
+        elif price > self._high:
+            self._high = price
+        elif price < self._low:
+            self._low = price
+        self._close = price
+        self._volume += volume
+        self._end_time = tick_time
+        self._count += 1
+
+    def _new_day(
+            self,
+            offset: int
+    ) -> None:
+        self.flush()
+        self._pos = -1
+        self._offset = offset
+
+    def do(
+            self,
+            price: float,
+            volume: float,
+            data_time: int
+    ) -> None:
+        """
+        add a tick
+
+        Args:
+            price: the last price
+            volume: the volume traded since the previous tick
+            data_time: the exchange time of tick, local epoch nanoseconds, see `A.types.timestamp`,
+                or the nanoseconds of the day for the ticks without a date
+
+        Returns:
+            None
+        """
+        if data_time >= NS_PER_DAY:
+            day, tick_time = divmod(data_time, NS_PER_DAY)
+            seconds = tick_time // NS_PER_SECOND
+            offset = offset_of(seconds)
+            # the night session is of the trading day after its date
+            day += seconds >= DAY_START
+            if day != self._day:
+                if self._day is not None:
+                    self._new_day(offset)
+                self._day = day
+        else:
+            tick_time = data_time
+            offset = offset_of(data_time // NS_PER_SECOND)
+            if offset < self._offset - self.NEW_DAY_GAP:
+                self._new_day(offset)
+        if offset > self._offset:
+            self._offset = offset
+
+        pos = self._grid.position(offset)
+        last = self._pos
+        if pos <= last:
+            if last & 1:
+                # after the closing print of the session
+                return
+            # the pending bar, or a late tick
+            self._update(price, volume, tick_time)
+            return
+
+        index = pos >> 1
+        if self._count and index != self._index:
+            self._close_bar()
+        self._index = index
+        self._pos = pos
+        self._update(price, volume, tick_time)
+        if pos & 1:
+            # the closing print closes the last bar of the session
+            self._close_bar()
+
+    def flush(self) -> None:
+        """ close the pending bar, if any """
+        if self._count:
+            self._close_bar()
+
+
+def build_klines(
+        symbol_code: str,
+        times: np.ndarray,
+        prices: np.ndarray,
+        volumes: np.ndarray,
+        interval: int = 60,
+        last_close: Optional[float] = None,
+        calendar: SessionCalendar = STOCK
+) -> tuple[list[KLine], np.ndarray]:
+    """
+    build the bars of a trading day of ticks in one vectorized pass, the
+    same bars `KLineHandle` builds from the ticks one by one.
+
+    The ticks are looked up in the bar grid of the calendar with
+    `np.searchsorted`, the running max of their positions puts a late tick
+    into the pending bar like the streaming handle does, the break ticks
+    after the closing print of a session are dropped, and the ticks left
+    are reduced per bar with `reduceat`. The ticks are of a single trading
+    day, no tick is taken as the start of the next day.
+
+    Args:
+        symbol_code: the symbol code
+        times: the nanoseconds of the day of the ticks, see `A.types.timestamp`
+        prices: the last prices of the ticks
+        volumes: the volumes traded since the previous tick
+        interval: the bar interval in seconds
+        last_close: the close of the bar before the day, for the change percent of the first bar
+        calendar: the trading sessions of the symbol
+
+    Returns:
+        tuple: the bars, and the index of the tick after which the `KLineHandle` closes each bar,
+            -1 if the bar is still pending at the end of the ticks and closed by `flush`
+    """
+    times = np.asarray(times, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    volumes = np.asarray(volumes)
+    if len(times) == 0:
+        return [], np.empty(0, dtype=np.int64)
+
+    grid = calendar.grid(interval)
+    seconds = times // 1_000_000_000
+    offsets = np.where(seconds >= DAY_START, seconds - 24 * 3600, seconds)
+    pos = grid.position_array[np.searchsorted(grid.edge_array, offsets, side="right") - 1]
+    np.maximum.accumulate(pos, out=pos)
+
+    # in a break only the first tick, the closing print, is kept
+    keep = (pos & 1) == 0
+    keep[0] = True
+    keep[1:] |= pos[1:] != pos[:-1]
+    kept = np.flatnonzero(keep)
+    pos = pos[kept]
+    index = pos >> 1
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(index)) + 1))
+    stops = np.append(starts[1:], len(kept))
+    # a bar is closed by its closing print, or by the first tick of the next bar
+    closed_at = np.append(kept[starts[1:]], -1)
+    closing = (pos[stops - 1] & 1) == 1
+    closed_at[closing] = kept[stops - 1][closing]
+
+    prices = prices[kept]
+    opens = prices[starts].tolist()
+    closes = prices[stops - 1].tolist()
+    highs = np.maximum.reduceat(prices, starts).tolist()
+    lows = np.minimum.reduceat(prices, starts).tolist()
+    bar_volumes = np.add.reduceat(volumes[kept], starts).tolist()
+    start_times = times[kept[starts]].tolist()
+    end_times = times[kept[stops - 1]].tolist()
+    labels = index[starts].tolist()
+
+    bars = []
+    for i in range(len(starts)):
+        open_price = opens[i]
+        close_price = closes[i]
+        if open_price > close_price:
+            style = -1
+        elif open_price < close_price:
+            style = 1
+        else:
+            style = 0
+
+        change_percent = .0
+        if last_close is not None and last_close != 0:
+            change_percent = ((close_price / last_close) - 1) * 100
+        last_close = close_price
+
+        bars.append(create_kline(
+            symbol_code=symbol_code,
+            open_price=open_price,
+            close_price=close_price,
+            high_price=highs[i],
+            low_price=lows[i],
+            volume=bar_volumes[i],
+            change_percent=change_percent,
+            start_time=start_times[i],
+            end_time=end_times[i],
+            style=style,
+            time=grid.end_ns[labels[i]],
+            interval=interval,
+        ))
 
-    def _cache_clean(self):
-        # if int(self._quote_cache[0].last_modified_full.strftime('%H%M')) != 1300:
-        # 每一分钟清理一次行情缓存，因为缓存中保存了一下分钟的第一条行情，所以保留最后一条缓存
-        del self._quote_cache[:-1]
+    return bars, closed_at
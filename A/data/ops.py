@@ -1,16 +1,687 @@
-class Rolling:
-    def __init__(self, feature, N, func):
-        self.feature = feature
-        self.N = N
-        self.func = func
+"""
+Rolling expressions over the bar fields, e.g. factor definitions::
+
+    close = Feature("close")
+    momentum = Delta(close, 5) / Ref(close, 5)
+    trend = Corr(close, Feature("volume"), 20)
+
+An expression is evaluated bar by bar with `update`, live or in a
+backtest, or over whole arrays with `batch`, and gives the same values
+both ways, bit for bit. The window sums are differences of running
+totals of the values less the first one, the extremes are kept in
+monotonic deques bar by bar and taken over strided windows in batch.
+
+The value of a window is NaN until it holds N values and while one of
+them is NaN, so the NaNs of the first bars of an inner expression only
+delay the outer one.
+"""
+import copy
+import math
+import itertools
+from collections import deque
+from typing import Any, Mapping, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+NAN = float("nan")
+# the steps of the bars added without a step, see `Expression.update`
+_steps = itertools.count(-1, -1)
+
+
+def _field(bar: Any, name: str) -> float:
+    value = bar[name] if isinstance(bar, Mapping) else getattr(bar, name)
+    return NAN if value is None else float(value)
+
+
+def _expression(value: Union["Expression", str, float]) -> "Expression":
+    if isinstance(value, Expression):
+        return value
+    if isinstance(value, str):
+        return Feature(value)
+    return Constant(value)
+
+
+class Expression:
+    """
+    Base of the expressions.
+
+    An expression keeps the state of one series, `clone` it per symbol, see
+    `Factors`. A sub-expression used twice in an expression is updated once
+    per step, the step of a bar is passed down to the sub-expressions.
+    """
+
+    def __init__(self) -> None:
+        # the step of the last bar added
+        self._step: Any = None
+        self._value: float = NAN
+
+    @property
+    def children(self) -> tuple["Expression", ...]:
+        return ()
+
+    def __add__(self, other) -> "Expression":
+        return Add(self, other)
+
+    def __radd__(self, other) -> "Expression":
+        return Add(other, self)
+
+    def __sub__(self, other) -> "Expression":
+        return Sub(self, other)
+
+    def __rsub__(self, other) -> "Expression":
+        return Sub(other, self)
+
+    def __mul__(self, other) -> "Expression":
+        return Mul(self, other)
+
+    def __rmul__(self, other) -> "Expression":
+        return Mul(other, self)
+
+    def __truediv__(self, other) -> "Expression":
+        return Div(self, other)
+
+    def __rtruediv__(self, other) -> "Expression":
+        return Div(other, self)
+
+    def __neg__(self) -> "Expression":
+        return Mul(-1., self)
+
+    def update(
+            self,
+            bar: Any,
+            step: Any = None
+    ) -> float:
+        """
+        add a bar, the bar may be a buffer refilled for every bar
+
+        Args:
+            bar: a `KLine`, or a mapping of the field names to the values
+            step: the step of the bar, a count of the bars from 0, a new step if None, the value
+                of the last bar is returned again for the same step
+
+        Returns:
+            float: the value of the expression at the bar
+        """
+        if step is None:
+            step = next(_steps)
+        if step != self._step:
+            self._step = step
+            self._value = self._update(bar)
+        return self._value
+
+    def batch(
+            self,
+            data: Mapping[str, Any],
+            cache: dict = None
+    ) -> np.ndarray:
+        """
+        the values of the expression over arrays of bars
+
+        Args:
+            data: the field names -> the values of the bars, oldest first, e.g. `BarStore.history`
+            cache: id of expression -> values, the values of the sub-expressions computed
+
+        Returns:
+            np.ndarray: the value of the expression at each bar
+        """
+        cache = dict() if cache is None else cache
+        ret = cache.get(id(self))
+        if ret is None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ret = cache[id(self)] = self._batch(data, cache)
+        return ret
+
+    def reset(self) -> None:
+        """ forget the bars added """
+        self._step = None
+        self._value = NAN
+        self._reset()
+        for child in self.children:
+            child.reset()
+
+    def clone(self) -> "Expression":
+        """ a copy of the expression without its state """
+        ret = copy.deepcopy(self)
+        ret.reset()
+        return ret
+
+    def _update(self, bar: Any) -> float:
+        raise NotImplementedError
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        raise NotImplementedError
+
+    def _reset(self) -> None:
+        pass
+
+
+class Feature(Expression):
+    """ a bar field """
+
+    def __init__(
+            self,
+            name: str
+    ) -> None:
+        super().__init__()
+        self.name: str = name
+
+    def __str__(self) -> str:
+        return f"${self.name}"
+
+    def _update(self, bar: Any) -> float:
+        return _field(bar, self.name)
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        return np.asarray(data[self.name], dtype=np.float64)
+
+
+class Constant(Expression):
+
+    def __init__(
+            self,
+            value: float
+    ) -> None:
+        super().__init__()
+        self.value: float = float(value)
+
+    def __str__(self) -> str:
+        return str(self.value)
+
+    def _update(self, bar: Any) -> float:
+        return self.value
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        return np.float64(self.value)
+
+
+class _Binary(Expression):
+    """ the element wise operators, the same expression runs on floats and on arrays """
+
+    symbol: str = ""
+
+    def __init__(
+            self,
+            left: Union[Expression, str, float],
+            right: Union[Expression, str, float]
+    ) -> None:
+        super().__init__()
+        self.left: Expression = _expression(left)
+        self.right: Expression = _expression(right)
+
+    @property
+    def children(self) -> tuple[Expression, ...]:
+        return self.left, self.right
+
+    def __str__(self) -> str:
+        return f"({self.left}{self.symbol}{self.right})"
+
+    @staticmethod
+    def _op(a, b):
+        raise NotImplementedError
+
+    def _update(self, bar: Any) -> float:
+        return self._op(self.left.update(bar, self._step), self.right.update(bar, self._step))
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        return self._op(self.left.batch(data, cache), self.right.batch(data, cache))
+
+
+class Add(_Binary):
+    symbol = "+"
+
+    @staticmethod
+    def _op(a, b):
+        return a + b
+
+
+class Sub(_Binary):
+    symbol = "-"
+
+    @staticmethod
+    def _op(a, b):
+        return a - b
+
+
+class Mul(_Binary):
+    symbol = "*"
+
+    @staticmethod
+    def _op(a, b):
+        return a * b
+
+
+class Div(_Binary):
+    """ NaN where the divisor is 0 """
+
+    symbol = "/"
+
+    def _update(self, bar: Any) -> float:
+        a, b = self.left.update(bar, self._step), self.right.update(bar, self._step)
+        return a / b if b != 0 else NAN
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        a, b = self.left.batch(data, cache), self.right.batch(data, cache)
+        return np.where(b != 0, a / b, NAN)
+
+
+class Rolling(Expression):
+    """ Base of the operators over the last N values of an expression """
+
+    def __init__(
+            self,
+            feature: Union[Expression, str],
+            N: int
+    ) -> None:
+        """
+        Args:
+            feature: the expression, or the name of a bar field
+            N: the number of bars of the window
+
+        Raises:
+            ValueError: N is too small
+        """
+        super().__init__()
+        if N < self._min_window:
+            raise ValueError(f"{type(self).__name__} window must be at least {self._min_window}, got {N}.")
+        self.feature: Expression = _expression(feature)
+        self.N: int = N
+        self._reset()
+
+    # the smallest window of the operator
+    _min_window: int = 1
+
+    @property
+    def children(self) -> tuple[Expression, ...]:
+        return self.feature,
 
     def __str__(self):
         return "{}({},{})".format(type(self).__name__, self.feature, self.N)
 
+    def _windows(self, data: Mapping[str, Any], cache: dict) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ the values, the NaN output and the strided windows of the values ending at N - 1 and after """
+        x = self.feature.batch(data, cache)
+        ret = np.full(len(x), NAN)
+        if len(x) < self.N:
+            return x, ret, np.empty((0, self.N))
+        return x, ret, sliding_window_view(x, self.N)
+
+
+class Ref(Rolling):
+    """ the value N bars ago """
+
+    _min_window = 0
+
+    def _reset(self) -> None:
+        self._window: deque = deque(maxlen=self.N + 1)
+
+    def _update(self, bar: Any) -> float:
+        self._window.append(self.feature.update(bar, self._step))
+        return self._window[0] if len(self._window) > self.N else NAN
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        x = self.feature.batch(data, cache)
+        ret = np.full(len(x), NAN)
+        if len(x) > self.N:
+            ret[self.N:] = x[:len(x) - self.N]
+        return ret
+
+
+class Delta(Ref):
+    """ the change over N bars """
+
+    def _update(self, bar: Any) -> float:
+        x = self.feature.update(bar, self._step)
+        self._window.append(x)
+        return x - self._window[0] if len(self._window) > self.N else NAN
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        x = self.feature.batch(data, cache)
+        ret = np.full(len(x), NAN)
+        if len(x) > self.N:
+            ret[self.N:] = x[self.N:] - x[:len(x) - self.N]
+        return ret
+
+
+class _Moments(Rolling):
+    """ Base of `Sum`, `Mean` and `Std`, of the window sums of the values and of their squares """
+
+    # whether the sums of the squares are kept
+    _squares: bool = False
+
+    def _reset(self) -> None:
+        self._count: int = 0
+        self._shift: Union[float, None] = None
+        self._total: float = .0
+        self._total2: float = .0
+        self._nans: int = 0
+        # the (total, total of the squares, number of NaNs) of the last N + 1 values
+        self._totals: deque = deque([(.0, .0, 0)], maxlen=self.N + 1)
+
+    def _reduce(self, s1, s2, shift):
+        """ the value of the window sums of the values less `shift` """
+        raise NotImplementedError
+
+    def _update(self, bar: Any) -> float:
+        x = self.feature.update(bar, self._step)
+        self._count += 1
+        if x != x:
+            self._nans += 1
+        else:
+            if self._shift is None:
+                self._shift = x
+            d = x - self._shift
+            self._total += d
+            if self._squares:
+                self._total2 += d * d
+        self._totals.append((self._total, self._total2, self._nans))
+        last, first = self._totals[-1], self._totals[0]
+        if self._count < self.N or last[2] != first[2]:
+            return NAN
+        return self._reduce(last[0] - first[0], last[1] - first[1], self._shift)
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        x = self.feature.batch(data, cache)
+        n = self.N
+        ret = np.full(len(x), NAN)
+        if len(x) < n:
+            return ret
+        nans = np.isnan(x)
+        valid = x[~nans]
+        shift = valid[0] if len(valid) else .0
+        d = np.where(nans, .0, x - shift)
+        totals = np.concatenate(([.0], np.cumsum(d)))
+        s1 = totals[n:] - totals[:-n]
+        s2 = None
+        if self._squares:
+            totals2 = np.concatenate(([.0], np.cumsum(d * d)))
+            s2 = totals2[n:] - totals2[:-n]
+        counts = np.concatenate(([0], np.cumsum(nans)))
+        ret[n - 1:] = np.where(counts[n:] == counts[:-n], self._reduce(s1, s2, shift), NAN)
+        return ret
+
+
+class Sum(_Moments):
+
+    def _reduce(self, s1, s2, shift):
+        return s1 + self.N * shift
+
+
+class Mean(_Moments):
+
+    def _reduce(self, s1, s2, shift):
+        return shift + s1 / self.N
+
+
+class Std(_Moments):
+    """ the sample standard deviation, 0 when the rounding of the sums makes the variance negative """
+
+    _squares = True
+    _min_window = 2
+
+    def _reduce(self, s1, s2, shift):
+        mean = s1 / self.N
+        var = (s2 - s1 * mean) / (self.N - 1)
+        if isinstance(var, np.ndarray):
+            return np.sqrt(np.maximum(var, .0))
+        return math.sqrt(max(var, .0))
+
 
 class WMA(Rolling):
-    def __init__(self, feature, N):
-        super(WMA, self).__init__(feature, N, "wma")
+    """ the average weighted 1 to N from the oldest value to the latest """
+
+    def _reset(self) -> None:
+        self._window: deque = deque(maxlen=self.N)
+
+    @property
+    def _weights(self) -> list[float]:
+        return [float(i + 1) for i in range(self.N)]
+
+    def _update(self, bar: Any) -> float:
+        self._window.append(self.feature.update(bar, self._step))
+        if len(self._window) < self.N:
+            return NAN
+        weights = self._weights
+        acc = self._window[0] * weights[0]
+        for i in range(1, self.N):
+            acc = acc + self._window[i] * weights[i]
+        return acc / (self.N * (self.N + 1) / 2)
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        x, ret, windows = self._windows(data, cache)
+        if len(windows):
+            weights = self._weights
+            acc = windows[:, 0] * weights[0]
+            for i in range(1, self.N):
+                acc = acc + windows[:, i] * weights[i]
+            ret[self.N - 1:] = acc / (self.N * (self.N + 1) / 2)
+        return ret
+
+
+class Max(Rolling):
+    """ the max of the window, kept in a monotonic deque """
+
+    def _reset(self) -> None:
+        self._count: int = 0
+        # (index, value) of the values that may still be the extreme, the extreme first
+        self._extremes: deque = deque()
+        # the indexes of the NaNs of the window
+        self._nans: deque = deque()
+
+    @staticmethod
+    def _dominates(a: float, b: float) -> bool:
+        return a >= b
+
+    def _update(self, bar: Any) -> float:
+        x = self.feature.update(bar, self._step)
+        index = self._count
+        self._count += 1
+        if x != x:
+            self._nans.append(index)
+        else:
+            while self._extremes and self._dominates(x, self._extremes[-1][1]):
+                self._extremes.pop()
+            self._extremes.append((index, x))
+        oldest = index - self.N
+        while self._extremes and self._extremes[0][0] <= oldest:
+            self._extremes.popleft()
+        while self._nans and self._nans[0] <= oldest:
+            self._nans.popleft()
+        if self._count < self.N or self._nans:
+            return NAN
+        return self._extremes[0][1]
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        x, ret, windows = self._windows(data, cache)
+        if len(windows):
+            ret[self.N - 1:] = windows.max(axis=1)
+        return ret
+
+
+class Min(Max):
+    """ the min of the window, kept in a monotonic deque """
+
+    @staticmethod
+    def _dominates(a: float, b: float) -> bool:
+        return a <= b
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        x, ret, windows = self._windows(data, cache)
+        if len(windows):
+            ret[self.N - 1:] = windows.min(axis=1)
+        return ret
+
+
+class Rank(Rolling):
+    """ the percentile of the latest value in the window, the ties share their average rank """
+
+    def _reset(self) -> None:
+        self._window: deque = deque(maxlen=self.N)
+
+    def _update(self, bar: Any) -> float:
+        x = self.feature.update(bar, self._step)
+        self._window.append(x)
+        if len(self._window) < self.N or any(v != v for v in self._window):
+            return NAN
+        less = sum(1 for v in self._window if v < x)
+        equal = sum(1 for v in self._window if v == x)
+        return (less + (equal + 1) / 2) / self.N
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        x, ret, windows = self._windows(data, cache)
+        if len(windows):
+            last = windows[:, -1:]
+            less = (windows < last).sum(axis=1)
+            equal = (windows == last).sum(axis=1)
+            value = (less + (equal + 1) / 2) / self.N
+            ret[self.N - 1:] = np.where(np.isnan(windows).any(axis=1), NAN, value)
+        return ret
+
+
+class Corr(Rolling):
+    """ the Pearson correlation of two expressions, NaN while one of them is constant in the window """
+
+    _min_window = 2
+
+    def __init__(
+            self,
+            feature: Union[Expression, str],
+            other: Union[Expression, str],
+            N: int
+    ) -> None:
+        """
+        Args:
+            feature: the expression, or the name of a bar field
+            other: the other expression, or the name of a bar field
+            N: the number of bars of the window
+        """
+        self.other: Expression = _expression(other)
+        super().__init__(feature, N)
+
+    @property
+    def children(self) -> tuple[Expression, ...]:
+        return self.feature, self.other
+
+    def __str__(self):
+        return "{}({},{},{})".format(type(self).__name__, self.feature, self.other, self.N)
+
+    def _reset(self) -> None:
+        self._count: int = 0
+        self._shift: Union[tuple[float, float], None] = None
+        # sums of x, y, x * x, y * y, x * y of the values less the shift, and the number of NaNs
+        self._total: tuple = (.0, .0, .0, .0, .0, 0)
+        self._totals: deque = deque([self._total], maxlen=self.N + 1)
+
+    def _reduce(self, sx, sy, sxx, syy, sxy):
+        n = self.N
+        cov = sxy - sx * sy / n
+        vx = sxx - sx * sx / n
+        vy = syy - sy * sy / n
+        if isinstance(cov, np.ndarray):
+            return np.where((vx > 0) & (vy > 0), cov / np.sqrt(vx * vy), NAN)
+        return cov / math.sqrt(vx * vy) if vx > 0 and vy > 0 else NAN
+
+    def _update(self, bar: Any) -> float:
+        x, y = self.feature.update(bar, self._step), self.other.update(bar, self._step)
+        self._count += 1
+        sx, sy, sxx, syy, sxy, nans = self._total
+        if x != x or y != y:
+            nans += 1
+        else:
+            if self._shift is None:
+                self._shift = (x, y)
+            dx, dy = x - self._shift[0], y - self._shift[1]
+            sx += dx
+            sy += dy
+            sxx += dx * dx
+            syy += dy * dy
+            sxy += dx * dy
+        self._total = (sx, sy, sxx, syy, sxy, nans)
+        self._totals.append(self._total)
+        last, first = self._totals[-1], self._totals[0]
+        if self._count < self.N or last[5] != first[5]:
+            return NAN
+        return self._reduce(*(a - b for a, b in zip(last[:5], first[:5])))
+
+    def _batch(self, data: Mapping[str, Any], cache: dict) -> np.ndarray:
+        x, y = self.feature.batch(data, cache), self.other.batch(data, cache)
+        n = self.N
+        x, y = np.broadcast_arrays(x, y)
+        ret = np.full(len(x), NAN)
+        if len(x) < n:
+            return ret
+        nans = np.isnan(x) | np.isnan(y)
+        valid = np.flatnonzero(~nans)
+        shift_x, shift_y = (x[valid[0]], y[valid[0]]) if len(valid) else (.0, .0)
+        dx = np.where(nans, .0, x - shift_x)
+        dy = np.where(nans, .0, y - shift_y)
+        sums = []
+        for v in (dx, dy, dx * dx, dy * dy, dx * dy):
+            totals = np.concatenate(([.0], np.cumsum(v)))
+            sums.append(totals[n:] - totals[:-n])
+        counts = np.concatenate(([0], np.cumsum(nans)))
+        ret[n - 1:] = np.where(counts[n:] == counts[:-n], self._reduce(*sums), NAN)
+        return ret
+
+
+class Factors:
+    """
+    Named expressions evaluated per symbol, the same definitions for the
+    backtests, the live strategies and the research over arrays.
+    """
+
+    def __init__(
+            self,
+            definitions: Mapping[str, Union[Expression, str]]
+    ) -> None:
+        """
+        Args:
+            definitions: the factor names -> the expressions
+        """
+        self._definitions: dict[str, Expression] = {k: _expression(v) for k, v in definitions.items()}
+        # symbol code -> the expressions of the symbol
+        self._symbols: dict[str, dict[str, Expression]] = dict()
+        # the step of the last bar added, the expressions of a factor share their sub-expressions
+        self._step: int = -1
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._definitions)
+
+    def update(
+            self,
+            bar: Any
+    ) -> dict[str, float]:
+        """
+        add a bar of a symbol
+
+        Args:
+            bar: the bar, of `symbol_code`
+
+        Returns:
+            dict: the factor names -> the values of the symbol at the bar
+        """
+        expressions = self._symbols.get(bar.symbol_code)
+        if expressions is None:
+            # copied together, the sub-expressions shared by the factors stay shared
+            expressions = self._symbols[bar.symbol_code] = copy.deepcopy(self._definitions)
+            for expression in expressions.values():
+                expression.reset()
+        self._step += 1
+        return {name: expression.update(bar, self._step) for name, expression in expressions.items()}
+
+    def batch(
+            self,
+            data: Mapping[str, Any]
+    ) -> dict[str, np.ndarray]:
+        """
+        the factors over arrays of bars of one symbol
+
+        Args:
+            data: the field names -> the values of the bars, oldest first, e.g. `BarStore.history`
 
-    def _load_internal(self, instrument: str, start_index, end_index, freq):
-        series = self.feature
+        Returns:
+            dict: the factor names -> the values at each bar
+        """
+        cache = dict()
+        return {name: expression.batch(data, cache) for name, expression in self._definitions.items()}
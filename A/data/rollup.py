@@ -0,0 +1,133 @@
+from A.types import NS_PER_SECOND, KLine
+
+from typing import Iterable, Optional
+
+from .calendar import STOCK, SessionCalendar, offset_of
+from .kline import create_kline
+
+
+class BarRollup:
+    """
+    Rolls the bars of a base interval up into bars of higher intervals.
+
+    Every base bar is merged into the pending bar of each higher interval
+    in O(1), so any number of intervals costs one pass over the ticks,
+    the one of the `KLineHandle` building the base bars. The higher bars
+    are cut by the session calendar of the symbol like the base bars, a
+    higher bar is labeled with its end time and is closed by the base bar
+    of the same end time, or by the first base bar of a later higher bar
+    when the base bar of its end is missing.
+    """
+
+    def __init__(
+            self,
+            intervals: Iterable[int],
+            base_interval: int = 60
+    ) -> None:
+        """
+        Args:
+            intervals: the intervals in seconds to roll up into, the base interval is skipped
+            base_interval: the interval in seconds of the bars rolled up
+
+        Raises:
+            ValueError: an interval is not a multiple of the base interval
+        """
+        intervals = sorted({i for i in intervals if i != base_interval})
+        for interval in intervals:
+            if interval < base_interval or interval % base_interval:
+                raise ValueError(f"bar interval {interval} is not a multiple of {base_interval}.")
+
+        self._base_interval: int = base_interval
+        self._intervals: list[int] = intervals
+        # (symbol code, interval) -> [index of the bar in the calendar grid, pending bar]
+        self._pending: dict[tuple[str, int], list] = dict()
+        # (symbol code, interval) -> the close of the last bar closed
+        self._last_close: dict[tuple[str, int], float] = dict()
+
+    @property
+    def intervals(self) -> list[int]:
+        return list(self._intervals)
+
+    def _close(
+            self,
+            key: tuple[str, int]
+    ) -> KLine:
+        bar = self._pending.pop(key)[1]
+        if bar.open > bar.close:
+            bar.style = -1
+        elif bar.open < bar.close:
+            bar.style = 1
+        else:
+            bar.style = 0
+
+        bar.change_percent = .0
+        if (last_close := self._last_close.get(key)) is not None and last_close != 0:
+            bar.change_percent = ((bar.close / last_close) - 1) * 100
+        self._last_close[key] = bar.close
+        return bar
+
+    def update(
+            self,
+            bar: KLine,
+            calendar: SessionCalendar = STOCK
+    ) -> list[KLine]:
+        """
+        merge a base bar into the pending bar of every interval
+
+        Args:
+            bar: the base bar, bars of other intervals are ignored
+            calendar: the trading sessions of the symbol of the bar
+
+        Returns:
+            list[KLine]: the higher bars closed by the base bar, in ascending interval
+        """
+        if bar.interval != self._base_interval:
+            return []
+
+        ret = []
+        symbol_code = bar.symbol_code
+        # the base bar ends at its label, its last second is in the higher bar
+        offset = offset_of(bar.time // NS_PER_SECOND)
+        for interval in self._intervals:
+            key = (symbol_code, interval)
+            grid = calendar.grid(interval)
+            index = grid.position(offset - 1) >> 1
+
+            pending: Optional[list] = self._pending.get(key)
+            if pending is not None and pending[0] != index:
+                # the base bar of the end is missing
+                ret.append(self._close(key))
+                pending = None
+
+            if pending is None:
+                self._pending[key] = [index, create_kline(
+                    symbol_code=symbol_code,
+                    open_price=bar.open,
+                    close_price=bar.close,
+                    high_price=bar.high,
+                    low_price=bar.low,
+                    volume=bar.volume,
+                    change_percent=.0,
+                    start_time=bar.start_time,
+                    end_time=bar.end_time,
+                    time=grid.end_ns[index],
+                    interval=interval,
+                )]
+            else:
+                rolled = pending[1]
+                if bar.high > rolled.high:
+                    rolled.high = bar.high
+                if bar.low < rolled.low:
+                    rolled.low = bar.low
+                rolled.close = bar.close
+                rolled.volume += bar.volume
+                rolled.end_time = bar.end_time
+
+            if offset >= grid.end_offsets[index]:
+                ret.append(self._close(key))
+
+        return ret
+
+    def flush(self) -> list[KLine]:
+        """ close the pending bars of every symbol and interval """
+        return [self._close(key) for key in list(self._pending)]
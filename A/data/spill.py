@@ -0,0 +1,172 @@
+import os
+
+import numpy as np
+
+from A.types import KLine
+
+from typing import Iterable, Optional
+
+from .kline import KLineHandle, Retention
+
+# the record of a spilled bar, the times are nanoseconds of the day
+SPILL_DTYPE = np.dtype([
+    ("symbol_code", "S16"),
+    ("interval", np.int32),
+    ("time", np.int64),
+    ("start_time", np.int64),
+    ("end_time", np.int64),
+    ("open", np.float64),
+    ("high", np.float64),
+    ("low", np.float64),
+    ("close", np.float64),
+    ("volume", np.float64),
+    ("change_percent", np.float64),
+])
+
+
+class BarSpill:
+    """
+    Append-only file of closed bars.
+
+    One file is shared by the handles of every symbol, so a full market
+    subscription keeps one file open. The bars are fixed size records of
+    `SPILL_DTYPE`, buffered and appended `chunk` bars at a time, `read`
+    maps the file back as a numpy record array.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            chunk: int = 4096
+    ) -> None:
+        """
+        Args:
+            path: the file to append to, created if missing
+            chunk: the number of bars buffered before a write
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._path: str = path
+        self._chunk: int = chunk
+        self._file = open(path, "ab")
+        self._buffer: np.ndarray = np.zeros(chunk, dtype=SPILL_DTYPE)
+        self._size: int = 0
+        self._count: int = 0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def count(self) -> int:
+        """ the number of bars appended """
+        return self._count
+
+    def append(
+            self,
+            bar: KLine
+    ) -> None:
+        """ append a closed bar """
+        record = self._buffer[self._size]
+        record["symbol_code"] = bar.symbol_code.encode()
+        record["interval"] = bar.interval
+        record["time"] = bar.time
+        record["start_time"] = bar.start_time if bar.start_time is not None else -1
+        record["end_time"] = bar.end_time if bar.end_time is not None else -1
+        record["open"] = bar.open
+        record["high"] = bar.high
+        record["low"] = bar.low
+        record["close"] = bar.close
+        record["volume"] = bar.volume
+        record["change_percent"] = bar.change_percent
+        self._size += 1
+        self._count += 1
+        if self._size == self._chunk:
+            self.flush()
+
+    def flush(self) -> None:
+        """ write the buffered bars """
+        if self._size:
+            self._file.write(self._buffer[:self._size].tobytes())
+            self._file.flush()
+            self._size = 0
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    @staticmethod
+    def read(
+            path: str,
+            symbol_code: Optional[str] = None
+    ) -> np.ndarray:
+        """
+        read the bars of a spill file
+
+        Args:
+            path: the spill file
+            symbol_code: the bars of the symbol only, None for all
+
+        Returns:
+            np.ndarray: the records of `SPILL_DTYPE`, in the order they were appended
+        """
+        if os.path.getsize(path) == 0:
+            return np.empty(0, dtype=SPILL_DTYPE)
+        records = np.memmap(path, dtype=SPILL_DTYPE, mode="r")
+        if symbol_code is not None:
+            records = records[records["symbol_code"] == symbol_code.encode()]
+        return records
+
+    @staticmethod
+    def to_klines(records: np.ndarray) -> list[KLine]:
+        """ the bars of spilled records """
+        return [
+            KLine(
+                symbol_code=r["symbol_code"].decode(),
+                interval=int(r["interval"]),
+                time=int(r["time"]),
+                start_time=int(r["start_time"]) if r["start_time"] >= 0 else None,
+                end_time=int(r["end_time"]) if r["end_time"] >= 0 else None,
+                open=float(r["open"]),
+                high=float(r["high"]),
+                low=float(r["low"]),
+                close=float(r["close"]),
+                volume=float(r["volume"]),
+                change_percent=float(r["change_percent"]),
+                style=int(np.sign(r["close"] - r["open"])),
+            )
+            for r in records
+        ]
+
+
+def retention_options(config: dict) -> dict:
+    """
+    the retention arguments of the `KLineHandle` of an adapter, from the keys of its yaml config:
+
+    - `bar_retention`: `none` (default), `last`, `spill` or `all`, see `Retention`
+    - `bar_keep`: the number of bars kept with `last` and `spill`
+    - `bar_spill_path`: the spill file with `spill`
+
+    Args:
+        config: the adapter config
+
+    Returns:
+        dict: the `retention`, `keep` and `spill` keyword arguments, the `BarSpill` is opened here
+    """
+    retention = Retention[str(config.get("bar_retention", "none")).upper()]
+    spill = None
+    if retention == Retention.SPILL:
+        spill = BarSpill(config["bar_spill_path"])
+    return dict(retention=retention, keep=int(config.get("bar_keep", 0)), spill=spill)
+
+
+def memory_report(handles: Iterable[KLineHandle]) -> dict:
+    """ the sum of `KLineHandle.memory_usage` of the handles, with the number of handles """
+    report = dict(handles=0, bars=0, spilled=0, bytes=0)
+    for handle in handles:
+        report["handles"] += 1
+        for key, value in handle.memory_usage().items():
+            report[key] += value
+    return report
@@ -0,0 +1,252 @@
+import numpy as np
+
+from A.types import KLine
+
+from typing import Optional, Union
+
+# the float columns of a bar buffer, in row order of `BarBuffer._values`
+COLUMNS = ("open", "high", "low", "close", "volume", "turnover")
+# the interval of the bars that do not tell theirs
+DEFAULT_INTERVAL = 60
+
+
+class BarBuffer:
+    """
+    Preallocated ring buffer of the bars of one (symbol, interval).
+
+    Every bar is written twice, at `i` and at `i + capacity` of arrays twice
+    the capacity, so the latest `n` bars always sit in one contiguous slice
+    and the column properties return numpy views without copying. Appending
+    is O(1) and never allocates, the oldest bar is overwritten once the
+    buffer holds `capacity` bars.
+
+    The views are read only and only valid until the next append.
+    """
+
+    def __init__(
+            self,
+            capacity: int = 4096
+    ) -> None:
+        """
+        Args:
+            capacity: the max number of bars kept
+
+        Raises:
+            ValueError: invalid capacity
+        """
+        if capacity < 1:
+            raise ValueError(f"capacity must be positive, got {capacity}.")
+
+        self._capacity: int = capacity
+        # one row per column of `COLUMNS`, the rows are contiguous
+        self._values: np.ndarray = np.full((len(COLUMNS), 2 * capacity), np.nan)
+        # the bar time, nanoseconds of the day, -1 if unknown
+        self._time: np.ndarray = np.full(2 * capacity, -1, dtype=np.int64)
+        self._head: int = 0
+        self._size: int = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(
+            self,
+            bar: KLine
+    ) -> None:
+        """
+        append a bar
+
+        Args:
+            bar: the bar
+
+        Returns:
+            None
+        """
+        values = (bar.open, bar.high, bar.low, bar.close, bar.volume, getattr(bar, "turnover", np.nan))
+        bar_time = getattr(bar, "time", None)
+        if bar_time is None:
+            bar_time = -1
+        head = self._head
+        self._values[:, head] = values
+        self._values[:, head + self._capacity] = values
+        self._time[head] = self._time[head + self._capacity] = bar_time
+
+        head += 1
+        self._head = 0 if head == self._capacity else head
+        if self._size < self._capacity:
+            self._size += 1
+
+    def _slice(self, n: Optional[int] = None) -> slice:
+        size = self._size if n is None else min(max(n, 0), self._size)
+        # the latest bar is at `head - 1 + capacity`, so the slice never wraps
+        end = self._head + self._capacity
+        return slice(end - size, end)
+
+    def column(
+            self,
+            name: str,
+            n: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        the values of a column, oldest first
+
+        Args:
+            name: the column name, one of `COLUMNS` or `time`
+            n: the number of latest bars, all the bars kept if None
+
+        Returns:
+            np.ndarray: the read only view of the values
+        """
+        if name == "time":
+            view = self._time[self._slice(n)]
+        else:
+            view = self._values[COLUMNS.index(name), self._slice(n)]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.column("open")
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.column("high")
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.column("low")
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.column("close")
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.column("volume")
+
+    @property
+    def turnover(self) -> np.ndarray:
+        return self.column("turnover")
+
+    @property
+    def time(self) -> np.ndarray:
+        return self.column("time")
+
+    def history(
+            self,
+            n: Optional[int] = None
+    ) -> dict[str, np.ndarray]:
+        """
+        the latest bars
+
+        Args:
+            n: the number of latest bars, all the bars kept if None
+
+        Returns:
+            dict: column name -> the read only view of the values, oldest first
+        """
+        ret = {name: self.column(name, n) for name in COLUMNS}
+        ret["time"] = self.column("time", n)
+        return ret
+
+
+class BarStore:
+    """
+    The bars received by the engine, one `BarBuffer` per (symbol, interval),
+    the interval being the (bar type, bar size) of the non-time bars, see
+    `KLine.key`.
+
+    `AF` appends every bar before it is routed to the strategies, so the
+    strategies and the indicators read the recent history without building
+    a `pd.DataFrame` per bar.
+    """
+
+    def __init__(
+            self,
+            capacity: int = 4096
+    ) -> None:
+        """
+        Args:
+            capacity: the max number of bars kept per (symbol, interval)
+        """
+        self._capacity: int = capacity
+        self._buffers: dict[tuple, BarBuffer] = dict()
+        # the buffer of the latest bar appended
+        self._last: Optional[BarBuffer] = None
+
+    def __len__(self) -> int:
+        """ the number of bars kept of the latest (symbol, interval) appended """
+        return 0 if self._last is None else len(self._last)
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._buffers
+
+    def keys(self) -> list[tuple]:
+        return list(self._buffers)
+
+    def append(
+            self,
+            bar: KLine
+    ) -> None:
+        """
+        append a bar to the buffer of its symbol and interval
+
+        Args:
+            bar: the bar
+
+        Returns:
+            None
+        """
+        key = (bar.symbol_code, bar.key)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = BarBuffer(self._capacity)
+        buffer.append(bar)
+        self._last = buffer
+
+    def buffer(
+            self,
+            symbol_code: Optional[str] = None,
+            interval: Union[int, tuple] = DEFAULT_INTERVAL
+    ) -> Optional[BarBuffer]:
+        """
+        the buffer of a symbol and interval
+
+        Args:
+            symbol_code: the symbol code, the buffer of the latest bar appended if None
+            interval: the bar interval in seconds, or (bar type, bar size)
+
+        Returns:
+            Optional[BarBuffer]: None if no bar of the symbol and interval was appended
+        """
+        if symbol_code is None:
+            return self._last
+        return self._buffers.get((symbol_code, interval))
+
+    def history(
+            self,
+            symbol_code: str,
+            n: Optional[int] = None,
+            interval: Union[int, tuple] = DEFAULT_INTERVAL
+    ) -> dict[str, np.ndarray]:
+        """
+        the latest bars of a symbol
+
+        Args:
+            symbol_code: the symbol code
+            n: the number of latest bars, all the bars kept if None
+            interval: the bar interval in seconds, or (bar type, bar size)
+
+        Returns:
+            dict: column name -> the read only view of the values, oldest first, the
+                arrays are empty if no bar of the symbol and interval was appended
+        """
+        buffer = self._buffers.get((symbol_code, interval))
+        if buffer is None:
+            ret = {name: np.empty(0) for name in COLUMNS}
+            ret["time"] = np.empty(0, dtype=np.int64)
+            return ret
+        return buffer.history(n)
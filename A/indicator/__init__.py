@@ -1,2 +1,5 @@
 from .indicator import *
 from .base import *
+from .stream import *
+from .batch import *
+from .graph import *
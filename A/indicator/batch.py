@@ -0,0 +1,286 @@
+"""
+The indicators of `A.indicator.stream` over whole arrays, e.g. to warm up or to research.
+
+Each kernel gives the values the streaming indicator gives bar by bar, bit
+for bit: the running sums are `np.cumsum`, which adds in order like the
+streaming ones, and the recursive averages are one pass of
+`itertools.accumulate` over python floats with the same expression.
+"""
+import math
+import numpy as np
+
+from itertools import accumulate
+from typing import Callable
+
+__all__ = ["ema_array", "sma_array", "bollinger_array", "macd_array", "rsi_array", "atr_array", "sar_array"]
+
+
+def _floats(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+
+def _recurrence(
+        func: Callable[[float, float], float],
+        first: float,
+        values: np.ndarray
+) -> np.ndarray:
+    """ `first` then `func(last, value)` of each value """
+    # a numpy scalar would make every step numpy scalar arithmetic
+    return np.array(list(accumulate(values.tolist(), func, initial=float(first))), dtype=np.float64)
+
+
+def _wilder(
+        values: np.ndarray,
+        period: int
+) -> np.ndarray:
+    """ the Wilder average of `RSI` and `ATR`, from the mean of the first period values, NaN before it """
+    ret = np.full(len(values), np.nan)
+    if len(values) < period:
+        return ret
+    first = np.cumsum(values[:period])[-1] / period
+    ret[period - 1:] = _recurrence(lambda last, value: (last * (period - 1) + value) / period,
+                                   first, values[period:])
+    return ret
+
+
+def ema_array(
+        values,
+        period: int,
+        span: bool = True
+) -> np.ndarray:
+    """
+    the values of `EMA`
+
+    Args:
+        values: the prices
+        period: period
+        span: alpha = 2 / (period + 1) if true, else 1 / period
+
+    Returns:
+        np.ndarray: the EMA of each price, NaN before the period prices from the first one not NaN
+    """
+    values = _floats(values)
+    ret = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) == 0:
+        return ret
+    first = valid[0]
+    alpha = 2. / (period + 1) if span else 1. / period
+    base = 1 - alpha
+    ema = _recurrence(lambda last, price: last * base + alpha * price, values[first], values[first + 1:])
+    ret[first + period - 1:] = ema[period - 1:]
+    return ret
+
+
+def _window_sums(
+        values: np.ndarray,
+        period: int,
+        squares: bool = False
+) -> tuple:
+    """ the shift, the window sums of the values less the shift and of their squares, of `SMA` and `Bollinger` """
+    diff = values - values[0]
+    totals = np.cumsum(diff)
+    s1 = totals[period - 1:].copy()
+    s1[1:] -= totals[:len(values) - period]
+    if not squares:
+        return values[0], s1, None
+    totals2 = np.cumsum(diff * diff)
+    s2 = totals2[period - 1:].copy()
+    s2[1:] -= totals2[:len(values) - period]
+    return values[0], s1, s2
+
+
+def sma_array(
+        values,
+        period: int
+) -> np.ndarray:
+    """
+    the values of `SMA`
+
+    Args:
+        values: the prices
+        period: period
+
+    Returns:
+        np.ndarray: the moving average of each price, NaN before period prices
+    """
+    values = _floats(values)
+    ret = np.full(len(values), np.nan)
+    if len(values) >= period:
+        shift, s1, _ = _window_sums(values, period)
+        ret[period - 1:] = shift + s1 / period
+    return ret
+
+
+def bollinger_array(
+        values,
+        period: int = 20,
+        width: float = 2.
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    the values of `Bollinger`
+
+    Args:
+        values: the prices
+        period: period
+        width: the number of standard deviations of the bands
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: middle, upper, lower, NaN before period prices
+    """
+    values = _floats(values)
+    middle, upper, lower = (np.full(len(values), np.nan) for _ in range(3))
+    if len(values) >= period:
+        shift, s1, s2 = _window_sums(values, period, squares=True)
+        mean = s1 / period
+        std = np.sqrt(np.maximum(s2 / period - mean * mean, .0))
+        middle[period - 1:] = shift + mean
+        upper[period - 1:] = middle[period - 1:] + width * std
+        lower[period - 1:] = middle[period - 1:] - width * std
+    return middle, upper, lower
+
+
+def macd_array(
+        values,
+        period_s: int = 12,
+        period_l: int = 26,
+        period_m: int = 9
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    the values of `MACD`
+
+    Args:
+        values: the prices
+        period_s: the period of DIF short
+        period_l: the period of DIF long
+        period_m: the period of DEA
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: macd, dif, dea
+    """
+    values = _floats(values)
+    dif = ema_array(values, period_s) - ema_array(values, period_l)
+    dea = ema_array(dif, period_m)
+    return 2 * (dif - dea), dif, dea
+
+
+def rsi_array(
+        values,
+        period: int = 14
+) -> np.ndarray:
+    """
+    the values of `RSI`
+
+    Args:
+        values: the prices
+        period: period
+
+    Returns:
+        np.ndarray: the RSI of each price, NaN for the first period prices
+    """
+    values = _floats(values)
+    ret = np.full(len(values), np.nan)
+    diff = np.diff(values)
+    gain = _wilder(np.where(diff > 0, diff, .0), period)
+    loss = _wilder(np.where(diff < 0, -diff, .0), period)
+    total = gain + loss
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret[1:] = np.where(total != 0, 100 * (gain / total), .0)
+    return ret
+
+
+def atr_array(
+        high,
+        low,
+        close,
+        period: int = 14
+) -> np.ndarray:
+    """
+    the values of `ATR`
+
+    Args:
+        high: the high prices
+        low: the low prices
+        close: the close prices
+        period: period
+
+    Returns:
+        np.ndarray: the ATR of each bar, NaN for the first period bars
+    """
+    high, low, close = _floats(high), _floats(low), _floats(close)
+    ret = np.full(len(close), np.nan)
+    if len(close) > 1:
+        last_close = close[:-1]
+        tr = np.maximum(np.maximum(high[1:] - low[1:], np.abs(high[1:] - last_close)), np.abs(low[1:] - last_close))
+        ret[1:] = _wilder(tr, period)
+    return ret
+
+
+def sar_array(
+        high,
+        low,
+        close,
+        af_init: float = 0.02,
+        base_af: float = 0.02,
+        max_af: float = 0.2
+) -> np.ndarray:
+    """
+    the values of `SAR`, one pass over the bars as the trend reverses on the previous SAR
+
+    Args:
+        high: the high prices
+        low: the low prices
+        close: the close prices
+        af_init: the initial AF
+        base_af: the step of AF
+        max_af: the maximum of AF
+
+    Returns:
+        np.ndarray: the SAR of each bar, NaN for the first bar
+    """
+    high, low, close = _floats(high).tolist(), _floats(low).tolist(), _floats(close).tolist()
+    n = len(close)
+    ret = [math.nan] * n
+    if n < 2:
+        return np.array(ret)
+
+    bull = close[1] >= close[0]
+    ep_high = max(high[1], high[0])
+    ep_low = min(low[1], low[0])
+    sar = ret[1] = ep_low if bull else ep_high
+    af = af_init
+    for i in range(2, n):
+        h, lo = high[i], low[i]
+        reverse = False
+        if bull:
+            sar = sar + af * (ep_high - sar)
+            if lo < sar:
+                bull = False
+                reverse = True
+                sar = ep_high
+                ep_low = lo
+                af = base_af
+        else:
+            sar = sar + af * (ep_low - sar)
+            if h > sar:
+                bull = True
+                reverse = True
+                sar = ep_low
+                ep_high = h
+                af = base_af
+
+        if not reverse:
+            if bull:
+                if h > ep_high:
+                    ep_high = h
+                    af = min(af + base_af, max_af)
+                if low[i - 1] < sar:
+                    sar = low[i - 1]
+            else:
+                if lo < ep_low:
+                    ep_low = lo
+                    af = min(af + base_af, max_af)
+                if high[i - 1] > sar:
+                    sar = high[i - 1]
+        ret[i] = sar
+    return np.array(ret)
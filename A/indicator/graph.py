@@ -0,0 +1,286 @@
+from A.types import KLine
+
+from typing import Any, Iterable, Optional, Union
+
+from .stream import EMA, Indicator
+
+__all__ = ["Node", "IndicatorGraph", "Spread", "MACDLines", "macd"]
+
+NAN = float("nan")
+
+
+class Node:
+    """
+    An indicator declared to the `IndicatorGraph`, see `Strategy.indicators`.
+
+    A node is the indicator class, its parameters, its inputs and the bar
+    interval it is updated with, not an instance: the graph makes one
+    instance per symbol of every distinct node. The nodes are compared by
+    `key`, so two strategies declaring `Node(EMA, 12)` share one EMA.
+
+    The inputs are bar fields, e.g. `close`, other nodes, or (node, index)
+    for an element of the value of a node, e.g. the DIF of a `MACD`. The
+    input nodes are evaluated first, and must be of the same interval.
+    """
+
+    def __init__(
+            self,
+            indicator: type[Indicator],
+            *args,
+            inputs: Optional[Iterable[Union[str, "Node", tuple["Node", int]]]] = None,
+            interval: Union[int, tuple] = 60,
+            **kwargs
+    ) -> None:
+        """
+        Args:
+            indicator: the indicator class
+            *args: the parameters of the indicator
+            inputs: the inputs of `Indicator.update`, the `source` parameter, or `Indicator.fields`
+                of the indicators of several inputs, if None
+            interval: the bar interval in seconds, or (bar type, bar size), see `KLine.key`
+            **kwargs: the parameters of the indicator
+
+        Raises:
+            ValueError: an input node is of another interval
+        """
+        source = kwargs.pop("source", "close")
+        if inputs is None:
+            inputs = indicator.fields or (source,)
+        self.indicator: type[Indicator] = indicator
+        self.args: tuple = args
+        self.kwargs: dict = kwargs
+        self.inputs: tuple = tuple(inputs)
+        self.interval: Union[int, tuple] = interval
+
+        input_keys = []
+        for value in self.inputs:
+            node = value[0] if isinstance(value, tuple) else value
+            if isinstance(node, Node):
+                if node.interval != interval:
+                    raise ValueError(f"input {node} of interval {node.interval}, expected {interval}.")
+                input_keys.append((node.key, value[1]) if isinstance(value, tuple) else node.key)
+            else:
+                input_keys.append(value)
+        self.key: tuple = (interval, indicator, args, tuple(sorted(kwargs.items())), tuple(input_keys))
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Node) and self.key == other.key
+
+    def __repr__(self) -> str:
+        params = [repr(a) for a in self.args] + [f"{k}={v!r}" for k, v in self.kwargs.items()]
+        return f"{self.indicator.__name__}({', '.join(params)})@{self.interval}"
+
+    def nodes(self) -> list["Node"]:
+        """ the node and the nodes it depends on, each after its inputs """
+        ret = []
+        for value in self.inputs:
+            node = value[0] if isinstance(value, tuple) else value
+            if isinstance(node, Node):
+                ret += node.nodes()
+        ret.append(self)
+        return ret
+
+
+class Spread(Indicator):
+    """ the difference of two inputs, NaN until both are ready """
+
+    @property
+    def ready(self) -> bool:
+        return self.value == self.value
+
+    def update(
+            self,
+            a: float,
+            b: float
+    ) -> float:
+        self.count += 1
+        self.value = a - b
+        return self.value
+
+
+class MACDLines(Indicator):
+    """ the (macd, dif, dea) of a DIF and a DEA, see `MACD` """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.value = (NAN, NAN, NAN)
+
+    @property
+    def ready(self) -> bool:
+        return self.value[2] == self.value[2]
+
+    def update(
+            self,
+            dif: float,
+            dea: float
+    ) -> tuple[float, float, float]:
+        self.count += 1
+        self.value = (2 * (dif - dea), dif, dea)
+        return self.value
+
+
+def macd(
+        period_s: int = 12,
+        period_l: int = 26,
+        period_m: int = 9,
+        source: str = "close",
+        interval: Union[int, tuple] = 60
+) -> Node:
+    """
+    the node of a `MACD` made of EMA nodes, the EMAs are shared with the other nodes of the graph
+
+    Args:
+        period_s: the period of DIF short
+        period_l: the period of DIF long
+        period_m: the period of DEA
+        source: the bar field
+        interval: the bar interval in seconds, or (bar type, bar size)
+
+    Returns:
+        Node: the node of (macd, dif, dea), the values of `MACD`
+    """
+    fast = Node(EMA, period_s, source=source, interval=interval)
+    slow = Node(EMA, period_l, source=source, interval=interval)
+    dif = Node(Spread, inputs=(fast, slow), interval=interval)
+    dea = Node(EMA, period_m, inputs=(dif,), interval=interval)
+    return Node(MACDLines, inputs=(dif, dea), interval=interval)
+
+
+class IndicatorGraph:
+    """
+    The indicators of the strategies, evaluated once per bar before `on_bar`.
+
+    The nodes declared by the strategies are deduplicated by (symbol, `Node.key`),
+    and the nodes of the symbols of a strategy are only made for those symbols,
+    so the cost of a bar is the number of distinct indicators of its symbol and
+    interval, whatever the number of strategies asking for them. A bar updates
+    the nodes of its symbol and `KLine.key` in topological order, and the
+    strategies read the values with `value`.
+    """
+
+    def __init__(self) -> None:
+        # (symbol codes, None for every symbol, node) in the order declared
+        self._declared: list[tuple[Optional[frozenset[str]], Node]] = list()
+        # (symbol code, bar key) -> node key -> the indicator
+        self._instances: dict[tuple, dict[tuple, Indicator]] = dict()
+        # (symbol code, bar key) -> node key -> the value
+        self._values: dict[tuple, dict[tuple, Any]] = dict()
+        # (symbol code, bar key) -> the (node key, update, inputs) to run per bar, in order
+        self._plans: dict[tuple, list[tuple]] = dict()
+
+    def __len__(self) -> int:
+        """ the number of indicators made """
+        return sum(len(instances) for instances in self._instances.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._declared)
+
+    def add(
+            self,
+            node: Node,
+            symbols: Optional[Iterable[str]] = None
+    ) -> None:
+        """
+        declare a node and the nodes it depends on
+
+        Args:
+            node: the node
+            symbols: the symbol codes the node is made for, every symbol if None or empty
+
+        Returns:
+            None
+        """
+        self._declared.append((frozenset(symbols) if symbols else None, node))
+        # the plans are made again with the new nodes, the indicators made are kept
+        self._plans.clear()
+
+    def _plan(
+            self,
+            key: tuple
+    ) -> list[tuple]:
+        symbol_code, bar_key = key
+        instances = self._instances.setdefault(key, dict())
+        self._values.setdefault(key, dict())
+        plan = []
+        planned = set()
+        for symbols, declared in self._declared:
+            if declared.interval != bar_key or (symbols is not None and symbol_code not in symbols):
+                continue
+            for node in declared.nodes():
+                if node.key in planned:
+                    continue
+                planned.add(node.key)
+                indicator = instances.get(node.key)
+                if indicator is None:
+                    indicator = instances[node.key] = node.indicator(*node.args, **node.kwargs)
+                # (bar field, None), (node key, None) or (node key, index)
+                inputs = []
+                for value in node.inputs:
+                    if isinstance(value, tuple):
+                        inputs.append((value[0].key, value[1]))
+                    elif isinstance(value, Node):
+                        inputs.append((value.key, None))
+                    else:
+                        inputs.append((value, None))
+                plan.append((node.key, indicator.update, tuple(inputs)))
+        self._plans[key] = plan
+        return plan
+
+    def update(
+            self,
+            bar: KLine
+    ) -> None:
+        """
+        update the nodes of the symbol and interval of the bar
+
+        Args:
+            bar: the bar
+
+        Returns:
+            None
+        """
+        key = (bar.symbol_code, bar.key)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plan(key)
+        values = self._values[key]
+        for node_key, update, inputs in plan:
+            args = []
+            for ref, index in inputs:
+                if index is not None:
+                    args.append(values[ref][index])
+                elif ref.__class__ is str:
+                    args.append(getattr(bar, ref))
+                else:
+                    args.append(values[ref])
+            values[node_key] = update(*args)
+
+    def indicator(
+            self,
+            node: Node,
+            symbol_code: str
+    ) -> Optional[Indicator]:
+        """ the indicator of the node of a symbol, None before the first bar of the symbol """
+        instances = self._instances.get((symbol_code, node.interval))
+        return None if instances is None else instances.get(node.key)
+
+    def value(
+            self,
+            node: Node,
+            symbol_code: str
+    ) -> Any:
+        """
+        the value of the node of a symbol after the latest bar
+
+        Args:
+            node: the node
+            symbol_code: the symbol code
+
+        Returns:
+            Any: the value of the indicator, NaN before the first bar of the symbol
+        """
+        indicator = self.indicator(node, symbol_code)
+        return float("nan") if indicator is None else indicator.value
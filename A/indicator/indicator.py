@@ -1,9 +1,10 @@
-import talib as ta
 import functools
 
-from A import AF
 from .base import ema
-from typing import Optional, Any
+from typing import Optional, Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from A import AF
 
 
 class T:
@@ -36,14 +37,32 @@ class T:
 
 
 def calc_rsi(
-        af: AF,
+        af: "AF",
         base: str,
-        period: int
+        period: int,
+        symbol_code: Optional[str] = None,
+        interval: int = 60
 ) -> float:
-    l = len(af.bar_data)
-    if l < period:
+    """
+    RSI of the bars kept by `AF.bar_data`
+
+    Args:
+        af: the AF
+        base: the bar column, e.g. `close`
+        period: period
+        symbol_code: the symbol code, the symbol of the latest bar if None
+        interval: the bar interval in seconds
+
+    Returns:
+        float: rsi value, 0 if there are less than period bars
+
+    """
+    import talib as ta
+
+    bars = af.bar_data.buffer(symbol_code, interval)
+    if bars is None or len(bars) < period:
         return 0
-    return ta.RSI(af.bar_data[base], period).iloc[-1]
+    return ta.RSI(bars.column(base), period)[-1]
 
 
 @T.cache(
@@ -118,7 +137,8 @@ def calc_macd(
 ) -> tuple[float, float, float]:
     """MACD indicator
 
-    有些小问题
+    有些小问题, the EMAs are shared by every caller of the process, see `A.indicator.MACD` for a
+    MACD per symbol
 
     Args:
         price:
@@ -139,17 +159,19 @@ def calc_macd(
 
 
 def calc_sar(
-        af: AF,
+        af: "AF",
         last_sar: float,
         bull: bool,
         wtf_high_price: float = 0,
         wtf_low_price: float = 0,
         af_init: Optional[float] = 0.02,
         base_af: Optional[float] = 0.02,
-        max_af: Optional[float] = 0.2
+        max_af: Optional[float] = 0.2,
+        symbol_code: Optional[str] = None,
+        interval: int = 60
 ) -> tuple[float, float, float, float, float]:
     """
-    SAR indicator
+    SAR indicator of the bars kept by `AF.bar_data`
 
     Args:
         af:
@@ -160,22 +182,21 @@ def calc_sar(
         af_init: 历史 AF
         base_af: 基础值 AF
         max_af: 最大 AF
+        symbol_code: the symbol code, the symbol of the latest bar if None
+        interval: the bar interval in seconds
 
     Returns:
         tuple[float, float, float, float, float]: sar, af, bull, wtf_high_price, wtf_low_price
 
     """
-    if len(af.bar_data) == 0:
+    bars = af.bar_data.buffer(symbol_code, interval)
+    if bars is None or len(bars) == 0:
         return 0, af_init, bull, wtf_high_price, wtf_low_price
-    elif len(af.bar_data) < 3:
-        return af.bar_data.iloc[-1].close, af_init, bull, wtf_high_price, wtf_low_price
+    elif len(bars) < 3:
+        return bars.column("close", 1)[-1], af_init, bull, wtf_high_price, wtf_low_price
 
-    bar = af.bar_data.iloc[-1]
-    last_bar = af.bar_data.iloc[-2]
-    high_price = bar.high
-    low_price = bar.low
-    last_high_price = last_bar.high
-    last_low_price = last_bar.low
+    high_price, last_high_price = bars.column("high", 2)[::-1]
+    low_price, last_low_price = bars.column("low", 2)[::-1]
 
     reverse = False
     if bull:
@@ -204,15 +225,11 @@ def calc_sar(
                 af_init = min(af_init + base_af, max_af)
             if last_low_price < sar:
                 sar = last_low_price
-            if last_bar.low < sar:
-                sar = last_bar.low
         else:
             if low_price < wtf_low_price:
                 wtf_low_price = low_price
                 af_init = min(af_init + base_af, max_af)
             if last_high_price > sar:
                 sar = last_high_price
-            if last_bar.high > sar:
-                sar = last_bar.high
 
     return sar, af_init, bull, wtf_high_price, wtf_low_price
@@ -0,0 +1,550 @@
+import math
+
+from A.types import KLine
+
+from collections import deque
+from typing import Any, Optional
+
+__all__ = ["Indicator", "EMA", "SMA", "MACD", "RSI", "SAR", "ATR", "Bollinger"]
+
+NAN = float("nan")
+
+
+class Indicator:
+    """
+    Base of the streaming indicators.
+
+    An indicator is updated with one bar at a time in O(1) and keeps its
+    own state, so an instance is made per symbol, interval and strategy.
+    The value is NaN until the indicator has seen enough bars, see `ready`,
+    an element of a tuple value until its own bars, e.g. the DIF of a MACD
+    is ready before the DEA.
+
+    The state is read with `snapshot` and put back with `restore`, e.g. to
+    carry the indicators of a backtest day over to the next, or to warm up
+    a live strategy from a saved state. The snapshot is made of floats,
+    ints, lists and dicts only and can be dumped as json or yaml.
+    """
+
+    # the attributes of the state, see `snapshot`
+    _state: tuple[str, ...] = ()
+    # the bar fields `update_bar` reads, of the indicators of several inputs
+    fields: tuple[str, ...] = ()
+
+    def __init__(
+            self,
+            source: str = "close"
+    ) -> None:
+        """
+        Args:
+            source: the bar field `update_bar` reads
+        """
+        self.source: str = source
+        self.value: Any = NAN
+        self.count: int = 0
+
+    @property
+    def params(self) -> dict:
+        """ the parameters of the indicator """
+        return dict()
+
+    @property
+    def ready(self) -> bool:
+        """ whether the indicator has seen enough bars for a value """
+        raise NotImplementedError
+
+    def update(self, *args) -> Any:
+        """ add a bar, returns the value """
+        raise NotImplementedError
+
+    def update_bar(
+            self,
+            bar: KLine
+    ) -> Any:
+        """ add a bar, of its `source` field """
+        return self.update(getattr(bar, self.source))
+
+    def snapshot(self) -> dict:
+        """ the state of the indicator, see `restore` """
+        state = dict(params=self.params, value=self.value, count=self.count)
+        for name in self._state:
+            v = getattr(self, name)
+            if isinstance(v, Indicator):
+                v = v.snapshot()
+            elif isinstance(v, deque):
+                v = [list(x) if isinstance(x, tuple) else x for x in v]
+            state[name] = v
+        return state
+
+    def restore(
+            self,
+            state: dict
+    ) -> None:
+        """
+        put back a state of `snapshot`
+
+        Args:
+            state: the state, of an indicator of the same class and parameters
+
+        Raises:
+            ValueError: the state is of other parameters
+        """
+        if state["params"] != self.params:
+            raise ValueError(f"{type(self).__name__} state of {state['params']}, expected {self.params}.")
+        self.value = tuple(state["value"]) if isinstance(state["value"], list) else state["value"]
+        self.count = state["count"]
+        for name in self._state:
+            v = getattr(self, name)
+            if isinstance(v, Indicator):
+                v.restore(state[name])
+            elif isinstance(v, deque):
+                setattr(self, name, deque((tuple(x) if isinstance(x, list) else x for x in state[name]),
+                                          maxlen=v.maxlen))
+            else:
+                setattr(self, name, state[name])
+
+
+class EMA(Indicator):
+    """
+    exponential moving average, starting from the first value
+
+    The NaNs before the first value are skipped, so an EMA of an indicator
+    starts when the indicator is ready.
+    """
+
+    _state = ("_ema",)
+
+    def __init__(
+            self,
+            period: int,
+            span: bool = True,
+            source: str = "close"
+    ) -> None:
+        """
+        Args:
+            period: period
+            span: alpha = 2 / (period + 1) if true, else 1 / period
+            source: the bar field `update_bar` reads
+        """
+        super().__init__(source)
+        self.period: int = period
+        self.span: bool = span
+        self._alpha: float = 2. / (period + 1) if span else 1. / period
+        self._base: float = 1 - self._alpha
+        self._ema: Optional[float] = None
+
+    @property
+    def params(self) -> dict:
+        return dict(period=self.period, span=self.span)
+
+    @property
+    def ready(self) -> bool:
+        return self.count >= self.period
+
+    def update(
+            self,
+            price: float
+    ) -> float:
+        if self._ema is None:
+            if price != price:
+                return self.value
+            self._ema = price
+        else:
+            self._ema = self._ema * self._base + self._alpha * price
+        self.count += 1
+        if self.count >= self.period:
+            self.value = self._ema
+        return self.value
+
+
+class SMA(Indicator):
+    """
+    simple moving average
+
+    The window sum is the difference of two running totals, the totals are
+    of the values less the first one so they stay small.
+    """
+
+    _state = ("_shift", "_total", "_totals")
+
+    def __init__(
+            self,
+            period: int,
+            source: str = "close"
+    ) -> None:
+        """
+        Args:
+            period: period
+            source: the bar field `update_bar` reads
+        """
+        super().__init__(source)
+        self.period: int = period
+        self._shift: Optional[float] = None
+        self._total: float = .0
+        # the running totals of the last period + 1 values
+        self._totals: deque = deque([.0], maxlen=period + 1)
+
+    @property
+    def params(self) -> dict:
+        return dict(period=self.period)
+
+    @property
+    def ready(self) -> bool:
+        return self.count >= self.period
+
+    def update(
+            self,
+            price: float
+    ) -> float:
+        self.count += 1
+        if self._shift is None:
+            self._shift = price
+        self._total += price - self._shift
+        self._totals.append(self._total)
+        if self.count >= self.period:
+            self.value = self._shift + (self._totals[-1] - self._totals[0]) / self.period
+        return self.value
+
+
+class Bollinger(Indicator):
+    """
+    Bollinger bands, the moving average and the population standard deviation of the period
+
+    The window sums are kept like `SMA` ones, the variance is 0 when the
+    rounding of the sums makes it negative.
+    """
+
+    _state = ("_shift", "_total", "_total2", "_totals")
+
+    def __init__(
+            self,
+            period: int = 20,
+            width: float = 2.,
+            source: str = "close"
+    ) -> None:
+        """
+        Args:
+            period: period
+            width: the number of standard deviations of the bands
+            source: the bar field `update_bar` reads
+        """
+        super().__init__(source)
+        self.period: int = period
+        self.width: float = width
+        self.value = (NAN, NAN, NAN)
+        self._shift: Optional[float] = None
+        self._total: float = .0
+        self._total2: float = .0
+        # the running totals of the values and of their squares of the last period + 1 values
+        self._totals: deque = deque([(.0, .0)], maxlen=period + 1)
+
+    @property
+    def params(self) -> dict:
+        return dict(period=self.period, width=self.width)
+
+    @property
+    def ready(self) -> bool:
+        return self.count >= self.period
+
+    def update(
+            self,
+            price: float
+    ) -> tuple[float, float, float]:
+        """
+        Returns:
+            tuple[float, float, float]: middle, upper, lower
+        """
+        self.count += 1
+        if self._shift is None:
+            self._shift = price
+        diff = price - self._shift
+        self._total += diff
+        self._total2 += diff * diff
+        self._totals.append((self._total, self._total2))
+        if self.count >= self.period:
+            s1 = self._totals[-1][0] - self._totals[0][0]
+            s2 = self._totals[-1][1] - self._totals[0][1]
+            mean = s1 / self.period
+            std = math.sqrt(max(s2 / self.period - mean * mean, .0))
+            middle = self._shift + mean
+            self.value = (middle, middle + self.width * std, middle - self.width * std)
+        return self.value
+
+
+class MACD(Indicator):
+    """ MACD, the macd is 2 * (dif - dea), the DEA starts from the first DIF of the ready EMAs """
+
+    _state = ("_fast", "_slow", "_signal")
+
+    def __init__(
+            self,
+            period_s: int = 12,
+            period_l: int = 26,
+            period_m: int = 9,
+            source: str = "close"
+    ) -> None:
+        """
+        Args:
+            period_s: the period of DIF short
+            period_l: the period of DIF long
+            period_m: the period of DEA
+            source: the bar field `update_bar` reads
+        """
+        super().__init__(source)
+        self.value = (NAN, NAN, NAN)
+        self._fast: EMA = EMA(period_s)
+        self._slow: EMA = EMA(period_l)
+        self._signal: EMA = EMA(period_m)
+
+    @property
+    def params(self) -> dict:
+        return dict(period_s=self._fast.period, period_l=self._slow.period, period_m=self._signal.period)
+
+    @property
+    def ready(self) -> bool:
+        return self._signal.ready
+
+    def update(
+            self,
+            price: float
+    ) -> tuple[float, float, float]:
+        """
+        Returns:
+            tuple[float, float, float]: macd, dif, dea
+        """
+        self.count += 1
+        dif = self._fast.update(price) - self._slow.update(price)
+        dea = self._signal.update(dif)
+        self.value = (2 * (dif - dea), dif, dea)
+        return self.value
+
+
+class RSI(Indicator):
+    """ RSI of Wilder, the averages start from the mean of the first period changes like `talib.RSI` """
+
+    _state = ("_last", "_gain", "_loss")
+
+    def __init__(
+            self,
+            period: int = 14,
+            source: str = "close"
+    ) -> None:
+        """
+        Args:
+            period: period
+            source: the bar field `update_bar` reads
+        """
+        super().__init__(source)
+        self.period: int = period
+        self._last: Optional[float] = None
+        # the sums of the gains and losses until period changes, their averages after
+        self._gain: float = .0
+        self._loss: float = .0
+
+    @property
+    def params(self) -> dict:
+        return dict(period=self.period)
+
+    @property
+    def ready(self) -> bool:
+        return self.count > self.period
+
+    def update(
+            self,
+            price: float
+    ) -> float:
+        self.count += 1
+        last, self._last = self._last, price
+        if last is None:
+            return self.value
+
+        diff = price - last
+        gain = diff if diff > 0 else .0
+        loss = -diff if diff < 0 else .0
+        if self.count <= self.period:
+            self._gain += gain
+            self._loss += loss
+            return self.value
+        if self.count == self.period + 1:
+            self._gain = (self._gain + gain) / self.period
+            self._loss = (self._loss + loss) / self.period
+        else:
+            self._gain = (self._gain * (self.period - 1) + gain) / self.period
+            self._loss = (self._loss * (self.period - 1) + loss) / self.period
+
+        total = self._gain + self._loss
+        self.value = 100 * (self._gain / total) if total != 0 else .0
+        return self.value
+
+
+class ATR(Indicator):
+    """ average true range of Wilder, starting from the mean of the first period true ranges like `talib.ATR` """
+
+    _state = ("_last_close", "_atr")
+    fields = ("high", "low", "close")
+
+    def __init__(
+            self,
+            period: int = 14
+    ) -> None:
+        """
+        Args:
+            period: period
+        """
+        super().__init__()
+        self.period: int = period
+        self._last_close: Optional[float] = None
+        # the sum of the true ranges until period ones, their average after
+        self._atr: float = .0
+
+    @property
+    def params(self) -> dict:
+        return dict(period=self.period)
+
+    @property
+    def ready(self) -> bool:
+        return self.count > self.period
+
+    def update(
+            self,
+            high: float,
+            low: float,
+            close: float
+    ) -> float:
+        self.count += 1
+        last_close, self._last_close = self._last_close, close
+        if last_close is None:
+            return self.value
+
+        tr = max(high - low, abs(high - last_close), abs(low - last_close))
+        if self.count <= self.period:
+            self._atr += tr
+            return self.value
+        if self.count == self.period + 1:
+            self._atr = (self._atr + tr) / self.period
+        else:
+            self._atr = (self._atr * (self.period - 1) + tr) / self.period
+        self.value = self._atr
+        return self.value
+
+    def update_bar(
+            self,
+            bar: KLine
+    ) -> float:
+        return self.update(bar.high, bar.low, bar.close)
+
+
+class SAR(Indicator):
+    """
+    parabolic SAR, the rules of `calc_sar`
+
+    The trend of the second bar is up unless it closes below the first one,
+    the SAR starts from the extreme of the two bars against the trend.
+    """
+
+    _state = ("_bull", "_af", "_sar", "_high", "_low", "_last_high", "_last_low", "_last_close")
+    fields = ("high", "low", "close")
+
+    def __init__(
+            self,
+            af_init: float = 0.02,
+            base_af: float = 0.02,
+            max_af: float = 0.2
+    ) -> None:
+        """
+        Args:
+            af_init: the initial AF
+            base_af: the step of AF
+            max_af: the maximum of AF
+        """
+        super().__init__()
+        self.af_init: float = af_init
+        self.base_af: float = base_af
+        self.max_af: float = max_af
+        self._bull: bool = True
+        self._af: float = af_init
+        self._sar: float = NAN
+        # the extreme prices of the trend
+        self._high: float = NAN
+        self._low: float = NAN
+        self._last_high: float = NAN
+        self._last_low: float = NAN
+        self._last_close: float = NAN
+
+    @property
+    def params(self) -> dict:
+        return dict(af_init=self.af_init, base_af=self.base_af, max_af=self.max_af)
+
+    @property
+    def ready(self) -> bool:
+        return self.count >= 2
+
+    def update(
+            self,
+            high: float,
+            low: float,
+            close: float
+    ) -> float:
+        """
+        Returns:
+            float: the SAR, NaN for the first bar
+        """
+        self.count += 1
+        if self.count == 1:
+            self.value = NAN
+        elif self.count == 2:
+            self._bull = close >= self._last_close
+            self._high = max(high, self._last_high)
+            self._low = min(low, self._last_low)
+            self._sar = self._low if self._bull else self._high
+            self.value = self._sar
+        else:
+            self.value = self._step(high, low)
+        self._last_high, self._last_low, self._last_close = high, low, close
+        return self.value
+
+    def _step(
+            self,
+            high: float,
+            low: float
+    ) -> float:
+        reverse = False
+        if self._bull:
+            sar = self._sar + self._af * (self._high - self._sar)
+            if low < sar:
+                self._bull = False
+                reverse = True
+                sar = self._high
+                self._low = low
+                self._af = self.base_af
+        else:
+            sar = self._sar + self._af * (self._low - self._sar)
+            if high > sar:
+                self._bull = True
+                reverse = True
+                sar = self._low
+                self._high = high
+                self._af = self.base_af
+
+        if not reverse:
+            if self._bull:
+                if high > self._high:
+                    self._high = high
+                    self._af = min(self._af + self.base_af, self.max_af)
+                if self._last_low < sar:
+                    sar = self._last_low
+            else:
+                if low < self._low:
+                    self._low = low
+                    self._af = min(self._af + self.base_af, self.max_af)
+                if self._last_high > sar:
+                    sar = self._last_high
+
+        self._sar = sar
+        return sar
+
+    def update_bar(
+            self,
+            bar: KLine
+    ) -> float:
+        return self.update(bar.high, bar.low, bar.close)
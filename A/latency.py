@@ -0,0 +1,233 @@
+import time
+import json
+
+from A.types import Event, EventType
+
+from typing import Callable, Optional
+
+# the linear buckets below 2 ** (SUB_BUCKET_BITS + 1) ns, every power of two above
+# is split into 2 ** SUB_BUCKET_BITS buckets, so the relative error is below 3.2%
+SUB_BUCKET_BITS = 5
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+_LINEAR = _SUB_BUCKETS << 1
+
+
+def _bucket_index(value: int) -> int:
+    if value < _LINEAR:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return _LINEAR + (shift - 1) * _SUB_BUCKETS + (value >> shift) - _SUB_BUCKETS
+
+
+def _bucket_value(index: int) -> int:
+    if index < _LINEAR:
+        return index
+    shift, sub = divmod(index - _LINEAR, _SUB_BUCKETS)
+    return (sub + _SUB_BUCKETS) << (shift + 1)
+
+
+class Histogram:
+    """
+    HDR-style log-linear histogram of nanosecond latencies.
+
+    Recording is a bucket index calculation and a list increment, the
+    percentiles are the lower bounds of the buckets.
+    """
+
+    def __init__(self) -> None:
+        self._counts: list[int] = []
+        self.count: int = 0
+        self.total: int = 0
+        self.min: int = 0
+        self.max: int = 0
+
+    def record(
+            self,
+            value: int
+    ) -> None:
+        """
+        record a latency
+
+        Args:
+            value: the latency in nanoseconds, negative values are recorded as 0
+
+        Returns:
+            None
+        """
+        if value < 0:
+            value = 0
+        index = _bucket_index(value)
+        counts = self._counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def merge(
+            self,
+            other: "Histogram"
+    ) -> None:
+        """ add the records of other histogram into this one """
+        if other.count == 0:
+            return
+        if len(other._counts) > len(self._counts):
+            self._counts.extend([0] * (len(other._counts) - len(self._counts)))
+        for i, count in enumerate(other._counts):
+            self._counts[i] += count
+        self.min = other.min if self.count == 0 else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(
+            self,
+            p: float
+    ) -> int:
+        """
+        the value at percentile
+
+        Args:
+            p: the percentile, 0 - 100
+
+        Returns:
+            int: the latency in nanoseconds
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, int(self.count * p / 100 + 0.5))
+        seen = 0
+        for i, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(max(_bucket_value(i), self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """ the count, mean, min, max and p50/p90/p99/p99.9 in microseconds """
+        us = 1000
+        return dict(
+            count=self.count,
+            mean=self.total / self.count / us if self.count else .0,
+            min=self.min / us,
+            p50=self.percentile(50) / us,
+            p90=self.percentile(90) / us,
+            p99=self.percentile(99) / us,
+            p999=self.percentile(99.9) / us,
+            max=self.max / us,
+        )
+
+
+class LatencyRecorder:
+    """
+    Latency histograms of the events and of the strategy callbacks.
+
+    The adapters stamp `Event.ingress_ns` when the market data arrives and
+    the transport writers stamp `Event.put_ns`, the engine records the
+    stages per event type on dequeue and, through the callbacks wrapped by
+    `wrap`, the time spent in every strategy callback and the end to end
+    latency until the callback returns. All stamps are `time.monotonic_ns`.
+    """
+
+    def __init__(self) -> None:
+        self.histograms: dict[str, Histogram] = dict()
+        # the ingress stamp of the event being dispatched, read by the wrapped callbacks
+        self._ingress: list[int] = [0]
+
+    def histogram(
+            self,
+            name: str
+    ) -> Histogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def wrap(
+            self,
+            strategy: object,
+            event_type: EventType,
+            callback: Callable
+    ) -> Callable:
+        """
+        wrap the strategy callback to record its duration and the end to end latency
+
+        Args:
+            strategy: the strategy of callback
+            event_type: the event type of callback
+            callback: the strategy callback
+
+        Returns:
+            Callable: the callback to route the events to
+        """
+        duration = self.histogram(f"{type(strategy).__name__}.{callback.__name__}")
+        end_to_end = self.histogram(f"{event_type.name}:ingress->return")
+        ingress = self._ingress
+
+        def timed(data):
+            started = time.monotonic_ns()
+            callback(data)
+            returned = time.monotonic_ns()
+            duration.record(returned - started)
+            if ingress[0]:
+                end_to_end.record(returned - ingress[0])
+
+        return timed
+
+    def on_dequeue(
+            self,
+            event: Event,
+            dequeue_ns: int
+    ) -> None:
+        """
+        record the stages of the event before the engine, called before it is dispatched
+
+        Args:
+            event: the event message
+            dequeue_ns: the time the batch of event was dequeued
+
+        Returns:
+            None
+        """
+        name = event.event_type.name
+        ingress_ns, put_ns = event.ingress_ns, event.put_ns
+        self._ingress[0] = ingress_ns
+        if ingress_ns and put_ns:
+            self.histogram(f"{name}:ingress->put").record(put_ns - ingress_ns)
+        if put_ns:
+            self.histogram(f"{name}:put->dequeue").record(dequeue_ns - put_ns)
+        if ingress_ns:
+            self.histogram(f"{name}:ingress->dequeue").record(dequeue_ns - ingress_ns)
+
+    def report(self) -> str:
+        """ the histograms as a table, in microseconds """
+        lines = [f"{'latency(us)':<40}{'count':>10}{'mean':>10}{'p50':>10}{'p90':>10}"
+                 f"{'p99':>10}{'p99.9':>10}{'max':>12}"]
+        for name in sorted(self.histograms):
+            s = self.histograms[name].summary()
+            lines.append(f"{name:<40}{s['count']:>10}{s['mean']:>10.1f}{s['p50']:>10.1f}{s['p90']:>10.1f}"
+                         f"{s['p99']:>10.1f}{s['p999']:>10.1f}{s['max']:>12.1f}")
+        return "\n".join(lines)
+
+    def dump(
+            self,
+            path: Optional[str] = None
+    ) -> str:
+        """
+        dump the histograms
+
+        Args:
+            path: write the summaries as json to path if given
+
+        Returns:
+            str: the report table
+        """
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({k: v.summary() for k, v in self.histograms.items()}, f, indent=2)
+        return self.report()
@@ -0,0 +1,199 @@
+import zlib
+
+from A.base.strategy.base import Strategy
+from A.types import EventType, Event, StrategyType
+
+from typing import Callable, Optional, Sequence
+
+
+def shard_of(
+        symbol_code: str,
+        shards: int
+) -> int:
+    """ the shard of the symbol code, stable across processes and runs """
+    return zlib.crc32(symbol_code.encode()) % shards
+
+
+class Router:
+    """
+    Routing index of the strategy callbacks.
+
+    Callbacks are indexed by (event type, market, symbol code), and by the
+    bar key too for the bars, see `KLine.key`, a strategy receives the bars
+    of its `bar_intervals` and `activity_bars` only. A strategy without any subscribed symbol code is
+    a wildcard strategy and receives every symbol of its market. The index
+    is rebuilt when a strategy is added, so dispatching an event is a
+    single dict lookup.
+
+    A router of a shard only passes the symbols of the shard to the
+    strategies with `shard_by_symbol`, see `shard_of`, the wildcard
+    strategies are indexed for the symbols in and out of the shard, so the
+    index does not grow with the symbols received. The callbacks can be
+    wrapped once when they are indexed, e.g. to time them.
+    """
+
+    CALLBACK_NAMES: dict[EventType, str] = {
+        EventType.SNAPSHOT_DATA: "on_snapshot",
+        EventType.KLINE_DATA: "on_bar",
+        EventType.ORDERBOOK_DATA: "on_order_book",
+    }
+
+    def __init__(
+            self,
+            shard: Optional[tuple[int, int]] = None,
+            wrap: Optional[Callable[[Strategy, EventType, Callable], Callable]] = None
+    ) -> None:
+        """
+        Args:
+            shard: (shard index, the number of shards) of this router, None for all symbols.
+            wrap: called with (strategy, event type, callback) to get the callback to index.
+        """
+        self._shard: Optional[tuple[int, int]] = shard
+        self._wrap: Optional[Callable[[Strategy, EventType, Callable], Callable]] = wrap
+        # (strategy id, event type) -> the indexed callback
+        self._wrapped: dict[tuple[int, EventType], Callable] = dict()
+        self._strategies: list[Strategy] = list()
+        # (event type, market, symbol code[, bar key]) -> callbacks
+        self._routes: dict[tuple, tuple[Callable, ...]] = dict()
+        # (event type, market[, bar key]) -> callbacks of the wildcard strategies, of the symbols out of the shard
+        self._wildcards: dict[tuple, tuple[Callable, ...]] = dict()
+        # (event type, market[, bar key]) -> callbacks of the wildcard strategies of the symbols of the shard
+        self._shard_wildcards: dict[tuple, tuple[Callable, ...]] = dict()
+
+    @property
+    def strategies(self) -> list[Strategy]:
+        return self._strategies
+
+    def add(
+            self,
+            strategy: Strategy
+    ) -> None:
+        """
+        add the strategy and rebuild the routing index,
+        the subscribed symbol codes are read at this time.
+
+        Args:
+            strategy: the `Strategy` instance
+
+        Returns:
+            None
+        """
+        self._strategies.append(strategy)
+        self._build()
+
+    def _accepts(
+            self,
+            strategy: Strategy,
+            code: str
+    ) -> bool:
+        """ whether the strategy receives the symbol code """
+        if strategy.sub_symbol_code and code not in strategy.sub_symbol_code:
+            return False
+        if self._shard is None or not strategy.shard_by_symbol:
+            return True
+        return self._in_shard(code)
+
+    def _in_shard(
+            self,
+            code: str
+    ) -> bool:
+        """ whether the symbol code is of the shard of the router """
+        return self._shard is None or shard_of(code, self._shard[1]) == self._shard[0]
+
+    def _callback(
+            self,
+            strategy: Strategy,
+            event_type: EventType
+    ) -> Callable:
+        callback = getattr(strategy, self.CALLBACK_NAMES[event_type])
+        if self._wrap is None:
+            return callback
+
+        key = (id(strategy), event_type)
+        wrapped = self._wrapped.get(key)
+        if wrapped is None:
+            wrapped = self._wrapped[key] = self._wrap(strategy, event_type, callback)
+        return wrapped
+
+    @staticmethod
+    def _bar_keys(strategy: Strategy) -> list:
+        """ the keys of the bars the strategy receives """
+        return [*strategy.bar_intervals, *strategy.activity_bars]
+
+    def _callbacks(
+            self,
+            event_type: EventType,
+            market: StrategyType,
+            code: str,
+            bar_key=None
+    ) -> tuple[Callable, ...]:
+        # keep the order in which the strategies are added
+        return tuple(
+            self._callback(s, event_type) for s in self._strategies
+            if s.type() == market and self._accepts(s, code)
+            and (bar_key is None or bar_key in self._bar_keys(s))
+        )
+
+    def _wildcard_callbacks(
+            self,
+            event_type: EventType,
+            market: StrategyType,
+            in_shard: bool,
+            bar_key=None
+    ) -> tuple[Callable, ...]:
+        """ the callbacks of the wildcard strategies of a symbol subscribed by no strategy """
+        return tuple(
+            self._callback(s, event_type) for s in self._strategies
+            if s.type() == market and not s.sub_symbol_code
+            and (in_shard or self._shard is None or not s.shard_by_symbol)
+            and (bar_key is None or bar_key in self._bar_keys(s))
+        )
+
+    def _build(self) -> None:
+        routes = dict()
+        wildcards = dict()
+        shard_wildcards = dict()
+
+        markets = {s.type() for s in self._strategies}
+        bar_keys = {key for s in self._strategies for key in self._bar_keys(s)}
+        for event_type in self.CALLBACK_NAMES:
+            # the bars are indexed per bar key
+            suffixes = [(k,) for k in bar_keys] if event_type == EventType.KLINE_DATA else [()]
+            for market in markets:
+                codes = {code for s in self._strategies if s.type() == market for code in s.sub_symbol_code}
+                for suffix in suffixes:
+                    wildcards[(event_type, market, *suffix)] = self._wildcard_callbacks(event_type, market, False,
+                                                                                        *suffix)
+                    shard_wildcards[(event_type, market, *suffix)] = self._wildcard_callbacks(event_type, market,
+                                                                                              True, *suffix)
+                    for code in codes:
+                        routes[(event_type, market, code, *suffix)] = self._callbacks(event_type, market, code,
+                                                                                      *suffix)
+
+        self._routes = routes
+        self._wildcards = wildcards
+        self._shard_wildcards = shard_wildcards
+
+    def route(
+            self,
+            event: Event
+    ) -> Sequence[Callable]:
+        """
+        get the callbacks interested in the event
+
+        Args:
+            event: the event message
+
+        Returns:
+            Sequence[Callable]: the strategy callbacks, called with `event.data`
+        """
+        event_type = event.event_type
+        if event_type == EventType.KLINE_DATA:
+            key = (event_type, event.ex_type, event.data.symbol_code, event.data.key)
+        else:
+            key = (event_type, event.ex_type, event.data.symbol_code)
+        callbacks = self._routes.get(key)
+        if callbacks is None:
+            wildcards = self._shard_wildcards if self._in_shard(key[2]) else self._wildcards
+            return wildcards.get((event_type, event.ex_type, *key[3:]), ())
+        return callbacks
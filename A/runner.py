@@ -0,0 +1,379 @@
+import os
+import copy
+import time
+import tempfile
+
+import yaml
+
+from A.a import AF, AFOptional, Market, Mode
+from A.log import logger
+from A.router import Router, shard_of
+from A.base.strategy.base import Strategy
+from A.adapter.backtest.tickstore import TickStore
+from A.types import Event, KLine
+
+from glob import glob
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional, Union
+
+
+@dataclass
+class TaskResult:
+    """ the outputs of one backtest run by `BacktestRunner` """
+    # the trading days replayed, in order
+    days: list[str]
+    # the symbol shard of the task
+    shard: int
+    # the index of a strategy in the runner -> its `Strategy.result`
+    results: dict[int, Any] = field(default_factory=dict)
+    # (symbol code, bar key) -> the number of bars emitted to the strategies, see `KLine.key`
+    bars: dict[tuple, int] = field(default_factory=dict)
+    # (symbol code, bar key) -> the bars emitted, with `BacktestRunner.keep_bars` only
+    klines: dict[tuple, list[KLine]] = field(default_factory=dict)
+    # event type name -> the number of events of the adapter
+    events: dict[str, int] = field(default_factory=dict)
+    # the seconds of the backtest in its process
+    seconds: float = .0
+
+
+@dataclass
+class BacktestReport:
+    """ the merged outputs of the tasks of `BacktestRunner.run` """
+    # the results of the tasks, by first trading day then shard
+    tasks: list[TaskResult]
+    # the strategies of the runner, the results are kept by their index
+    strategies: list[Strategy]
+    # the wall seconds of the run
+    seconds: float = .0
+
+    @property
+    def cpu_seconds(self) -> float:
+        """ the seconds of the tasks in their processes, summed """
+        return sum(task.seconds for task in self.tasks)
+
+    @property
+    def bars(self) -> dict[tuple, int]:
+        """ (symbol code, bar key) -> the number of bars emitted by all the tasks, per task replaying the symbol """
+        ret = dict()
+        for task in self.tasks:
+            for key, count in task.bars.items():
+                ret[key] = ret.get(key, 0) + count
+        return ret
+
+    @property
+    def events(self) -> dict[str, int]:
+        """ event type name -> the number of events of the adapters of all the tasks """
+        ret = dict()
+        for task in self.tasks:
+            for key, count in task.events.items():
+                ret[key] = ret.get(key, 0) + count
+        return ret
+
+    def results(
+            self,
+            strategy: Union[Strategy, int]
+    ) -> list[tuple[list[str], Any]]:
+        """
+        the results of a strategy
+
+        Args:
+            strategy: the strategy added to the runner, or its index
+
+        Returns:
+            list: (the trading days, `Strategy.result`) of each task the strategy ran in, one per
+                day and shard, or one per shard if the strategy carries state over the days
+        """
+        index = strategy if isinstance(strategy, int) else self.strategies.index(strategy)
+        return [(task.days, task.results[index]) for task in self.tasks if index in task.results]
+
+    def klines(
+            self,
+            symbol_code: str,
+            interval: Union[int, tuple] = 60
+    ) -> list[KLine]:
+        """
+        the bars emitted of a symbol and interval, in day order, with `BacktestRunner.keep_bars` only, the bars
+        of a symbol replayed by a task of the strategies carrying state and by the daily tasks are in both
+        """
+        key = (symbol_code, interval)
+        ret = []
+        for task in self.tasks:
+            ret += task.klines.get(key, [])
+        return ret
+
+
+class _TaskAF(AF):
+    """
+    the engine of a task, counts the events and the bars it dispatches, routes the symbols
+    of its shard to the strategies with `shard_by_symbol` and replays the symbols of its task
+    """
+
+    def __init__(
+            self,
+            optional: AFOptional,
+            result: TaskResult,
+            keep_bars: bool,
+            shard: tuple[int, int],
+            symbol_codes: list[str]
+    ) -> None:
+        self._shard: Optional[tuple[int, int]] = shard if shard[1] > 1 else None
+        super().__init__(optional)
+        self._result: TaskResult = result
+        self._keep_bars: bool = keep_bars
+        self._symbol_codes: list[str] = symbol_codes
+
+    def _make_router(
+            self,
+            shard: Optional[tuple[int, int]] = None
+    ) -> Router:
+        return super()._make_router(self._shard)
+
+    def _get_symbol_codes(
+            self,
+            _type
+    ) -> list[str]:
+        return self._symbol_codes
+
+    def _on_event(
+            self,
+            event: Event
+    ) -> None:
+        events = self._result.events
+        name = event.event_type.name
+        events[name] = events.get(name, 0) + 1
+        super()._on_event(event)
+
+    def _dispatch_bar(
+            self,
+            event: Event
+    ) -> None:
+        bar = event.data
+        key = (bar.symbol_code, bar.key)
+        bars = self._result.bars
+        bars[key] = bars.get(key, 0) + 1
+        if self._keep_bars:
+            self._result.klines.setdefault(key, []).append(bar)
+        super()._dispatch_bar(event)
+
+
+def _run_task(
+        optional: AFOptional,
+        strategies: list[tuple[int, Strategy]],
+        days: list[str],
+        shard: tuple[int, int],
+        symbol_codes: list[str],
+        keep_bars: bool
+) -> TaskResult:
+    """
+    the backtest of a task in a process of the pool
+
+    Args:
+        optional: the engine optional of the task, its config replays the days of the task
+        strategies: (index in the runner, a copy of the strategy) of the strategies of the task
+        days: the trading days replayed
+        shard: (symbol shard index, the number of shards)
+        symbol_codes: the symbol codes replayed, every symbol if empty
+        keep_bars: keep the bars emitted in the result
+
+    Returns:
+        TaskResult: the outputs of the task
+    """
+    result = TaskResult(days=days, shard=shard[0])
+    af = _TaskAF(optional, result, keep_bars, shard, symbol_codes)
+    for _, s in strategies:
+        af.add_strategy(s)
+
+    t0 = time.perf_counter()
+    af.start()
+    result.seconds = time.perf_counter() - t0
+    result.results = {index: s.result() for index, s in strategies}
+    return result
+
+
+class BacktestRunner:
+    """
+    Runs a backtest of the stock csv files as independent `AF` backtests in a
+    process pool.
+
+    The files of `source_path` are the trading days, see `StockMD`. The
+    strategies are run one task per day, each task replays its day in a fresh
+    engine with fresh copies of the strategies, so nothing is kept from the
+    day before: the indicators, the rolled up and the activity bars and the
+    change percent of the first bar start over. A strategy with `carry_state`
+    is run over all the days in one task instead, in the pool with the others.
+
+    With `symbol_shards`, a strategy with `shard_by_symbol` is copied into
+    every shard and receives the symbols of its shard only, see `shard_of`, the
+    other strategies run in one shard each, in turn, like the workers of
+    `AFOptional.workers`. A shard replays the symbols of its strategies, and
+    every symbol of the backtest if one of them has no symbol code, so a
+    strategy receives the same symbols whatever the number of shards.
+    """
+
+    def __init__(
+            self,
+            optional: AFOptional,
+            processes: Optional[int] = None,
+            symbol_shards: int = 1,
+            keep_bars: bool = False
+    ) -> None:
+        """
+        Args:
+            optional: the backtest optional, the tasks run with `backtest_in_process` and without workers
+            processes: the number of processes of the pool, the number of cpus if None
+            symbol_shards: the number of symbol shards of each day
+            keep_bars: keep the bars emitted by the tasks, see `BacktestReport.klines`
+
+        Raises:
+            FileNotFoundError: config file path not found/exists.
+            TypeError: not a stock backtest.
+            ValueError: invalid symbol shards, or the config has no `source_path` nor `tick_store`.
+        """
+        if optional is None:
+            raise TypeError("the optional param is None.")
+        if optional.run_mode != Mode.BACKTESTING or optional.market != Market.STOCK:
+            raise TypeError("the runner only runs stock backtests.")
+        if not os.path.exists(optional.config_path):
+            raise FileNotFoundError(f"config path {optional.config_path} not exists.")
+        if symbol_shards < 1:
+            raise ValueError(f"symbol shards must be positive, got {symbol_shards}.")
+
+        self._optional: AFOptional = optional
+        self._processes: Optional[int] = processes
+        self._symbol_shards: int = symbol_shards
+        self._keep_bars: bool = keep_bars
+        self._strategies: list[Strategy] = list()
+
+        with open(optional.config_path, encoding="utf-8") as f:
+            self._config: dict = yaml.safe_load(f) or dict()
+        if not self._config.get("source_path") and not self._config.get("tick_store"):
+            raise ValueError(f"config {optional.config_path} has no source_path nor tick_store.")
+
+    @property
+    def keep_bars(self) -> bool:
+        return self._keep_bars
+
+    def add_strategy(
+            self,
+            strategy: Strategy
+    ) -> None:
+        """
+        append a strategy, a copy of it is run in every task of the strategy
+
+        Args:
+            strategy: the `Strategy` instance, picklable
+
+        Returns:
+            None
+
+        Raises:
+            TypeError: unknown strategy type
+        """
+        if not isinstance(strategy, Strategy):
+            raise TypeError(f"not support strategy type of [{type(strategy)}].")
+        self._strategies.append(strategy)
+
+    def days(self) -> list[tuple[str, str]]:
+        """ (trading day, file) of the files of `source_path`, or of the days of `tick_store` without it, in order """
+        source_path = self._config.get("source_path")
+        if not source_path:
+            store = TickStore(self._config["tick_store"])
+            return [(day, store.manifest_path(day)) for day in store.days()]
+        if os.path.isdir(source_path):
+            files = glob(os.path.join(source_path, "*.csv"))
+        else:
+            files = [source_path]
+        days = [(os.path.splitext(os.path.basename(file_path))[0], file_path) for file_path in files]
+        return sorted(days)
+
+    def _shards(self) -> list[list[tuple[int, Strategy]]]:
+        """ (index, strategy) of the strategies of each symbol shard """
+        shards = self._symbol_shards
+        ret: list[list[tuple[int, Strategy]]] = [list() for _ in range(shards)]
+        pinned = 0
+        for index, s in enumerate(self._strategies):
+            if not s.shard_by_symbol or shards == 1:
+                ret[pinned % shards].append((index, s))
+                pinned += 1
+                continue
+            for i, strategies in enumerate(ret):
+                # the router of the shard passes the symbols of the shard only, a strategy without
+                # symbol code of the shard has nothing to receive in it
+                if not s.sub_symbol_code or any(shard_of(code, shards) == i for code in s.sub_symbol_code):
+                    strategies.append((index, s))
+        return ret
+
+    def _symbol_codes(
+            self,
+            strategies: list[tuple[int, Strategy]],
+            shard: int
+    ) -> list[str]:
+        """ the symbol codes replayed by a task of the strategies in the shard, every symbol if empty """
+        if any(not s.sub_symbol_code for _, s in strategies):
+            # a strategy without symbol code receives every symbol of the backtest
+            return list(dict.fromkeys(code for s in self._strategies for code in s.sub_symbol_code))
+        shards = self._symbol_shards
+        return list(dict.fromkeys(
+            code for _, s in strategies for code in s.sub_symbol_code
+            if not s.shard_by_symbol or shards == 1 or shard_of(code, shards) == shard
+        ))
+
+    def _task_optional(
+            self,
+            tmp: str,
+            label: str,
+            source_path: Optional[str]
+    ) -> AFOptional:
+        """ the optional of a task replaying source_path, with its config written in tmp """
+        config = dict(self._config, source_path=source_path)
+        if config.get("bar_spill_path"):
+            config["bar_spill_path"] = f"{config['bar_spill_path']}.{label}"
+        config_path = os.path.join(tmp, f"{label}.yaml")
+        with open(config_path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(config, f)
+
+        optional = copy.copy(self._optional)
+        optional.config_path = config_path
+        optional.backtest_in_process = True
+        optional.workers = 0
+        if optional.latency_path is not None:
+            optional.latency_path = f"{optional.latency_path}.{label}"
+        return optional
+
+    def run(self) -> BacktestReport:
+        """
+        run the tasks and merge their outputs
+
+        Returns:
+            BacktestReport: the outputs of the tasks
+        """
+        days = self.days()
+        shards = self._shards()
+        # the strategy instances are sent to the processes, the copies get their own engine
+        for s in self._strategies:
+            s.af = None
+
+        t0 = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp, ProcessPoolExecutor(self._processes) as pool:
+            futures = []
+            for i, strategies in enumerate(shards):
+                carried = [(index, s) for index, s in strategies if s.carry_state]
+                daily = [(index, s) for index, s in strategies if not s.carry_state]
+                # the longest tasks first
+                if carried and days:
+                    optional = self._task_optional(tmp, f"all.{i}", self._config.get("source_path"))
+                    futures.append(pool.submit(_run_task, optional, carried, [day for day, _ in days],
+                                               (i, len(shards)), self._symbol_codes(carried, i),
+                                               self._keep_bars))
+                for day, file_path in days if daily else []:
+                    optional = self._task_optional(tmp, f"{day}.{i}", file_path)
+                    futures.append(pool.submit(_run_task, optional, daily, [day], (i, len(shards)),
+                                               self._symbol_codes(daily, i), self._keep_bars))
+            tasks = [future.result() for future in futures]
+        tasks.sort(key=lambda task: (task.days[0], task.shard, len(task.days)))
+
+        report = BacktestReport(tasks=tasks, strategies=self._strategies, seconds=time.perf_counter() - t0)
+        logger.info(f"backtest of {len(days)} days in {len(tasks)} tasks: {report.seconds:.2f}s, "
+                    f"{report.cpu_seconds:.2f}s in the tasks")
+        return report
@@ -0,0 +1,6 @@
+from .queue import BatchQueue, DONE
+from .ring import ShmRing
+from .direct import DirectSink
+from .overflow import Overflow, OverflowWriter
+from .pubsub import MarketPublisher, MarketSubscriber, market_topic, symbol_topic
+from . import codec
@@ -0,0 +1,296 @@
+"""
+Fixed-layout binary records of the market data events.
+
+Every record starts with a header (event type, market, ingress and put
+time stamps) followed by the struct packed fields of the event data, the layout of a
+(event type, market) pair never changes, so a record is decoded with a
+single `struct.unpack_from` and no pickling is involved.
+
+Only the fields declared by the data types are carried, lists are cut to
+a fixed number of items. The strings are not cut, a record of a string
+longer than its field is not encoded.
+"""
+import struct
+
+from A.types import BarType, KLine, Price, Event, EventType, StrategyType
+from A.types.futures import Snapshot as FuturesSnapshot
+from A.types.stock import Snapshot as StockSnapshot, OrderBook
+
+from typing import Any, Callable, Optional, Union
+
+from .queue import DONE
+
+# record kind of the DONE marker
+DONE_KIND = 0xFF
+# the max levels of bid/ask kept by a stock order book record
+ORDER_BOOK_LEVELS = 10
+# the max size of the bid1/ask1 order queues kept by a stock snapshot record
+ORDER_QUEUE_SIZE = 50
+
+_HEADER = struct.Struct("<BBqq")
+_NONE = -1
+# the bytes of the symbol code field of the records
+SYMBOL_CODE_SIZE = 16
+# the bytes of the `%H:%M:%S` update time field of a futures snapshot record
+UPDATE_TIME_SIZE = 12
+
+
+def _encode_str(
+        value: Optional[str],
+        size: int = SYMBOL_CODE_SIZE
+) -> bytes:
+    """ the utf-8 bytes of value, raises ValueError if longer than the field size """
+    ret = (value or "").encode("utf-8")
+    if len(ret) > size:
+        raise ValueError(f"{value!r} is longer than the {size} bytes of its record field.")
+    return ret
+
+
+def _decode_str(value: bytes) -> str:
+    return value.rstrip(b"\x00").decode("utf-8")
+
+
+def _encode_time(value: Optional[int]) -> int:
+    return _NONE if value is None else value
+
+
+def _decode_time(value: int) -> Optional[int]:
+    return None if value == _NONE else value
+
+
+def _encode_price(value: Optional[Price]) -> int:
+    return 0 if value is None else value._price
+
+
+def _decode_price(value: int) -> Price:
+    price = Price()
+    price._price = value
+    return price
+
+
+def _padded(values: Optional[list], size: int, fill: Any) -> tuple[int, list]:
+    values = list(values or ())[:size]
+    return len(values), values + [fill] * (size - len(values))
+
+
+class _Layout:
+    """ the struct layout of one (event type, market) pair """
+
+    def __init__(
+            self,
+            event_type: EventType,
+            ex_type: StrategyType,
+            fmt: str,
+            encode: Callable[[Any], tuple],
+            decode: Callable[[tuple], Any]
+    ) -> None:
+        self.event_type = event_type
+        self.ex_type = ex_type
+        self.struct = struct.Struct("<" + fmt)
+        self.encode = encode
+        self.decode = decode
+
+    @property
+    def size(self) -> int:
+        return _HEADER.size + self.struct.size
+
+
+def _stock_snapshot_encode(s: StockSnapshot) -> tuple:
+    _, bid = _padded(s.bid, 10, float("nan"))
+    _, ask = _padded(s.ask, 10, float("nan"))
+    _, bid_qty = _padded(s.bid_qty, 10, 0)
+    _, ask_qty = _padded(s.ask_qty, 10, 0)
+    bid1_len, bid1_qty = _padded(s.bid1_qty, ORDER_QUEUE_SIZE, 0)
+    ask1_len, ask1_qty = _padded(s.ask1_qty, ORDER_QUEUE_SIZE, 0)
+    return (
+        _encode_str(s.symbol_code), s.data_time, s.recv_time, s.exchange_id, s.trading_day,
+        s.pre_close_price, s.open_price, s.high_price, s.low_price, s.last_price,
+        s.trade_volume, s.trade_turnover, s.total_trade_volume, s.total_trade_turnover,
+        s.upper_limit_price, s.lower_limit_price,
+        *bid, *ask, *bid_qty, *ask_qty,
+        s.bid1_count, s.max_bid1_count, bid1_len, *bid1_qty,
+        s.ask1_count, s.max_ask1_count, ask1_len, *ask1_qty,
+    )
+
+
+def _stock_snapshot_decode(v: tuple) -> StockSnapshot:
+    s = StockSnapshot()
+    s.symbol_code = _decode_str(v[0])
+    (s.data_time, s.recv_time, s.exchange_id, s.trading_day,
+     s.pre_close_price, s.open_price, s.high_price, s.low_price, s.last_price,
+     s.trade_volume, s.trade_turnover, s.total_trade_volume, s.total_trade_turnover,
+     s.upper_limit_price, s.lower_limit_price) = v[1:16]
+    s.bid = list(v[16:26])
+    s.ask = list(v[26:36])
+    s.bid_qty = list(v[36:46])
+    s.ask_qty = list(v[46:56])
+    i = 56
+    s.bid1_count, s.max_bid1_count, bid1_len = v[i:i + 3]
+    s.bid1_qty = list(v[i + 3:i + 3 + bid1_len])
+    i += 3 + ORDER_QUEUE_SIZE
+    s.ask1_count, s.max_ask1_count, ask1_len = v[i:i + 3]
+    s.ask1_qty = list(v[i + 3:i + 3 + ask1_len])
+    return s
+
+
+_FUTURES_PRICE_FIELDS = ("last_price", "open_price", "high_price", "low_price", "close_price", "turnover")
+_FUTURES_BOOK_FIELDS = tuple(
+    f"{side}{i}_{kind}" for side in ("bid", "ask") for i in range(1, 6) for kind in ("price", "volume")
+)
+
+
+def _futures_snapshot_encode(s: FuturesSnapshot) -> tuple:
+    book = []
+    for name in _FUTURES_BOOK_FIELDS:
+        book.append(_encode_price(s.get(name)) if name.endswith("price") else s.get(name, 0))
+    return (
+        _encode_str(s.symbol_code), _encode_str(s.get("update_time"), UPDATE_TIME_SIZE), s.get("update_ms", 0),
+        *(_encode_price(s.get(name)) for name in _FUTURES_PRICE_FIELDS),
+        s.get("volume", 0), s.get("open_interest", .0), *book,
+    )
+
+
+def _futures_snapshot_decode(v: tuple) -> FuturesSnapshot:
+    s = FuturesSnapshot()
+    s.symbol_code = s.instrument_id = _decode_str(v[0])
+    s.update_time = _decode_str(v[1])
+    s.update_ms = v[2]
+    for name, value in zip(_FUTURES_PRICE_FIELDS, v[3:9]):
+        s[name] = _decode_price(value)
+    s.volume, s.open_interest = v[9:11]
+    for name, value in zip(_FUTURES_BOOK_FIELDS, v[11:]):
+        s[name] = _decode_price(value) if name.endswith("price") else value
+    return s
+
+
+def _kline_encode(k: KLine) -> tuple:
+    return (
+        _encode_str(k.symbol_code),
+        _encode_time(k.start_time), _encode_time(k.end_time), _encode_time(k.time),
+        k.style, k.open, k.high, k.low, k.close, k.volume,
+        k.get("turnover", float("nan")), k.change_percent, k.interval, k.bar_type.value, k.bar_size,
+    )
+
+
+def _kline_decode(v: tuple) -> KLine:
+    k = KLine()
+    k.symbol_code = _decode_str(v[0])
+    k.start_time = _decode_time(v[1])
+    k.end_time = _decode_time(v[2])
+    k.time = _decode_time(v[3])
+    k.style, k.open, k.high, k.low, k.close, k.volume, k.turnover, k.change_percent, k.interval = v[4:13]
+    if v[13]:
+        k.bar_type = BarType(v[13])
+        k.bar_size = v[14]
+    return k
+
+
+def _order_book_encode(o: OrderBook) -> tuple:
+    levels = list(zip(o.bids or (), o.asks or ()))[:ORDER_BOOK_LEVELS]
+    book = []
+    for (bp, bq), (ap, aq) in levels:
+        book += [bp, bq, ap, aq]
+    book += [float("nan"), 0, float("nan"), 0] * (ORDER_BOOK_LEVELS - len(levels))
+    return (
+        _encode_str(o.symbol_code), o.data_time, o.recv_time, o.exchange_id,
+        o.last_price, o.qty, o.turnover, o.trades_count, len(levels), *book,
+    )
+
+
+def _order_book_decode(v: tuple) -> OrderBook:
+    o = OrderBook()
+    o.symbol_code = _decode_str(v[0])
+    o.data_time, o.recv_time, o.exchange_id, o.last_price, o.qty, o.turnover, o.trades_count = v[1:8]
+    book = v[9:9 + v[8] * 4]
+    o.bids = [(book[i], book[i + 1]) for i in range(0, len(book), 4)]
+    o.asks = [(book[i + 2], book[i + 3]) for i in range(0, len(book), 4)]
+    return o
+
+
+_LAYOUTS: list[_Layout] = [
+    _Layout(EventType.SNAPSHOT_DATA, StrategyType.STOCK,
+            f"{SYMBOL_CODE_SIZE}sqqii5dqdqd2d10d10d10q10qiiH{ORDER_QUEUE_SIZE}qiiH{ORDER_QUEUE_SIZE}q",
+            _stock_snapshot_encode, _stock_snapshot_decode),
+    _Layout(EventType.SNAPSHOT_DATA, StrategyType.FUTURES,
+            f"{SYMBOL_CODE_SIZE}s{UPDATE_TIME_SIZE}si6qqd" + "qq" * 10,
+            _futures_snapshot_encode, _futures_snapshot_decode),
+    _Layout(EventType.ORDERBOOK_DATA, StrategyType.STOCK,
+            f"{SYMBOL_CODE_SIZE}sqqidqdqH" + "dqdq" * ORDER_BOOK_LEVELS,
+            _order_book_encode, _order_book_decode),
+] + [
+    _Layout(EventType.KLINE_DATA, ex_type, f"{SYMBOL_CODE_SIZE}sqqqbdddddddibd", _kline_encode, _kline_decode)
+    for ex_type in (StrategyType.STOCK, StrategyType.FUTURES)
+]
+_ENCODERS: dict[tuple[EventType, StrategyType], _Layout] = {(i.event_type, i.ex_type): i for i in _LAYOUTS}
+_DECODERS: dict[tuple[int, int], _Layout] = {(i.event_type.value, i.ex_type.value): i for i in _LAYOUTS}
+
+# the max size of an encoded record
+MAX_RECORD_SIZE: int = max(i.size for i in _LAYOUTS)
+
+
+def encode_into(
+        event: Union[Event, str],
+        buffer: Union[memoryview, bytearray],
+        offset: int = 0
+) -> int:
+    """
+    encode the event into the buffer
+
+    Args:
+        event: the event message or the `DONE` marker
+        buffer: the writable buffer, it must have `MAX_RECORD_SIZE` bytes after offset
+        offset: the write position of buffer
+
+    Returns:
+        int: the size of the record
+
+    Raises:
+        TypeError: there is no layout of the event
+        ValueError: a string of the event is longer than its field
+    """
+    if event == DONE:
+        _HEADER.pack_into(buffer, offset, DONE_KIND, 0, 0, 0)
+        return _HEADER.size
+
+    layout = _ENCODERS.get((event.event_type, event.ex_type))
+    if layout is None:
+        raise TypeError(f"no binary layout of [{event.event_type}, {event.ex_type}].")
+
+    _HEADER.pack_into(buffer, offset, event.event_type.value, event.ex_type.value, event.ingress_ns, event.put_ns)
+    layout.struct.pack_into(buffer, offset + _HEADER.size, *layout.encode(event.data))
+    return layout.size
+
+
+def encode(event: Union[Event, str]) -> bytes:
+    """ encode the event into a new bytes object """
+    buffer = bytearray(MAX_RECORD_SIZE)
+    size = encode_into(event, buffer)
+    return bytes(buffer[:size])
+
+
+def decode(
+        buffer: Union[memoryview, bytes, bytearray],
+        offset: int = 0
+) -> Union[Event, str]:
+    """
+    decode the record in buffer
+
+    Args:
+        buffer: the buffer with a record encoded by `encode_into`
+        offset: the read position of buffer
+
+    Returns:
+        Union[Event, str]: the event message or the `DONE` marker
+    """
+    event_type, ex_type, ingress_ns, put_ns = _HEADER.unpack_from(buffer, offset)
+    if event_type == DONE_KIND:
+        return DONE
+
+    layout = _DECODERS[(event_type, ex_type)]
+    event = Event()
+    event.event_type = layout.event_type
+    event.ex_type = layout.ex_type
+    event.ingress_ns = ingress_ns
+    event.put_ns = put_ns
+    event.data = layout.decode(layout.struct.unpack_from(buffer, offset + _HEADER.size))
+    return event
@@ -0,0 +1,49 @@
+import time
+
+from A.types import Event
+
+from typing import Callable, Union
+
+from .queue import DONE
+
+
+class DirectSink:
+    """
+    In-process writer, hands every event to the engine callback at once.
+
+    Used by the in-process backtest, the adapter runs on the engine thread
+    so no event is pickled or queued and the run is deterministic.
+    """
+
+    def __init__(
+            self,
+            callback: Callable[[Event], None]
+    ) -> None:
+        """
+        Args:
+            callback: the engine dispatch function
+        """
+        self._callback: Callable[[Event], None] = callback
+        self.done: bool = False
+
+    def put(
+            self,
+            event: Union[Event, str]
+    ) -> None:
+        """
+        dispatch the event
+
+        Args:
+            event: the event message or the `DONE` marker
+
+        Returns:
+            None
+        """
+        if event is DONE:
+            self.done = True
+        else:
+            event.put_ns = time.monotonic_ns()
+            self._callback(event)
+
+    def flush(self) -> None:
+        """ every `put` is dispatched at once, nothing to flush """
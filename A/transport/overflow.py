@@ -0,0 +1,176 @@
+import threading
+
+from collections import OrderedDict, deque
+from enum import Enum
+from multiprocessing import Array
+from typing import Optional, Union
+
+from A.types import Event, EventType
+
+from .queue import DONE
+
+
+class Overflow(Enum):
+    # the adapter waits until the engine catches up
+    BLOCK = 1
+    # drop the oldest pending snapshot
+    DROP_OLDEST = 2
+    # keep only the latest pending snapshot of each symbol
+    CONFLATE = 3
+
+
+# the counter slots of `OverflowWriter`
+_CONFLATED = 0
+_DROPPED = 1
+
+
+class OverflowWriter:
+    """
+    Non-blocking adapter side writer with an overflow policy.
+
+    The vendor SDK callbacks must return quickly, an SDK thread blocked on
+    a full event queue gets the session disconnected. `put` only appends
+    the event to a bounded pending buffer, a sender thread moves the
+    pending events onto the transport writer and is the only one that
+    waits when the engine falls behind. Once the pending buffer is full
+    the policy decides what is given up:
+
+    - `Overflow.DROP_OLDEST` drops the oldest pending snapshot.
+    - `Overflow.CONFLATE` replaces the pending snapshot of the symbol, so at
+      most one snapshot per symbol is pending, a snapshot of a symbol with
+      nothing pending drops the oldest pending snapshot.
+
+    Bars and order books are never dropped, the buffer grows beyond its
+    capacity if nothing but them is pending. The counters are kept in
+    shared memory so the engine reads them while the adapter process runs.
+
+    The sender thread is started by the first `put`, in the process of the
+    adapter, so the writer is handed to the adapter process like the
+    transport writer it wraps.
+    """
+
+    def __init__(
+            self,
+            writer,
+            policy: Overflow = Overflow.CONFLATE,
+            capacity: int = 4096
+    ) -> None:
+        """
+        Args:
+            writer: the transport writer, `BatchQueue` or `ShmRing`
+            policy: `Overflow.DROP_OLDEST` or `Overflow.CONFLATE`
+            capacity: the max number of pending events before the policy applies
+
+        Raises:
+            ValueError: invalid policy or capacity
+        """
+        if policy not in (Overflow.DROP_OLDEST, Overflow.CONFLATE):
+            raise ValueError(f"unsupported overflow policy {policy}.")
+        if capacity < 1:
+            raise ValueError(f"capacity must be positive, got {capacity}.")
+
+        self._writer = writer
+        self._policy: Overflow = policy
+        self._capacity: int = capacity
+        self._counters = Array("q", 2, lock=False)
+        # key -> event in put order, a snapshot key is (market, symbol code), others a sequence number
+        self._pending: OrderedDict = OrderedDict()
+        # the (key, event) of the pending snapshots in put order, may hold snapshots already sent or replaced,
+        # at most twice the capacity or the pending events
+        self._snapshots: deque = deque()
+        self._seq: int = 0
+        self._condition: threading.Condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def __getstate__(self) -> dict:
+        return dict(writer=self._writer, policy=self._policy, capacity=self._capacity, counters=self._counters)
+
+    def __setstate__(self, state: dict) -> None:
+        counters = state.pop("counters")
+        self.__init__(**state)
+        self._counters = counters
+
+    @property
+    def conflated(self) -> int:
+        """ the number of snapshots replaced by a newer snapshot of the same symbol """
+        return self._counters[_CONFLATED]
+
+    @property
+    def dropped(self) -> int:
+        """ the number of snapshots dropped because the pending buffer was full """
+        return self._counters[_DROPPED]
+
+    def _drop_oldest_snapshot(self) -> None:
+        pending, snapshots = self._pending, self._snapshots
+        while snapshots:
+            key, event = snapshots.popleft()
+            if pending.get(key) is event:
+                del pending[key]
+                self._counters[_DROPPED] += 1
+                return
+
+    def _compact_snapshots(self) -> None:
+        """ forget the snapshots already sent or replaced, amortized over the puts that made them """
+        pending = self._pending
+        self._snapshots = deque(item for item in self._snapshots if pending.get(item[0]) is item[1])
+
+    def put(
+            self,
+            event: Union[Event, str]
+    ) -> None:
+        """
+        append the event to the pending buffer, never blocks but for the `DONE` marker,
+        which waits until every pending event is sent, the adapter process may exit then.
+
+        Args:
+            event: the event message or the `DONE` marker
+
+        Returns:
+            None
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._send, name="OverflowWriter", daemon=True)
+            self._thread.start()
+
+        with self._condition:
+            pending = self._pending
+            if event is not DONE and event.event_type == EventType.SNAPSHOT_DATA:
+                key = (event.ex_type, event.data.symbol_code)
+                if self._policy == Overflow.CONFLATE and key in pending:
+                    # the key moves to the end, the replaced entry in `_snapshots` is skipped when dropping
+                    del pending[key]
+                    self._counters[_CONFLATED] += 1
+                elif len(pending) >= self._capacity:
+                    self._drop_oldest_snapshot()
+                if self._policy == Overflow.DROP_OLDEST:
+                    key = self._seq = self._seq + 1
+                self._snapshots.append((key, event))
+                if len(self._snapshots) > 2 * max(len(pending), self._capacity):
+                    self._compact_snapshots()
+            else:
+                key = self._seq = self._seq + 1
+            pending[key] = event
+            self._condition.notify()
+
+        if event is DONE:
+            self._thread.join()
+
+    def _send(self) -> None:
+        """ the sender thread, moves the pending events onto the transport writer in put order """
+        pending, condition = self._pending, self._condition
+        while True:
+            with condition:
+                while not pending:
+                    condition.wait()
+                _, event = pending.popitem(last=False)
+                if not pending:
+                    self._snapshots.clear()
+
+            self._writer.put(event)
+            if event is DONE:
+                return
+            if not pending:
+                self._writer.flush()
+
+    def flush(self) -> None:
+        """ the sender thread flushes the transport writer whenever nothing is pending """
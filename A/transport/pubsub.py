@@ -0,0 +1,170 @@
+import zmq
+import time
+
+from queue import Empty
+from typing import Iterable, Optional, Union
+
+from A.types import Event, StrategyType
+
+from . import codec
+from .queue import DONE
+
+# the topic of the DONE marker, every subscriber subscribes it
+DONE_TOPIC = b"!done"
+
+
+def market_topic(ex_type: StrategyType) -> bytes:
+    """ the topic prefix of all the symbols of a market """
+    return f"{ex_type.value}|".encode()
+
+
+def symbol_topic(
+        ex_type: StrategyType,
+        symbol_code: str
+) -> bytes:
+    """ the topic prefix of all the events of a symbol """
+    return f"{ex_type.value}|{symbol_code}|".encode()
+
+
+class MarketPublisher:
+    """
+    Market data publisher, the adapter side of the ZeroMQ fan-out.
+
+    Every event is sent as a [topic, record] multipart message on a PUB
+    socket, the topic is `<market>|<symbol code>|` so that subscribers
+    filter by market or by symbol with ZeroMQ prefix matching, the record
+    is the fixed-layout binary record of `A.transport.codec`.
+
+    The socket is created lazily in the process and thread that calls
+    `put` first, so the publisher can be handed to the adapter process
+    like `BatchQueue`. A subscriber that can not keep up loses messages
+    once its high water mark is reached, the adapter is never blocked.
+    """
+
+    def __init__(
+            self,
+            endpoint: str,
+            hwm: int = 1_000_000
+    ) -> None:
+        """
+        Args:
+            endpoint: the endpoint to bind, e.g. `tcp://*:5555` or `ipc:///tmp/af.md`
+            hwm: the send high water mark of each subscriber
+        """
+        self._endpoint: str = endpoint
+        self._hwm: int = hwm
+        self._socket: Optional[zmq.Socket] = None
+
+    def __getstate__(self) -> dict:
+        return dict(endpoint=self._endpoint, hwm=self._hwm)
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    @property
+    def endpoint(self) -> str:
+        return self._endpoint
+
+    def bind(self) -> zmq.Socket:
+        """ bind the PUB socket, called by the first `put` if not yet bound """
+        socket = zmq.Context.instance().socket(zmq.PUB)
+        socket.setsockopt(zmq.SNDHWM, self._hwm)
+        socket.bind(self._endpoint)
+        self._socket = socket
+        return socket
+
+    def put(
+            self,
+            event: Union[Event, str]
+    ) -> None:
+        """
+        publish the event
+
+        Args:
+            event: the event message or the `DONE` marker
+
+        Returns:
+            None
+        """
+        socket = self._socket or self.bind()
+        if event is DONE:
+            socket.send_multipart((DONE_TOPIC, codec.encode(DONE)))
+        else:
+            event.put_ns = time.monotonic_ns()
+            socket.send_multipart((symbol_topic(event.ex_type, event.data.symbol_code), codec.encode(event)))
+
+    def flush(self) -> None:
+        """ every `put` is sent at once, nothing to flush """
+
+    def close(self) -> None:
+        if self._socket is not None:
+            self._socket.close(linger=1000)
+            self._socket = None
+
+
+class MarketSubscriber:
+    """
+    Market data subscriber, the engine side of the ZeroMQ fan-out.
+
+    `get` returns a list of events like the batched event queue, so `AF`
+    consumes a publisher the same way as its own adapter process.
+    """
+
+    def __init__(
+            self,
+            endpoints: Union[str, Iterable[str]],
+            topics: Iterable[bytes] = (b"",),
+            hwm: int = 1_000_000
+    ) -> None:
+        """
+        Args:
+            endpoints: the publisher endpoints to connect
+            topics: the topic prefixes to subscribe, see `market_topic` and `symbol_topic`
+            hwm: the receive high water mark
+        """
+        if isinstance(endpoints, str):
+            endpoints = [endpoints]
+
+        self._socket: zmq.Socket = zmq.Context.instance().socket(zmq.SUB)
+        self._socket.setsockopt(zmq.RCVHWM, hwm)
+        for topic in topics:
+            self._socket.setsockopt(zmq.SUBSCRIBE, topic)
+        self._socket.setsockopt(zmq.SUBSCRIBE, DONE_TOPIC)
+        for endpoint in endpoints:
+            self._socket.connect(endpoint)
+
+    def get(
+            self,
+            timeout: Optional[float] = None,
+            max_events: int = 512
+    ) -> list[Union[Event, str]]:
+        """
+        receive the events available, blocks until there is at least one
+
+        Args:
+            timeout: the max seconds to wait, wait forever if None.
+            max_events: the max number of events returned at once.
+
+        Returns:
+            list: the events in publish order, the `DONE` marker is always the last one
+
+        Raises:
+            queue.Empty: no event within timeout
+        """
+        if not self._socket.poll(None if timeout is None else int(timeout * 1000)):
+            raise Empty
+
+        events = []
+        while len(events) < max_events:
+            try:
+                _, record = self._socket.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            event = codec.decode(record)
+            events.append(event)
+            if event == DONE:
+                break
+        return events
+
+    def close(self) -> None:
+        self._socket.close(linger=0)
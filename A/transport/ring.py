@@ -0,0 +1,188 @@
+import sys
+import time
+import struct
+
+from multiprocessing import shared_memory, resource_tracker
+from queue import Empty
+from typing import Optional, Union
+
+from A.types import Event
+
+from . import codec
+from .queue import DONE
+
+# write index and read index, each on its own cache line
+_INDEX = struct.Struct("<Q")
+_WRITE_INDEX_OFFSET = 0
+_READ_INDEX_OFFSET = 64
+_HEADER_SIZE = 128
+_SLOT_LENGTH = struct.Struct("<I")
+
+
+class ShmRing:
+    """
+    Single-producer/single-consumer ring buffer in shared memory.
+
+    The adapter process is the only writer and the engine is the only
+    reader. Events are stored as fixed-layout binary records (see
+    `A.transport.codec`), one record per fixed-size slot, so passing an
+    event costs an encode/decode and a memcpy instead of a pickle and a
+    pipe write. The writer publishes a slot by advancing the write index
+    after the record is copied, the reader frees it by advancing the
+    read index, neither side takes a lock.
+
+    The writer side has the same `put`/`flush` interface as `BatchQueue`
+    and the reader side `get` returns a list of events like the batched
+    event queue, so both transports are interchangeable in `AF`.
+    """
+
+    def __init__(
+            self,
+            capacity: int = 65536,
+            slot_size: int = 0,
+            spin: float = 0.001,
+            name: Optional[str] = None
+    ) -> None:
+        """
+        Args:
+            capacity: the number of slots, must be a power of two.
+            slot_size: the bytes of a slot, defaults to the size of the biggest record.
+            spin: the seconds to busy poll before sleeping while the ring is empty/full.
+            name: attach to an existing ring of the name instead of creating one.
+
+        Raises:
+            ValueError: invalid capacity or slot size.
+        """
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError(f"capacity must be a power of two, got {capacity}.")
+
+        record_size = _SLOT_LENGTH.size + codec.MAX_RECORD_SIZE
+        slot_size = slot_size or record_size
+        if slot_size < record_size:
+            raise ValueError(f"slot size must be at least {record_size} bytes, got {slot_size}.")
+
+        self._capacity: int = capacity
+        self._mask: int = capacity - 1
+        self._slot_size: int = slot_size
+        self._spin: float = spin
+        self._owner: bool = name is None
+
+        if self._owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + capacity * slot_size)
+            self._shm.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            if sys.version_info < (3, 13):
+                # the ring is unlinked by its owner, not by the tracker of the attached process
+                resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        self._buf: memoryview = self._shm.buf
+        # the local copies of the indexes, only the own index is written by each side
+        self._write_index: int = _INDEX.unpack_from(self._buf, _WRITE_INDEX_OFFSET)[0]
+        self._read_index: int = _INDEX.unpack_from(self._buf, _READ_INDEX_OFFSET)[0]
+
+    def __getstate__(self) -> dict:
+        return dict(
+            capacity=self._capacity,
+            slot_size=self._slot_size,
+            spin=self._spin,
+            name=self._shm.name,
+        )
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def _wait(self, started: float) -> None:
+        if time.monotonic() - started > self._spin:
+            time.sleep(50e-6)
+
+    def _load(self, offset: int) -> int:
+        return _INDEX.unpack_from(self._buf, offset)[0]
+
+    def put(
+            self,
+            event: Union[Event, str]
+    ) -> None:
+        """
+        write the event into the next free slot, blocks while the ring is full
+
+        Args:
+            event: the event message or the `DONE` marker
+
+        Returns:
+            None
+        """
+        if event is not DONE:
+            event.put_ns = time.monotonic_ns()
+
+        index = self._write_index
+        if index - self._read_index >= self._capacity:
+            started = time.monotonic()
+            while index - (read_index := self._load(_READ_INDEX_OFFSET)) >= self._capacity:
+                self._wait(started)
+            self._read_index = read_index
+
+        offset = _HEADER_SIZE + (index & self._mask) * self._slot_size
+        size = codec.encode_into(event, self._buf, offset + _SLOT_LENGTH.size)
+        _SLOT_LENGTH.pack_into(self._buf, offset, size)
+
+        self._write_index = index + 1
+        # publish the slot after the record is written
+        _INDEX.pack_into(self._buf, _WRITE_INDEX_OFFSET, self._write_index)
+
+    def flush(self) -> None:
+        """ every `put` is visible to the reader at once, nothing to flush """
+
+    def get(
+            self,
+            timeout: Optional[float] = None,
+            max_events: int = 512
+    ) -> list[Union[Event, str]]:
+        """
+        read the events available in the ring, blocks until there is at least one
+
+        Args:
+            timeout: the max seconds to wait, wait forever if None.
+            max_events: the max number of events returned at once.
+
+        Returns:
+            list: the events in write order, the `DONE` marker is always the last one
+
+        Raises:
+            queue.Empty: no event within timeout
+        """
+        index = self._read_index
+        write_index = self._write_index
+        if index >= write_index:
+            started = time.monotonic()
+            while index >= (write_index := self._load(_WRITE_INDEX_OFFSET)):
+                if timeout is not None and time.monotonic() - started >= timeout:
+                    raise Empty
+                self._wait(started)
+            self._write_index = write_index
+
+        events = []
+        end = min(write_index, index + max_events)
+        while index < end:
+            offset = _HEADER_SIZE + (index & self._mask) * self._slot_size
+            event = codec.decode(self._buf, offset + _SLOT_LENGTH.size)
+            index += 1
+            events.append(event)
+            if event == DONE:
+                break
+
+        self._read_index = index
+        # free the slots after the records are decoded
+        _INDEX.pack_into(self._buf, _READ_INDEX_OFFSET, index)
+        return events
+
+    def close(self) -> None:
+        """ detach from the ring, the owner also removes it """
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -1,5 +1,7 @@
-from .kline import KLine
+from .kline import KLine, BarType
 from .base import BaseEntity, Price, BuySell
+from .timestamp import NS_PER_SECOND, NS_PER_DAY, compact_to_ns, clock_to_ns, datetime_to_ns, ns_to_datetime, \
+        time_to_ns, ns_to_time
 from .event import *
 from .strategy import StrategyType
 from .futures import Snapshot as FuturesSnapshot
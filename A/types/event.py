@@ -13,3 +13,7 @@ class Event:
     data: Any
     event_type: EventType
     ex_type: StrategyType
+    # `time.monotonic_ns` when the market data arrived at the adapter, 0 if not stamped
+    ingress_ns: int = 0
+    # `time.monotonic_ns` when the event was put onto the transport, 0 if not stamped
+    put_ns: int = 0
@@ -9,6 +9,8 @@ class Snapshot(BaseEntity):
 
     # 合约代码
     instrument_id: str
+    # 合约代码, 与 instrument_id 相同, 用于事件路由
+    symbol_code: str
     # 快照时间(处理后)
     time: datetime
     # 快照时间
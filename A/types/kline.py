@@ -1,23 +1,48 @@
-from datetime import datetime
+from enum import Enum
 from .base import BaseEntity
 
-from typing import Optional
+from typing import Optional, Union
+
+
+class BarType(Enum):
+    # closed on the time boundaries of the trading sessions
+    TIME = 0
+    # closed every `bar_size` shares or lots traded
+    VOLUME = 1
+    # closed every `bar_size` of turnover traded
+    TURNOVER = 2
+    # closed every `bar_size` ticks
+    TICK = 3
 
 
 class KLine(BaseEntity):
     """ Kline 是一个K线对象 """
 
+    #: K线周期, 秒
+    interval: int = 60
+    #: K线类型
+    bar_type: BarType = BarType.TIME
+    #: 非时间K线的成交量, 成交额或tick数
+    bar_size: float = 0
+
+    @property
+    def key(self) -> Union[int, tuple[BarType, float]]:
+        """ the interval of a time bar, (bar type, bar size) of the other bars, the bars are routed by it """
+        if self.bar_type == BarType.TIME:
+            return self.interval
+        return self.bar_type, self.bar_size
+
     def __init__(self, **value):
         if value is not None:
             self.__dict__.update(value)
         else:
             self.symbol_code: str = ''
-            #: K线起点时间
-            self.start_time: Optional[datetime.time] = None
-            #: K线终点
-            self.end_time: Optional[datetime.time] = None
-            #: K线所对应的时间
-            self.time: Optional[datetime.time] = None
+            #: K线起点时间, 当日纳秒数
+            self.start_time: Optional[int] = None
+            #: K线终点, 当日纳秒数
+            self.end_time: Optional[int] = None
+            #: K线所对应的时间, 当日纳秒数
+            self.time: Optional[int] = None
             #: k线状态: -1 0 1
             self.style: int = 0
 
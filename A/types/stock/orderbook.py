@@ -1,5 +1,3 @@
-from datetime import datetime
-
 from A.types import BaseEntity
 from typing import Optional
 
@@ -7,8 +5,9 @@ from typing import Optional
 class OrderBook(BaseEntity):
 
     symbol_code: str = ''
-    data_time: Optional[datetime] = None
-    # the snapshot data received time
+    # the exchange time, local epoch nanoseconds, see `A.types.timestamp`
+    data_time: int = 0
+    # the snapshot data received time, epoch nanoseconds
     recv_time: int = 0
     exchange_id: int = 0
 
@@ -0,0 +1,76 @@
+"""
+The integer time stamps of the market data.
+
+The ticks keep their exchange time as local epoch nanoseconds, the
+nanoseconds from 1970-01-01 00:00 of the wall clock of the exchange, no
+time zone is involved: the day of a time stamp is `value // NS_PER_DAY`
+and its time of the day `value % NS_PER_DAY`. The bars keep the
+nanoseconds of the day of their times. The `datetime` and `time` objects
+are only made to show a time stamp, see `ns_to_datetime` and `ns_to_time`.
+"""
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+NS_PER_SECOND = 1_000_000_000
+NS_PER_DAY = 24 * 3600 * NS_PER_SECOND
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+
+
+@lru_cache(maxsize=4096)
+def midnight_ns(day: int) -> int:
+    """ the time stamp of the midnight of a `%Y%m%d` int """
+    year, rest = divmod(day, 10000)
+    month, day = divmod(rest, 100)
+    return (date(year, month, day).toordinal() - _EPOCH_ORDINAL) * NS_PER_DAY
+
+
+def compact_to_ns(value: int) -> int:
+    """
+    the time stamp of a `%Y%m%d%H%M%S` int followed by 3 digits of milliseconds, the
+    data time of the XTP snapshots and of the backtest files
+
+    Args:
+        value: the int, e.g. `20220110093000120`
+
+    Returns:
+        int: the time stamp
+    """
+    day, clock = divmod(value, 1_000_000_000)
+    clock, millisecond = divmod(clock, 1000)
+    hour, clock = divmod(clock, 10000)
+    minute, second = divmod(clock, 100)
+    return midnight_ns(day) + (((hour * 60 + minute) * 60 + second) * 1000 + millisecond) * 1_000_000
+
+
+def clock_to_ns(
+        value: str,
+        millisecond: int = 0
+) -> int:
+    """ the nanoseconds of the day of a `%H:%M:%S` time and its milliseconds, the CTP update time """
+    hour, minute, second = value.split(":")
+    return (((int(hour) * 60 + int(minute)) * 60 + int(second)) * 1000 + millisecond) * 1_000_000
+
+
+def datetime_to_ns(value: datetime) -> int:
+    """ the time stamp of a naive datetime of the exchange """
+    return (value - _EPOCH) // timedelta(microseconds=1) * 1000
+
+
+def ns_to_datetime(value: int) -> datetime:
+    """ the datetime of a time stamp, cut to microseconds """
+    return _EPOCH + timedelta(microseconds=value // 1000)
+
+
+def time_to_ns(value: time) -> int:
+    """ the nanoseconds of the day of a time """
+    return (((value.hour * 60 + value.minute) * 60 + value.second) * 1_000_000 + value.microsecond) * 1000
+
+
+def ns_to_time(value: int) -> time:
+    """ the time of the day of a time stamp or of nanoseconds of the day, cut to microseconds """
+    seconds, microsecond = divmod(int(value) % NS_PER_DAY // 1000, 1_000_000)
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    return time(hour, minute, second, microsecond)
@@ -0,0 +1,75 @@
+"""
+Events/sec of the backtest adapter -> engine event queue.
+
+    python -m benchmarks.backtest_drain [n_symbols]
+
+`legacy` is the old path: one `Queue.put` per event and a busy-spinning
+`Queue.empty()` loop on the engine side. `batched` is the `BatchQueue`
+path used by `AF._start_with_backtesting`.
+"""
+import sys
+import time
+
+from multiprocessing import Queue, Process
+
+from A.transport import BatchQueue, DONE
+from benchmarks.synthetic import make_snapshot_events
+
+
+def _legacy_producer(queue: Queue, n_symbols: int) -> None:
+    for event in make_snapshot_events(n_symbols):
+        queue.put(event)
+    queue.put(DONE)
+
+
+def _batched_producer(queue: Queue, n_symbols: int, batch_size: int, linger: float) -> None:
+    batch_queue = BatchQueue(queue, batch_size=batch_size, linger=linger)
+    for event in make_snapshot_events(n_symbols):
+        batch_queue.put(event)
+    batch_queue.put(DONE)
+
+
+def run_legacy(n_symbols: int) -> tuple[int, float]:
+    queue = Queue(65535)
+    process = Process(target=_legacy_producer, args=(queue, n_symbols))
+    t0 = time.perf_counter()
+    process.start()
+    count = 0
+    while True:
+        if queue.empty():
+            continue
+        event = queue.get()
+        if event == DONE:
+            break
+        count += 1
+    elapsed = time.perf_counter() - t0
+    process.join()
+    return count, elapsed
+
+
+def run_batched(n_symbols: int, batch_size: int = 512, linger: float = 0.005) -> tuple[int, float]:
+    queue = Queue(65535)
+    process = Process(target=_batched_producer, args=(queue, n_symbols, batch_size, linger))
+    t0 = time.perf_counter()
+    process.start()
+    count = 0
+    while True:
+        batch = queue.get()
+        if batch[-1] == DONE:
+            count += len(batch) - 1
+            break
+        count += len(batch)
+    elapsed = time.perf_counter() - t0
+    process.join()
+    return count, elapsed
+
+
+def main() -> None:
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for name, func in (("legacy", run_legacy), ("batched", run_batched)):
+        count, elapsed = func(n_symbols)
+        print(f"{name:>8}: {count} events in {elapsed:.2f}s, {count / elapsed:,.0f} events/sec")
+
+
+if __name__ == "__main__":
+    main()
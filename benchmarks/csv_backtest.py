@@ -0,0 +1,55 @@
+"""
+Lines/sec of the CSV backtest adapter, bars included, without the engine.
+
+    python -m benchmarks.csv_backtest [n_symbols]
+
+The adapter parses a synthetic day and hands every event to a counting
+sink on the same thread, so the figure is the cost of the parsers and of
+the bar building alone. `streaming` feeds every tick to `KLineHandle`,
+`prebuild` builds the bars of the day with `build_klines` first, `replay`
+puts the bars only, built then read from a `BarCache`.
+"""
+import os
+import sys
+import time
+import tempfile
+
+from A.adapter.backtest.csv_md import StockMD
+from A.data import BarCache
+from A.transport import DirectSink
+from A.types import EventType
+from benchmarks.synthetic import symbol_codes, write_tick_csv
+
+
+def run(n_symbols: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "20220110.csv")
+        lines = write_tick_csv(path, n_symbols)
+        cache = BarCache(os.path.join(tmp, "bars"))
+
+        for name, kwargs in (
+                ("streaming", dict()),
+                ("prebuild", dict(prebuild_bars=True)),
+                ("replay", dict(replay_bars=True, bar_cache=cache)),
+                ("replay cached", dict(replay_bars=True, bar_cache=cache)),
+        ):
+            counts = {event_type: 0 for event_type in EventType}
+
+            def count(event) -> None:
+                counts[event.event_type] += 1
+
+            t0 = time.perf_counter()
+            StockMD(symbol_codes(n_symbols), path, DirectSink(count), **kwargs).start()
+            elapsed = time.perf_counter() - t0
+
+            print(f"{name:>13}: {lines} lines in {elapsed:.2f}s, {lines / elapsed:,.0f} lines/sec, "
+                  + ", ".join(f"{k.name}={v}" for k, v in counts.items()))
+
+
+def main() -> None:
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    run(n_symbols)
+
+
+if __name__ == "__main__":
+    main()
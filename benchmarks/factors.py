@@ -0,0 +1,57 @@
+"""
+Seconds to evaluate factor expressions over a year of 1 minute bars.
+
+    python -m benchmarks.factors [n_bars]
+
+`update` adds the bars one at a time through one mapping refilled for
+every bar, the way a live adapter reuses its buffer, `batch` evaluates the
+expressions of `A.data.ops` over the arrays, and checks they give the
+`update` values bit for bit.
+"""
+import sys
+import time
+
+from A.data.ops import Feature, Mean, Std, Delta, Ref, Corr, Max, Min, Rank
+from benchmarks.indicators import YEAR_BARS, make_bars, same
+
+
+def factors() -> dict:
+    close, high, low = Feature("close"), Feature("high"), Feature("low")
+    ma = Mean(close, 20)
+    return dict(
+        momentum=Delta(close, 5) / Ref(close, 5),
+        zscore=(close - ma) / Std(close, 20),
+        trend=ma - Ref(ma, 1),
+        range=(Max(high, 20) - Min(low, 20)) / ma,
+        rank=Rank(close, 10),
+        corr=Corr(close, high - low, 20),
+    )
+
+
+def main() -> None:
+    n_bars = int(sys.argv[1]) if len(sys.argv) > 1 else YEAR_BARS
+    bars = make_bars(n_bars)
+    rows = list(zip(bars["close"].tolist(), bars["high"].tolist(), bars["low"].tolist()))
+    print(f"{n_bars} bars")
+
+    for name, expression in factors().items():
+        t0 = time.perf_counter()
+        got = expression.batch(bars)
+        batch_seconds = time.perf_counter() - t0
+
+        expression = expression.clone()
+        buffer = dict()
+        t0 = time.perf_counter()
+        expected = []
+        for close, high, low in rows:
+            buffer.update(close=close, high=high, low=low)
+            expected.append(expression.update(buffer))
+        update_seconds = time.perf_counter() - t0
+
+        print(f"{name:>10}: update {update_seconds:.3f}s, batch {batch_seconds:.3f}s")
+        if not same(expected, got):
+            raise AssertionError(f"batch {name} differs from update {name}")
+
+
+if __name__ == "__main__":
+    main()
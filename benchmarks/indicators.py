@@ -0,0 +1,131 @@
+"""
+Seconds to compute the indicators over a year of 1 minute bars.
+
+    python -m benchmarks.indicators [n_bars]
+
+`per bar` is the current way, one call per bar: `calc_macd`, `calc_rsi`
+and `calc_sar` over the bars kept by a `BarStore`, and `ema` of
+`A.indicator.base`. `stream` updates the indicators of
+`A.indicator.stream` once per bar, `batch` runs the kernels of
+`A.indicator.batch` over the arrays, and checks they give the `stream`
+values bit for bit.
+"""
+import sys
+import time
+
+import numpy as np
+
+from types import SimpleNamespace
+from typing import Callable
+
+from A.data import BarStore
+from A.indicator import base, stream, batch
+from A.types import KLine
+
+# 250 trading days of 240 1 minute bars
+YEAR_BARS = 250 * 240
+
+
+def make_bars(n_bars: int, seed: int = 7) -> dict[str, np.ndarray]:
+    """ a random walk of 1 minute bars """
+    rng = np.random.default_rng(seed)
+    close = np.round(4000 + np.cumsum(rng.normal(0, 1, n_bars)), 1)
+    return dict(
+        close=close,
+        high=close + np.round(rng.random(n_bars) * 2, 1),
+        low=close - np.round(rng.random(n_bars) * 2, 1),
+    )
+
+
+def timed(name: str, func: Callable, n_bars: int, repeat: int = 3):
+    """ the best of `repeat` runs """
+    elapsed = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ret = func()
+        elapsed = min(elapsed, time.perf_counter() - t0)
+    print(f"{name:>24}: {elapsed:8.3f}s, {n_bars / elapsed:>14,.0f} bars/sec")
+    return ret
+
+
+def same(a, b) -> bool:
+    return np.array_equal(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64), equal_nan=True)
+
+
+def per_bar(bars: dict[str, np.ndarray], n_bars: int) -> None:
+    try:
+        from A.indicator.indicator import calc_macd, calc_rsi, calc_sar
+    except ImportError as e:
+        print(f"{'per bar calc_*':>24}: skipped, {e}")
+        return
+
+    store = BarStore(capacity=n_bars)
+    af = SimpleNamespace(bar_data=store)
+    klines = [KLine(symbol_code="IF2202", interval=60, time=None, open=c, high=h, low=lo, close=c, volume=0)
+              for c, h, lo in zip(bars["close"].tolist(), bars["high"].tolist(), bars["low"].tolist())]
+
+    def rsi():
+        for bar in klines:
+            store.append(bar)
+            calc_rsi(af, "close", 14)
+
+    def macd():
+        for price in bars["close"].tolist():
+            calc_macd(price, 12, 26, 9)
+
+    def sar():
+        state = (0, 0.02, True, 0, 0)
+        sar_store = BarStore(capacity=n_bars)
+        sar_af = SimpleNamespace(bar_data=sar_store)
+        for bar in klines:
+            sar_store.append(bar)
+            state = calc_sar(sar_af, state[0], state[2], state[3], state[4], state[1])
+
+    timed("per bar calc_rsi", rsi, n_bars, repeat=1)
+    timed("per bar calc_macd", macd, n_bars, repeat=1)
+    timed("per bar calc_sar", sar, n_bars, repeat=1)
+
+
+def main() -> None:
+    n_bars = int(sys.argv[1]) if len(sys.argv) > 1 else YEAR_BARS
+    bars = make_bars(n_bars)
+    close, high, low = bars["close"], bars["high"], bars["low"]
+    closes, highs, lows = close.tolist(), high.tolist(), low.tolist()
+
+    print(f"{n_bars} bars")
+    per_bar(bars, n_bars)
+
+    def ema_per_bar():
+        last = closes[0]
+        for price in closes:
+            last = base.ema(price, 12, last)
+
+    timed("per bar ema", ema_per_bar, n_bars)
+
+    streams = dict(
+        ema=lambda: [ind.update(p) for ind in [stream.EMA(12)] for p in closes],
+        sma=lambda: [ind.update(p) for ind in [stream.SMA(20)] for p in closes],
+        bollinger=lambda: [ind.update(p) for ind in [stream.Bollinger(20)] for p in closes],
+        macd=lambda: [ind.update(p) for ind in [stream.MACD()] for p in closes],
+        rsi=lambda: [ind.update(p) for ind in [stream.RSI(14)] for p in closes],
+        atr=lambda: [ind.update(*v) for ind in [stream.ATR(14)] for v in zip(highs, lows, closes)],
+        sar=lambda: [ind.update(*v) for ind in [stream.SAR()] for v in zip(highs, lows, closes)],
+    )
+    batches = dict(
+        ema=lambda: batch.ema_array(close, 12),
+        sma=lambda: batch.sma_array(close, 20),
+        bollinger=lambda: np.column_stack(batch.bollinger_array(close, 20)),
+        macd=lambda: np.column_stack(batch.macd_array(close)),
+        rsi=lambda: batch.rsi_array(close, 14),
+        atr=lambda: batch.atr_array(high, low, close, 14),
+        sar=lambda: batch.sar_array(high, low, close),
+    )
+    for name in streams:
+        expected = timed(f"stream {name}", streams[name], n_bars)
+        got = timed(f"batch {name}", batches[name], n_bars)
+        if not same(expected, got):
+            raise AssertionError(f"batch {name} differs from stream {name}")
+
+
+if __name__ == "__main__":
+    main()
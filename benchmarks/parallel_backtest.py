@@ -0,0 +1,92 @@
+"""
+Wall seconds of a multi-day stock backtest, in one engine and over a process pool.
+
+    python -m benchmarks.parallel_backtest [n_days] [n_symbols] [processes]
+
+`sequential` replays the synthetic days in one `AF`, in process. `runner`
+replays one day per task of `A.runner.BacktestRunner` with 1 process and
+with `processes` (the number of cpus by default), the tasks sum is the
+seconds spent in the tasks, the rest of the wall time is the pool and the
+pickling of the results.
+"""
+import os
+import sys
+import time
+import tempfile
+
+import yaml
+
+from A import AF, AFOptional, AFMode, Market, StockStrategy, BacktestRunner
+from A.types import KLine
+from A.types.stock import Snapshot, OrderBook
+from benchmarks.synthetic import symbol_codes, write_tick_csv
+
+
+class CountStrategy(StockStrategy):
+    """ counts the events, its result is the counts of the day """
+
+    def __init__(self, symbols: list[str]) -> None:
+        super().__init__()
+        self.sub_symbol_code = symbols
+        self.bar_intervals = [60, 300]
+        self.counts = dict(snapshots=0, order_books=0, bars=0)
+
+    def on_snapshot(self, tick: Snapshot) -> None:
+        self.counts["snapshots"] += 1
+
+    def on_order_book(self, orderbook: OrderBook) -> None:
+        self.counts["order_books"] += 1
+
+    def on_bar(self, bar: KLine) -> None:
+        self.counts["bars"] += 1
+
+    def result(self) -> dict:
+        return self.counts
+
+
+def make_optional(config_path: str) -> AFOptional:
+    optional = AFOptional()
+    optional.run_mode = AFMode.BACKTESTING
+    optional.market = Market.STOCK
+    optional.config_path = config_path
+    optional.backtest_in_process = True
+    return optional
+
+
+def run(n_days: int, n_symbols: int, processes: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = os.path.join(tmp, "ticks")
+        os.makedirs(source_path)
+        for i in range(n_days):
+            write_tick_csv(os.path.join(source_path, f"202201{10 + i}.csv"), n_symbols, f"202201{10 + i}", seed=i)
+        config_path = os.path.join(tmp, "csv_config.yaml")
+        with open(config_path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(dict(source_path=source_path), f)
+        symbols = symbol_codes(n_symbols)
+        print(f"{n_days} days of {n_symbols} symbols, {os.cpu_count()} cpus")
+
+        strategy = CountStrategy(symbols)
+        af = AF(make_optional(config_path))
+        af.add_strategy(strategy)
+        t0 = time.perf_counter()
+        af.start()
+        print(f"{'sequential':>12}: {time.perf_counter() - t0:.2f}s, {strategy.counts}")
+
+        for n in sorted({1, processes}):
+            runner = BacktestRunner(make_optional(config_path), processes=n)
+            strategy = CountStrategy(symbols)
+            runner.add_strategy(strategy)
+            report = runner.run()
+            counts = {k: sum(result[k] for _, result in report.results(strategy)) for k in strategy.counts}
+            print(f"{f'runner x{n}':>12}: {report.seconds:.2f}s, tasks sum {report.cpu_seconds:.2f}s, {counts}")
+
+
+def main() -> None:
+    n_days = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    n_symbols = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    run(n_days, n_symbols, processes)
+
+
+if __name__ == "__main__":
+    main()
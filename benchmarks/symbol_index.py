@@ -0,0 +1,56 @@
+"""
+Seconds to replay one symbol of a full market day, with and without the symbol index.
+
+    python -m benchmarks.symbol_index [n_symbols]
+
+A synthetic day of `n_symbols` is replayed by `StockMD` into a counting
+sink with one symbol subscribed, parsed line by line and a chunk at a
+time, reading the whole file and reading the lines of the symbol only at
+their offsets, see `A.adapter.backtest.index`. `build` is the one time
+scan writing the index next to the file.
+"""
+import os
+import sys
+import time
+import tempfile
+
+from A.adapter.backtest.csv_md import StockMD
+from A.adapter.backtest.index import SymbolIndex
+from A.transport import DirectSink
+from benchmarks.synthetic import symbol_codes, write_tick_csv
+
+
+def run(n_symbols: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "20220110.csv")
+        lines = write_tick_csv(path, n_symbols)
+        print(f"{n_symbols} symbols, {lines} lines, {os.path.getsize(path) / 1e6:.0f} MB, 1 symbol subscribed")
+
+        t0 = time.perf_counter()
+        SymbolIndex.build(path).save(path)
+        print(f"{'build':>15}: {time.perf_counter() - t0:.2f}s")
+
+        subscribed = symbol_codes(n_symbols)[:1]
+        for name, kwargs in (
+                ("line", dict(vectorized=False)),
+                ("line, index", dict(vectorized=False, use_index=True)),
+                ("chunked", dict()),
+                ("chunked, index", dict(use_index=True)),
+        ):
+            counts = dict(events=0)
+
+            def count(event) -> None:
+                counts["events"] += 1
+
+            t0 = time.perf_counter()
+            StockMD(subscribed, path, DirectSink(count), **kwargs).start()
+            print(f"{name:>15}: {time.perf_counter() - t0:.3f}s, {counts['events']} events")
+
+
+def main() -> None:
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    run(n_symbols)
+
+
+if __name__ == "__main__":
+    main()
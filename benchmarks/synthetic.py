@@ -0,0 +1,146 @@
+"""
+Synthetic market data used by the benchmarks.
+
+A synthetic day is a 4 hour stock session (09:30-11:30, 13:00-15:00) with
+a tick every 3 seconds per symbol, which is what the exchange snapshot
+feed looks like for a liquid name.
+"""
+import random
+
+from datetime import datetime, timedelta
+
+from A.types import Event, EventType, StrategyType, datetime_to_ns, ns_to_datetime
+from A.types.stock import Snapshot
+
+TICK_INTERVAL = 3
+SESSIONS = (("093000", "113000"), ("130000", "150000"))
+
+
+def session_times(
+        trading_day: str = "20220110",
+        interval: int = TICK_INTERVAL
+) -> list[datetime]:
+    """
+    the tick times of a synthetic trading day
+
+    Args:
+        trading_day: the trading day, `%Y%m%d`
+        interval: seconds between two ticks of the same symbol
+
+    Returns:
+        list[datetime]: the tick times in ascending order
+    """
+    times = []
+    for start, end in SESSIONS:
+        t = datetime.strptime(trading_day + start, "%Y%m%d%H%M%S")
+        end_t = datetime.strptime(trading_day + end, "%Y%m%d%H%M%S")
+        while t < end_t:
+            times.append(t)
+            t += timedelta(seconds=interval)
+    return times
+
+
+def symbol_codes(n: int) -> list[str]:
+    return [f"{600000 + i}.SH" for i in range(n)]
+
+
+def make_snapshot_events(
+        n_symbols: int,
+        trading_day: str = "20220110",
+        seed: int = 0
+) -> list[Event]:
+    """
+    build the snapshot events of a synthetic day, interleaved by time like the exchange feed
+
+    Args:
+        n_symbols: the number of symbols
+        trading_day: the trading day, `%Y%m%d`
+        seed: random seed
+
+    Returns:
+        list[Event]: the snapshot events
+    """
+    rd = random.Random(seed)
+    codes = symbol_codes(n_symbols)
+    prices = {code: 10. for code in codes}
+    volumes = {code: 0 for code in codes}
+    turnovers = {code: .0 for code in codes}
+
+    events = []
+    for t in session_times(trading_day):
+        for code in codes:
+            price = round(max(prices[code] + rd.choice((-0.01, 0, 0.01)), 0.01), 2)
+            qty = rd.randint(0, 50) * 100
+            prices[code] = price
+            volumes[code] += qty
+            turnovers[code] += qty * price
+
+            snapshot = Snapshot()
+            snapshot.symbol_code = code
+            snapshot.data_time = datetime_to_ns(t)
+            snapshot.recv_time = snapshot.data_time
+            snapshot.pre_close_price = 10.
+            snapshot.open_price = 10.
+            snapshot.high_price = price
+            snapshot.low_price = price
+            snapshot.last_price = price
+            snapshot.trade_volume = qty
+            snapshot.trade_turnover = qty * price
+            snapshot.total_trade_volume = volumes[code]
+            snapshot.total_trade_turnover = turnovers[code]
+            snapshot.upper_limit_price = 11.
+            snapshot.lower_limit_price = 9.
+            snapshot.bid = [round(price - 0.01 * i, 2) for i in range(1, 11)]
+            snapshot.ask = [round(price + 0.01 * i, 2) for i in range(1, 11)]
+            snapshot.bid_qty = [1000] * 10
+            snapshot.ask_qty = [1000] * 10
+
+            event = Event()
+            event.data = snapshot
+            event.event_type = EventType.SNAPSHOT_DATA
+            event.ex_type = StrategyType.STOCK
+            events.append(event)
+
+    return events
+
+
+def write_tick_csv(
+        path: str,
+        n_symbols: int,
+        trading_day: str = "20220110",
+        seed: int = 0,
+        order_book_ratio: float = 0.2
+) -> int:
+    """
+    write a synthetic day in the `[tick]`/`[orderbook]` line format read by `StockMD`
+
+    Args:
+        path: the csv path
+        n_symbols: the number of symbols
+        trading_day: the trading day, `%Y%m%d`
+        seed: random seed
+        order_book_ratio: the share of ticks followed by an order book line
+
+    Returns:
+        int: the number of lines written
+    """
+    rd = random.Random(seed)
+    lines = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for event in make_snapshot_events(n_symbols, trading_day, seed):
+            s = event.data
+            t = ns_to_datetime(s.data_time).strftime("%Y%m%d%H%M%S") + "000"
+            levels = []
+            for i in range(10):
+                levels += [s.ask[i], s.ask_qty[i], s.bid[i], s.bid_qty[i]]
+            items = ["[tick]", trading_day, t[8:], s.symbol_code, t, s.pre_close_price, s.open_price,
+                     s.high_price, s.low_price, s.last_price, 0, s.total_trade_volume,
+                     round(s.total_trade_turnover, 2), s.upper_limit_price, s.lower_limit_price, *levels]
+            f.write(",".join(map(str, items)) + "\n")
+            lines += 1
+            if rd.random() < order_book_ratio:
+                items = ["[orderbook]", trading_day, t[8:], s.symbol_code, t, s.last_price, 100, 1000.0, 3,
+                         s.bid[0], 100, s.ask[0], 200, s.bid[1], 300, s.ask[1], 400]
+                f.write(",".join(map(str, items)) + "\n")
+                lines += 1
+    return lines
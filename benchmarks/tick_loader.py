@@ -0,0 +1,71 @@
+"""
+Ticks/sec of the line parser, of the chunked loader and of the tick store of the CSV backtest adapter.
+
+    python -m benchmarks.tick_loader [n_symbols]
+
+A synthetic day is replayed by `StockMD` into a counting sink on the same
+thread, once parsed line by line and once a chunk at a time by
+`A.adapter.backtest.loader`, with every symbol subscribed and with one
+symbol out of ten, and from the day converted into a `TickStore`.
+`loader` is the chunked parse into arrays alone and `store load` the
+reading of the same arrays from the memory mapped store, no snapshot is
+made.
+"""
+import os
+import sys
+import time
+import tempfile
+
+from A.adapter.backtest.csv_md import StockMD
+from A.adapter.backtest.loader import read_chunks
+from A.adapter.backtest.tickstore import TickStore
+from A.transport import DirectSink
+from benchmarks.synthetic import symbol_codes, write_tick_csv
+
+
+def best(
+        fn,
+        repeat: int = 3
+) -> float:
+    """ the best time of `repeat` calls """
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def run(n_symbols: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "20220110.csv")
+        write_tick_csv(path, n_symbols)
+        with open(path, encoding="utf-8") as f:
+            ticks = sum(line.startswith("[tick]") for line in f)
+        store = TickStore(os.path.join(tmp, "store"))
+        t0 = time.perf_counter()
+        store.convert(path)
+        print(f"converted into the tick store in {time.perf_counter() - t0:.2f}s")
+
+        codes = symbol_codes(n_symbols)
+        for subscribed in (codes, codes[::10]):
+            print(f"{len(subscribed)} of {n_symbols} symbols subscribed, {ticks} ticks in the file")
+            for name, fn in (
+                    ("line", lambda: StockMD(subscribed, path, DirectSink(lambda e: None), vectorized=False).start()),
+                    ("chunked", lambda: StockMD(subscribed, path, DirectSink(lambda e: None)).start()),
+                    ("loader", lambda: sum(len(t) for t, _ in read_chunks(path, subscribed) if t is not None)),
+                    ("store", lambda: StockMD(subscribed, path, DirectSink(lambda e: None), tick_store=store).start()),
+                    ("store load", lambda: sum(len(t) for t, _ in store.read_chunks("20220110", subscribed)
+                                               if t is not None)),
+            ):
+                elapsed = best(fn)
+                print(f"{name:>10}: {elapsed:.2f}s, {ticks / elapsed:,.0f} ticks/sec")
+
+
+def main() -> None:
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    run(n_symbols)
+
+
+if __name__ == "__main__":
+    main()
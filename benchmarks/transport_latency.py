@@ -0,0 +1,69 @@
+"""
+Tick-to-strategy latency of the adapter -> engine transports.
+
+    python -m benchmarks.transport_latency [n_events] [interval_us]
+
+The producer process stamps `Snapshot.recv_time` with `time.monotonic_ns()`
+right before `put`, the consumer measures the time until the decoded event
+is handed to the strategy callback. Events are paced by `interval_us` so
+the numbers are latency and not queueing delay.
+"""
+import sys
+import time
+
+from multiprocessing import Queue, Process
+
+from A.transport import BatchQueue, ShmRing, DONE
+from benchmarks.synthetic import make_snapshot_events
+
+
+def _producer(writer, n_events: int, interval_ns: int) -> None:
+    events = make_snapshot_events(max(1, n_events // 4800 + 1))[:n_events]
+    for event in events:
+        time.sleep(interval_ns / 1e9)
+        event.data.recv_time = time.monotonic_ns()
+        writer.put(event)
+    writer.put(DONE)
+
+
+def _consume(reader) -> list[int]:
+    latencies = []
+    while True:
+        batch = reader.get()
+        now = time.monotonic_ns()
+        for event in batch:
+            if event == DONE:
+                return latencies
+            latencies.append(now - event.data.recv_time)
+
+
+def _percentile(values: list[int], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] / 1000
+
+
+def run(name: str, writer, reader, n_events: int, interval_ns: int) -> None:
+    process = Process(target=_producer, args=(writer, n_events, interval_ns))
+    process.start()
+    latencies = _consume(reader)
+    process.join()
+    print(f"{name:>8}: {len(latencies)} events, "
+          f"p50 {_percentile(latencies, .5):.1f}us, p99 {_percentile(latencies, .99):.1f}us")
+
+
+def main() -> None:
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    interval_ns = int(sys.argv[2]) * 1000 if len(sys.argv) > 2 else 50_000
+
+    queue = Queue(65535)
+    run("queue", BatchQueue(queue, batch_size=1), queue, n_events, interval_ns)
+
+    ring = ShmRing(4096)
+    try:
+        run("shm_ring", ring, ring, n_events, interval_ns)
+    finally:
+        ring.close()
+
+
+if __name__ == "__main__":
+    main()